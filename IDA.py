@@ -1,20 +1,26 @@
 import logging
 import os
 # from src.auth import process_google_login, get_google_auth_url
-from src.db_manager import init_db, get_user_projects
+from src.db_manager import get_user_projects, init_all
 from src.components.context_gatherer import gather_context
 from src.components.content_analyzer import analyze_content
 from src.components.outline_generator import generate_outline
 from src.components.storyboard_generator import generate_storyboard
 from src.components.assessment_creator import create_final_assessment
-from src.openai_client import model_dict  # Import the model dictionary
+from src.components.project_search import show_project_search
+from src.openai_client import model_dict, response_cache, single_flight  # Import the model dictionary
+from src.telemetry import telemetry
+from src.util import reset_project_state
 import streamlit as st
 
+@st.cache_resource
+def init_database():
+    # Once per server process rather than on every rerun
+    init_all()
+
 def main():
     logging.basicConfig(level=logging.INFO)
-
-    # Initialize the database
-    # init_db()
+    init_database()
 
     st.session_state.setdefault("user_id", 'test_user')
     st.session_state.setdefault("user_name", 'test_name')
@@ -70,6 +76,15 @@ def main():
         # Display the selected model
         st.sidebar.write(f"**Selected Model:** {model_dict[st.session_state['selected_model']]}")
 
+        # Let long prompts go to a model with a bigger context window (and short ones to a cheaper model)
+        st.session_state["auto_route_models"] = st.sidebar.checkbox(
+            "Route to cheapest model that fits",
+            value=st.session_state.get("auto_route_models", False),
+            help="When off, source content that doesn't fit the selected model is trimmed."
+        )
+
+        render_usage_panel()
+
         page = st.sidebar.radio("Navigate", ["🛠 IDA Workflow", "📂 My Projects", "➕ Start New Project"])
         
         if page == "🛠 IDA Workflow":
@@ -84,6 +99,7 @@ def main():
             elif st.session_state.step == 5:
                 create_final_assessment()
         elif page == "📂 My Projects":
+            show_project_search()
             projects = get_user_projects(st.session_state['user_id'])
             st.write(f"You have {len(projects)} projects.")
             for p in projects:
@@ -95,15 +111,40 @@ def main():
             if st.button("Start Project"):
                 if new_title.strip():
                     # Reset session for a fresh workflow
+                    reset_project_state()
                     st.session_state.step = 1
-                    st.session_state.storyboard = None
-                    st.session_state.final_assessment = None
                     st.session_state.project_title = new_title.strip()
                     st.success(f"Started new project: {new_title}")
                     st.rerun()
                 else:
                     st.warning("Please provide a project title to continue.")
 
+def render_usage_panel():
+    # Sidebar summary of LLM latency and spend per workflow step (all sessions on this server)
+    with st.sidebar.expander("📊 LLM Usage"):
+        steps = telemetry.summary_by_step()
+        if not steps:
+            st.caption("No LLM calls recorded yet.")
+            return
+        cols = st.columns(2)
+        cols[0].metric("Calls", sum(row["calls"] for row in steps))
+        cols[1].metric("Spend", f"${sum(row['cost_usd'] for row in steps):.4f}")
+        cache_stats = response_cache.stats()
+        flight_stats = single_flight.stats()
+        st.caption(f"Cache hit rate: {cache_stats['hit_rate']:.0%} · Coalesced calls: {flight_stats['coalesced_calls']}")
+        st.dataframe(
+            [{
+                "Step": row["step"],
+                "Calls": row["calls"],
+                "Cache hits": row["cache_hits"],
+                "Tokens in/out": f"{row['prompt_tokens']:,}/{row['completion_tokens']:,}",
+                "Latency (s)": round(row["total_latency_s"], 1),
+                "Cost ($)": round(row["cost_usd"], 4),
+            } for row in steps],
+            hide_index=True,
+            use_container_width=True
+        )
+
 if __name__ == "__main__":
 
     main()
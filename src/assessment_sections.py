@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+from dataclasses import asdict
+
+from src.db_manager import (
+    get_bank_questions, get_bank_section_keys, record_question_use, save_bank_questions
+)
+from src.openai_client import budget_prompt, gather_openai_responses
+from src.prompts import build_section_assessment_prompt
+from src.retrieval import ground_source, tokenize
+from src.schemas import ASSESSMENT, AssessmentQuestion, parse_rows
+from src.storyboard_sections import duration_weights, parse_minutes, split_by_weight
+
+logging.basicConfig(level=logging.INFO)
+
+# --- CONFIGURATION ---
+# The final assessment is written one outline section at a time, concurrently, and every question
+# is kept in a per-user question bank. Re-running the step, or building a course with similar
+# sections, takes questions from the bank first and only asks the model for the shortfall.
+BANK_REUSE_DEFAULT = os.getenv("IDA_QUESTION_BANK_REUSE", "1") == "1"
+BANK_MATCH_THRESHOLD = float(os.getenv("IDA_QUESTION_BANK_MATCH", 0.6))
+SECTION_CONCURRENCY = int(os.getenv("IDA_ASSESSMENT_SECTION_CONCURRENCY", 6))
+SECTION_SOURCE_TOKENS = int(os.getenv("IDA_ASSESSMENT_SECTION_SOURCE_TOKENS", 4000))
+COMPLETION_TOKENS_PER_QUESTION = 400
+
+
+def section_key(title):
+    """Order-insensitive key of a section title's content words, e.g. "Safety basics" -> "basics safety"."""
+    return " ".join(sorted(set(tokenize(title))))
+
+
+def key_similarity(a, b):
+    words_a, words_b = set(a.split()), set(b.split())
+    if not words_a or not words_b:
+        return 1.0 if a == b else 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+def allocate_questions(outline_rows, num_questions):
+    """Questions per section, in proportion to the section durations; one per section if no count is given."""
+    if not num_questions or num_questions < 1:
+        num_questions = len(outline_rows)
+    return split_by_weight(num_questions, duration_weights([parse_minutes(row.duration_minutes) for row in outline_rows]))
+
+
+def to_question(record):
+    return AssessmentQuestion(record["stem"], record["options"], record["answer"],
+                              record["feedback"] or "", record["difficulty"] or "")
+
+
+def to_record(question):
+    return {"stem": question.question, "options": question.options, "answer": question.correct_option,
+            "feedback": question.feedback, "difficulty": question.difficulty}
+
+
+def banked_questions(user_id, titles, counts):
+    """
+    Up to counts[i] banked questions for each section, from the user's bank sections whose
+    titles are most similar to it. Returns (questions, ids) lists per section.
+    """
+    bank_keys = [key for key, _ in get_bank_section_keys(user_id)]
+    questions, ids, taken = [], [], set()
+    for title, count in zip(titles, counts):
+        key = section_key(title)
+        matches = sorted(
+            (k for k in bank_keys if key_similarity(key, k) >= BANK_MATCH_THRESHOLD),
+            key=lambda k: key_similarity(key, k), reverse=True
+        )
+        section_questions, section_ids = [], []
+        for match in matches:
+            if len(section_questions) >= count:
+                break
+            # Ask for enough to skip questions already given to an earlier, similar section
+            for record in get_bank_questions(user_id, match, count + len(taken)):
+                if record["id"] in taken or len(section_questions) >= count:
+                    continue
+                taken.add(record["id"])
+                section_questions.append(to_question(record))
+                section_ids.append(record["id"])
+        questions.append(section_questions)
+        ids.append(section_ids)
+    return questions, ids
+
+
+def generate_by_section(context_summary, content_outline, outline_rows, corpus, num_questions,
+                        user_id=None, reuse_bank=True, on_progress=None):
+    """
+    Builds the final assessment section by section. Banked questions are used first; the
+    remaining questions of every section are generated concurrently and added to the bank.
+    Returns (questions, sections, stats, warnings) with `sections` as (title, question_count).
+    `on_progress(done, total, questions_so_far)` is called as sections finish.
+    """
+    titles = [row.section for row in outline_rows]
+    counts = allocate_questions(outline_rows, num_questions)
+    if reuse_bank:
+        reused, reused_ids = banked_questions(user_id, titles, counts)
+    else:
+        reused, reused_ids = [[] for _ in titles], []
+    pending = [i for i, (count, banked) in enumerate(zip(counts, reused)) if count > len(banked)]
+
+    plans = []
+    for i in pending:
+        missing = counts[i] - len(reused[i])
+        source, _ = ground_source(corpus, f"{titles[i]} {context_summary}", SECTION_SOURCE_TOKENS)
+        build_prompt = lambda s, i=i, missing=missing: build_section_assessment_prompt(
+            context_summary, content_outline, titles[i], missing, s, [q.question for q in reused[i]]
+        )
+        plans.append(budget_prompt(build_prompt, source, COMPLETION_TOKENS_PER_QUESTION * (missing + 1)))
+
+    generated = {}
+    warnings = []
+
+    def current():
+        return [q for i, banked in enumerate(reused) for q in banked + generated.get(i, [])]
+
+    def on_result(index, response):
+        i = pending[index]
+        questions = parse_rows(response, ASSESSMENT)[:counts[i] - len(reused[i])] if isinstance(response, str) else []
+        generated[i] = questions
+        if questions:
+            # Banked straight away, so a later failure elsewhere does not lose them
+            save_bank_questions(user_id, titles[i], section_key(titles[i]), [to_record(q) for q in questions], largest.model)
+        if on_progress:
+            on_progress(len(generated), len(pending), current())
+
+    if plans:
+        # As in section-mode storyboards, the model chosen for the largest prompt fits them all
+        largest = max(plans, key=lambda plan: plan.prompt_tokens)
+        responses = gather_openai_responses(
+            [plan.prompt for plan in plans], max_completion_tokens=largest.max_completion_tokens,
+            concurrency=SECTION_CONCURRENCY, use_cache=False, return_exceptions=True, model=largest.model,
+            step="assessment_section", response_format=ASSESSMENT.response_format(), on_result=on_result
+        )
+        for i, response in zip(pending, responses):
+            if isinstance(response, Exception) or not generated.get(i):
+                logging.error(f"Assessment section '{titles[i]}' failed: {response}")
+                warnings.append(f"Questions for the section '{titles[i]}' could not be generated.")
+        trimmed_tokens = sum(plan.trimmed_tokens for plan in plans)
+        if trimmed_tokens:
+            warnings.append(f"The source content was too long for {largest.model}; about {trimmed_tokens:,} tokens were left out of the section prompts.")
+
+    record_question_use([i for section_ids in reused_ids for i in section_ids])
+    questions, sections = [], []
+    for i, title in enumerate(titles):
+        section_questions = reused[i] + generated.get(i, [])
+        questions.extend(section_questions)
+        if section_questions:
+            sections.append((title, len(section_questions)))
+    stats = {"reused": sum(len(banked) for banked in reused), "generated": sum(len(q) for q in generated.values())}
+    return questions, sections, stats, warnings
+
+
+def questions_json(questions):
+    """Questions as the {"rows": [...]} JSON the assessment schema describes."""
+    return json.dumps({"rows": [asdict(question) for question in questions]})
@@ -0,0 +1,294 @@
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+
+import httpx
+
+from src.llm_cache import ResponseCache, make_cache_key
+from src.prompts import (
+    SYSTEM_MESSAGE,
+    build_assessment_prompt,
+    build_outline_prompt,
+    build_storyboard_prompt,
+    combine_content,
+    estimate_questions_from_duration,
+    extract_num_questions,
+)
+from src.schemas import ASSESSMENT, OUTLINE, STORYBOARD, render_text
+from src.token_budget import plan_prompt
+
+logging.basicConfig(level=logging.INFO)
+
+# Offline course generation through the OpenAI Batch API.
+# A project is a JSON file with at least "context_summary" and "source_content"; the pipeline
+# fills in "content_outline", then "storyboard" and "final_assessment", and writes the updated
+# project to the output directory. Re-running the pipeline resumes any batch still in flight.
+
+# --- CONFIGURATION ---
+BATCH_ENDPOINT = "/v1/chat/completions"
+DEFAULT_MODEL = "gpt-4o-mini"
+POLL_INTERVAL_SECONDS = 60
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Project field each stage fills, the fields it needs, its completion budget and its output schema.
+# Responses are requested as schema-constrained JSON and stored in the project as readable text.
+STAGES = {
+    "outline": {"output": "content_outline", "requires": ["context_summary"], "max_completion_tokens": 3500,
+                "schema": OUTLINE},
+    "storyboard": {"output": "storyboard", "requires": ["context_summary", "content_outline"], "max_completion_tokens": 16384,
+                   "schema": STORYBOARD},
+    "assessment": {"output": "final_assessment", "requires": ["context_summary", "content_outline"], "max_completion_tokens": 4500,
+                   "schema": ASSESSMENT},
+}
+
+
+# --- PROMPT COMPILATION ---
+def build_stage_plan(project, stage, model):
+    """Builds the (budgeted) prompt for one project and stage with the same builders the UI uses."""
+    context_summary = project["context_summary"]
+    max_completion_tokens = STAGES[stage]["max_completion_tokens"]
+    source = combine_content(project.get("source_content", ""), project.get("generated_additional_content", ""))
+    if stage == "outline":
+        build_prompt = lambda s: build_outline_prompt(context_summary, s)
+    elif stage == "storyboard":
+        build_prompt = lambda s: build_storyboard_prompt(context_summary, project["content_outline"], s)
+    else:
+        num_questions = (project.get("num_questions") or extract_num_questions(context_summary)
+                         or estimate_questions_from_duration(context_summary) or 5)
+        build_prompt = lambda _: build_assessment_prompt(context_summary, project["content_outline"], num_questions)
+        source = ""
+    return plan_prompt(build_prompt, source, max_completion_tokens, model)
+
+
+def needs_stage(project, stage):
+    spec = STAGES[stage]
+    return not project.get(spec["output"]) and all(project.get(field) for field in spec["requires"])
+
+
+def compile_batch_requests(projects, stages, model):
+    """Returns Batch API request lines for every project that still needs one of `stages`."""
+    requests = []
+    for project in projects:
+        for stage in stages:
+            if not needs_stage(project, stage):
+                continue
+            plan = build_stage_plan(project, stage, model)
+            requests.append({
+                "custom_id": f"{project['project_id']}::{stage}",
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": plan.model,
+                    "messages": [
+                        {"role": "system", "content": SYSTEM_MESSAGE},
+                        {"role": "user", "content": plan.prompt},
+                    ],
+                    "max_completion_tokens": plan.max_completion_tokens,
+                    "response_format": STAGES[stage]["schema"].response_format(),
+                },
+            })
+    return requests
+
+
+def write_jsonl(lines, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def read_jsonl(text):
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+# --- BACKENDS ---
+class OpenAIBatchBackend:
+    """Submits request files to the OpenAI Batch API."""
+
+    def __init__(self, client=None):
+        import openai
+        self.client = client or openai.OpenAI()
+
+    def submit(self, input_path, metadata=None):
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+            metadata=metadata,
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(read_jsonl(self.client.files.content(file_id).text))
+        return lines
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the Batch API, for testing the pipeline offline.
+    Each batch gets a directory holding its input.jsonl and output.jsonl (in the Batch API output
+    format); requests are answered through an httpx transport, by default the mock LLM.
+    """
+
+    def __init__(self, work_dir="local_batches", transport=None):
+        if transport is None:
+            from src.mock_llm import MockLLMTransport
+            transport = MockLLMTransport(mode="synth", latency_s=0, tokens_per_second=0)
+        self.work_dir = work_dir
+        self.transport = transport
+
+    def _batch_dir(self, batch_id):
+        return os.path.join(self.work_dir, batch_id)
+
+    def submit(self, input_path, metadata=None):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        batch_dir = self._batch_dir(batch_id)
+        os.makedirs(batch_dir, exist_ok=True)
+        with open(input_path, encoding="utf-8") as f:
+            requests = read_jsonl(f.read())
+        write_jsonl(requests, os.path.join(batch_dir, "input.jsonl"))
+
+        outputs = []
+        with httpx.Client(transport=self.transport, base_url="https://api.openai.com") as client:
+            for request in requests:
+                response = client.post(request["url"], json=request["body"])
+                outputs.append({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": response.status_code, "body": response.json()},
+                    "error": None,
+                })
+        write_jsonl(outputs, os.path.join(batch_dir, "output.jsonl"))
+        return batch_id
+
+    def status(self, batch_id):
+        return "completed" if os.path.exists(os.path.join(self._batch_dir(batch_id), "output.jsonl")) else "in_progress"
+
+    def results(self, batch_id):
+        with open(os.path.join(self._batch_dir(batch_id), "output.jsonl"), encoding="utf-8") as f:
+            return read_jsonl(f.read())
+
+
+# --- INGESTION ---
+def ingest_results(projects_by_id, result_lines, requests_by_id, response_cache=None):
+    """Copies completed responses into project state; failures are kept under 'batch_errors'."""
+    completed = 0
+    for line in result_lines:
+        project_id, stage = line["custom_id"].split("::", 1)
+        project = projects_by_id.get(project_id)
+        if project is None:
+            continue
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            project.setdefault("batch_errors", {})[stage] = line.get("error") or response.get("body")
+            continue
+        text = response["body"]["choices"][0]["message"]["content"].strip()
+        project[STAGES[stage]["output"]] = render_text(STAGES[stage]["schema"], text)
+        project.get("batch_errors", {}).pop(stage, None)
+        completed += 1
+
+        # Prime the interactive response cache so opening the project in the app reuses this result
+        request = requests_by_id.get(line["custom_id"])
+        if response_cache is not None and request is not None:
+            body = request["body"]
+            key = make_cache_key(body["model"], SYSTEM_MESSAGE, body["messages"][-1]["content"], body["max_completion_tokens"], 1,
+                                 body.get("response_format"))
+            response_cache.set(key, body["model"], [text])
+    return completed
+
+
+# --- PIPELINE ---
+def load_projects(projects_dir, out_dir):
+    """Loads project files, preferring the partially completed copy in `out_dir` when there is one."""
+    projects = []
+    for name in sorted(os.listdir(projects_dir)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(out_dir, name)
+        if not os.path.exists(path):
+            path = os.path.join(projects_dir, name)
+        with open(path, encoding="utf-8") as f:
+            project = json.load(f)
+        project.setdefault("project_id", os.path.splitext(name)[0])
+        projects.append(project)
+    return projects
+
+
+def save_projects(projects, out_dir):
+    for project in projects:
+        with open(os.path.join(out_dir, f"{project['project_id']}.json"), "w", encoding="utf-8") as f:
+            json.dump(project, f, ensure_ascii=False, indent=2)
+
+
+def run_stage(projects, stages, backend, model, out_dir, poll_interval=POLL_INTERVAL_SECONDS, response_cache=None):
+    """Submits (or resumes) one batch covering `stages` and waits for its results."""
+    state_path = os.path.join(out_dir, f"batch_{'_'.join(stages)}.json")
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        logging.info(f"Resuming batch {state['batch_id']} for {', '.join(stages)}.")
+    else:
+        requests = compile_batch_requests(projects, stages, model)
+        if not requests:
+            logging.info(f"Nothing to generate for {', '.join(stages)}.")
+            return 0
+        input_path = os.path.join(out_dir, f"batch_{'_'.join(stages)}_input.jsonl")
+        write_jsonl(requests, input_path)
+        batch_id = backend.submit(input_path, metadata={"stages": ",".join(stages)})
+        state = {"batch_id": batch_id, "input_path": input_path}
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        logging.info(f"Submitted batch {batch_id} with {len(requests)} requests for {', '.join(stages)}.")
+
+    status = backend.status(state["batch_id"])
+    while status not in TERMINAL_STATUSES:
+        time.sleep(poll_interval)
+        status = backend.status(state["batch_id"])
+    logging.info(f"Batch {state['batch_id']} finished with status '{status}'.")
+
+    with open(state["input_path"], encoding="utf-8") as f:
+        requests_by_id = {r["custom_id"]: r for r in read_jsonl(f.read())}
+    completed = ingest_results(
+        {p["project_id"]: p for p in projects}, backend.results(state["batch_id"]), requests_by_id, response_cache
+    )
+    save_projects(projects, out_dir)
+    os.remove(state_path)
+    return completed
+
+
+def run_pipeline(projects_dir, out_dir, backend, model=DEFAULT_MODEL, poll_interval=POLL_INTERVAL_SECONDS,
+                 response_cache=None):
+    """Generates outlines, then storyboards and assessments, for every project in `projects_dir`."""
+    os.makedirs(out_dir, exist_ok=True)
+    projects = load_projects(projects_dir, out_dir)
+    run_stage(projects, ["outline"], backend, model, out_dir, poll_interval, response_cache)
+    run_stage(projects, ["storyboard", "assessment"], backend, model, out_dir, poll_interval, response_cache)
+    return projects
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate courses for many projects through the OpenAI Batch API.")
+    parser.add_argument("--projects", required=True, help="Directory of project JSON files.")
+    parser.add_argument("--out", required=True, help="Directory for completed projects and batch state.")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--poll-interval", type=int, default=POLL_INTERVAL_SECONDS)
+    parser.add_argument("--local", action="store_true", help="Use the local file-based stand-in instead of the Batch API.")
+    parser.add_argument("--no-cache", action="store_true", help="Don't copy results into the interactive response cache.")
+    args = parser.parse_args()
+
+    backend = LocalBatchBackend(os.path.join(args.out, "local_batches")) if args.local else OpenAIBatchBackend()
+    cache = None if args.no_cache else ResponseCache()
+    for project in run_pipeline(args.projects, args.out, backend, args.model, args.poll_interval, cache):
+        missing = [stage for stage, spec in STAGES.items() if not project.get(spec["output"])]
+        logging.info(f"{project['project_id']}: " + (f"missing {', '.join(missing)}" if missing else "complete"))
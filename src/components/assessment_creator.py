@@ -1,6 +1,14 @@
-import re
 import streamlit as st
-from src.openai_client import get_openai_response
+from src.assessment_sections import BANK_REUSE_DEFAULT, generate_by_section, questions_json
+from src.components.course_exports import show_course_exports
+from src.components.job_status import follow_job, run_as_job, show_job_error
+from src.components.project_search import index_session_project
+from src.db_manager import save_project, save_storyboard
+from src.exporters import DOCX_MIME, project_docx
+from src.job_runner import collect_stream
+from src.openai_client import stream_openai_response
+from src.prompts import build_assessment_prompt, estimate_questions_from_duration, extract_num_questions
+from src.schemas import ASSESSMENT, format_questions, parse_rows
 
 
 def create_final_assessment(context_summary = st.session_state.get("context_summary", ""), content_outline = st.session_state.get("content_outline", ""), num_questions = 5):
@@ -29,101 +37,110 @@ def create_final_assessment(context_summary = st.session_state.get("context_summ
         st.error("Missing context summary or content outline. Please complete earlier steps.")
         return
 
-    # Ask user if they want to generate the final assessment
-    with st.form("assessment_form"):
-        proceed = st.radio(
-            "Do you want to generate the final assessment?",
-            ("Yes, generate assessment", "No, finish here"),
-            index=0
-        )
-        submitted = st.form_submit_button("Continue")
-    
-    if not submitted:
-        st.stop()
-    
+    # The form is only needed until the assessment job has been started
+    if "assessment_job" not in st.session_state:
+        # Ask user if they want to generate the final assessment
+        with st.form("assessment_form"):
+            proceed = st.radio(
+                "Do you want to generate the final assessment?",
+                ("Yes, generate assessment", "No, finish here"),
+                index=0
+            )
+            reuse_bank = st.checkbox(
+                "Reuse questions from my question bank",
+                value=BANK_REUSE_DEFAULT,
+                help="Questions written for this or similar sections before are reused; only the missing ones are generated."
+            )
+            submitted = st.form_submit_button("Continue")
         
-    if proceed == "No, finish here":
-        st.success("🎉 Instructional design process completed successfully without final assessment.")
-        return
+        if not submitted:
+            st.stop()
+        
+            
+        if proceed == "No, finish here":
+            st.success("🎉 Instructional design process completed successfully without final assessment.")
+            return
 
-    
+        
 
-    num_questions = extract_num_questions(context_summary)
-    if not num_questions:
-        num_questions = estimate_questions_from_duration(context_summary)
+        outline_rows = st.session_state.get("outline_rows") or []
+        # Without a question count or a duration in the summary: one question per section, or 5
+        num_questions = (extract_num_questions(context_summary) or estimate_questions_from_duration(context_summary)
+                         or len(outline_rows) or 5)
+
+        if outline_rows:
+            # One request per outline section, run concurrently, topped up from the question bank
+            run_as_job("assessment_job", "assessment", section_assessment_job, context_summary, content_outline,
+                       outline_rows, st.session_state.get("corpus"), num_questions,
+                       st.session_state.get("user_id"), reuse_bank)
+        else:
+            prompt = build_assessment_prompt(context_summary, content_outline, num_questions)
+            run_as_job("assessment_job", "assessment", assessment_job, prompt)
+
+    # Show the questions as they are generated
+    st.markdown("### Final Assessment")
+    job = follow_job("assessment_job", render_partial=show_partial_assessment, label="Generating assessment questions...")
+    if job is None:
+        return
+    if job["status"] != "done":
+        show_job_error("assessment_job", job)
+        return
+    if st.button("🔁 Regenerate Assessment"):
+        # Back to the form; with the question bank on, a re-run reuses the questions just banked and tops them up
+        for key in ("assessment_job", "assessment_questions", "assessment_sections"):
+            st.session_state.pop(key, None)
+        st.rerun()
+    # Parsed once; older free-text responses are shown as they are
+    result = job["result"]
+    if isinstance(result, dict):
+        raw = result["assessment"]
+        st.session_state.assessment_sections = result["sections"]
+        if result["reused"]:
+            st.info(f"{result['reused']} of {result['reused'] + result['generated']} questions were reused from your question bank.")
+        for warning in result["warnings"]:
+            st.warning(warning)
+    else:
+        raw = result
+        st.session_state.assessment_sections = None
+    questions = parse_rows(raw, ASSESSMENT)
+    st.session_state.assessment_questions = questions
+    assessment = format_questions(questions) if questions else raw
+    st.text(assessment)
 
-    prompt = (
-        f"Based on the following instructional design context and content outline, generate a final assessment for this e-learning course.\n\n"
-        f"### Instructional Design Context:\n{context_summary}\n\n"
-        f"### Content Outline:\n{content_outline}\n\n"
-        f"Create {num_questions} multiple-choice questions.\n"
-        f"Each MCQ must have appropriate number of answer options, and should clearly indicate the correct option.\n"
-        f"Ensure questions align with the course objectives and learning content.\n"
-        f"Do not add any explanation text or headings before or after the questions."
-    )
-    with st.spinner("Generating final assessment..."):
-        assessment = get_openai_response(prompt, max_completion_tokens=4500)
+    if questions and st.session_state.get("storyboard"):
+        show_course_exports(st.session_state.storyboard, questions)
 
     if assessment:
-        st.markdown("### Final Assessment")
-        st.write(assessment)
-
         if st.button("💾 Save Project"):
             try:
-                from docx import Document
-                from docx.shared import Pt
-                from docx.oxml.ns import qn
-                from docx.oxml import OxmlElement
                 import os
-                import re
+                from datetime import datetime
 
                 # Create output folder
                 user_email = st.session_state.get("user_email", "unknown_user")
                 folder = f"saved_projects/{user_email}"
                 os.makedirs(folder, exist_ok=True)
 
-                # Create doc
-                doc = Document()
-                doc.add_heading("Storyboard", level=1)
-
-                # --- Storyboard Table ---
-                lines = st.session_state.storyboard.strip().split("\n")
-                headers = [h.strip() for h in lines[0].split("|") if h.strip()]
-                table = doc.add_table(rows=1, cols=len(headers))
-                table.style = 'Table Grid'
-
-                hdr_cells = table.rows[0].cells
-                for i, header in enumerate(headers):
-                    cell = hdr_cells[i]
-                    cell.text = header
-                    for p in cell.paragraphs:
-                        p.runs[0].bold = True
-
-                for line in lines[2:]:
-                    cols = [c.strip() for c in line.split("|") if c.strip()]
-                    if len(cols) == len(headers):
-                        row = table.add_row().cells
-                        for i, text in enumerate(cols):
-                            run = row[i].paragraphs[0].add_run(text)
-                            run.font.size = Pt(10)
-
-                doc.add_page_break()
-                doc.add_heading("Final Assessment", level=1)
-                doc.add_paragraph(assessment)
+                # Storyboard table and assessment in one document, built once per content
+                data = project_docx(st.session_state.get("storyboard") or [], assessment)
 
                 # Save file
-                from datetime import datetime
                 ts = datetime.now().strftime("%Y%m%d_%H%M%S")
                 filename = f"{folder}/{ts}_IDA_Project.docx"
-                doc.save(filename)
-                
-                from db_manager import save_project_metadata
-                save_project_metadata(user_email, st.session_state.get("project_title", "Untitled Project"), filename)
+                with open(filename, "wb") as f:
+                    f.write(data)
 
-                st.success("✅ Project saved successfully!")
+                project_title = st.session_state.get("project_title", "Untitled Project")
+                project_id = save_project(st.session_state.get("user_id"), project_title)
+                storyboard_id = save_storyboard(project_id, project_title, filename) if project_id is not None else None
+                if storyboard_id is None:
+                    st.error("❌ The Word file was written, but the project could not be recorded in your projects.")
+                else:
+                    # Makes the project's content findable from "My Projects"
+                    index_session_project(project_id, project_title)
+                    st.success("✅ Project saved successfully!")
 
-                with open(filename, "rb") as f:
-                    st.download_button("📥 Download Combined Word File", f, file_name="IDA_Project.docx")
+                st.download_button("📥 Download Combined Word File", data, file_name="IDA_Project.docx", mime=DOCX_MIME)
 
                 st.session_state.step = None
 
@@ -134,29 +151,26 @@ def create_final_assessment(context_summary = st.session_state.get("context_summ
     else:
         st.error("Failed to generate final assessment. Please retry.")
 
-def extract_num_questions(summary):
-    match = re.search(r"(\d+)\s*(questions|mcqs|multiple choice)", summary.lower())
-    if match:
-        return int(match.group(1))
-    return None
-
-def estimate_questions_from_duration(summary):
-    match = re.search(r"duration\s*[:\-]\s*(\d+)\s*(minutes|min|hours|hrs)", summary.lower())
-    if match:
-        duration = int(match.group(1))
-        return max(1, duration // 10)  # Estimate 1 question per 10 minutes
-        # unit = match.group(2)
-        # if "hour" in unit:
-        #     duration = duration * 60
-        # if duration < 30:
-        #     return 5
-        # elif duration < 60:
-        #     return 8
-        # elif duration < 120:
-        #     return 12
-        # else:
-        #     return 15
-    return None
+def assessment_job(job, prompt):
+    return collect_stream(job, stream_openai_response(prompt, max_completion_tokens=4500, step="assessment",
+                                                      response_format=ASSESSMENT.response_format()))
+
+def section_assessment_job(job, context_summary, content_outline, outline_rows, corpus, num_questions, user_id, reuse_bank):
+    def on_progress(done, total, questions):
+        job.progress(done / total, f"Generated questions for {done} of {total} sections...")
+        job.partial(questions_json(questions))
+
+    job.progress(0.0, f"Writing questions for {len(outline_rows)} sections in parallel...")
+    questions, sections, stats, warnings = generate_by_section(
+        context_summary, content_outline, outline_rows, corpus, num_questions, user_id, reuse_bank, on_progress
+    )
+    return {"assessment": questions_json(questions), "sections": sections, "warnings": warnings, **stats}
+
+def show_partial_assessment(text):
+    # Only questions whose JSON object is complete are shown
+    questions = parse_rows(text, ASSESSMENT)
+    if questions:
+        st.text(format_questions(questions))
 
 def generate_assessment(context_summary, content_outline):
     num_questions = extract_num_questions(context_summary)
@@ -1,6 +1,11 @@
 import streamlit as st
 
-from src.openai_client import get_openai_response
+from src.components.job_status import follow_job, run_as_job, show_job_error
+from src.extraction import extract_uploaded_files
+from src.gap_analysis import analyze_gaps
+from src.job_runner import collect_stream
+from src.openai_client import stream_openai_response
+from src.prompts import build_content_fill_prompt
 
 def analyze_content():
     st.header("Step 2: Analyze Raw Content")
@@ -12,60 +17,52 @@ def analyze_content():
     )
 
     if uploaded_files:
-        raw_text = ""
+        # Sources added through "Provide additional sources" are analyzed after the main uploads
+        uploaded_files = uploaded_files + st.session_state.get("additional_sources", [])
+        progress = st.empty()
+
+        def show_progress(done, total, file_name):
+            progress.progress(done / total, text=f"Read {file_name} ({done}/{total} files)")
+
         try:
-            for uploaded_file in uploaded_files:
-                if uploaded_file.type == "application/pdf":
-                    from PyPDF2 import PdfReader
-                    reader = PdfReader(uploaded_file)
-                    for page in reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            raw_text += page_text + "\n"
-                elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                    import docx
-                    doc = docx.Document(uploaded_file)
-                    for para in doc.paragraphs:
-                        raw_text += para.text + "\n"
-                elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.presentationml.presentation":
-                    from pptx import Presentation
-                    prs = Presentation(uploaded_file)
-                    for slide in prs.slides:
-                        for shape in slide.shapes:
-                            if hasattr(shape, "text"):
-                                raw_text += shape.text + "\n"
-                elif uploaded_file.type in [
-                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    "application/vnd.ms-excel"
-                ]:
-                    import pandas as pd
-                    xls = pd.ExcelFile(uploaded_file)
-                    for sheet_name in xls.sheet_names:
-                        df = pd.read_excel(uploaded_file, sheet_name=sheet_name)
-                        raw_text += f"\n--- Sheet: {sheet_name} ---\n"
-                        raw_text += df.to_string(index=False) + "\n"
-                elif uploaded_file.type == "text/plain":
-                    raw_text += uploaded_file.getvalue().decode("utf-8") + "\n"
+            # Parsed text is cached per file content, so reruns only parse new or changed files
+            source_keys, corpus, read_errors = extract_uploaded_files(
+                uploaded_files, on_progress=show_progress, base=st.session_state.get("extracted")
+            )
         except Exception as e:
             st.error(f"Error reading uploaded file: {e}")
             return
+        progress.empty()
+        st.session_state.extracted = (source_keys, corpus)
+        for error in read_errors:
+            st.warning(error)
+        if corpus.normalizer is not None and corpus.normalizer.saved_tokens > 0:
+            show_boilerplate(corpus.normalizer.report())
+        if corpus.block_filter is not None and corpus.block_filter.removed_blocks:
+            show_duplicates(corpus.block_filter.report())
 
-        if "analysis_done" not in st.session_state or st.session_state.raw_text != raw_text:
-            st.session_state.raw_text = raw_text
+        if st.session_state.get("source_keys") != source_keys:
+            st.session_state.source_keys = source_keys
+            # Keep the corpus (spooled to disk when large) rather than the whole text in the session
+            st.session_state.corpus = corpus
+            for key in ("analysis_done", "gap_job", "fill_job"):
+                st.session_state.pop(key, None)
+
+        if "analysis_done" not in st.session_state:
             context_summary = st.session_state.get("context_summary", "No context summary available.")
-            prompt = (
-                f"Analyze the following instructional design context and raw content to identify content gaps.\n\n"
-                f"Here is the instructional design context:\n{context_summary}\n\n"
-                f"Here is the raw content:\n{raw_text}\n\n"
-                f"Identify any content gaps in the raw content based on the provided context. Don't make it very elaborate and focus on the duration indicated by the user in {context_summary}. "
-                f"List the missing topics or areas that need to be covered in the course."
-            )
-            with st.spinner("Analyzing content gaps..."):
-                analysis = get_openai_response(prompt)
-                st.session_state.analysis = analysis
-                st.session_state.analysis_done = True
-                st.session_state.uploaded_content = raw_text
+            # Runs in the background so reruns (widget clicks) neither block on nor restart it
+            run_as_job("gap_job", "gap_analysis", gap_analysis_job, context_summary, corpus)
+            job = follow_job("gap_job", label="Analyzing content gaps...")
+            if job is None:
+                return
+            if job["status"] != "done":
+                show_job_error("gap_job", job)
+                return
+            st.session_state.analysis, st.session_state.analysis_warning = job["result"]
+            st.session_state.analysis_done = True
 
+        if st.session_state.get("analysis_warning"):
+            st.warning(st.session_state.analysis_warning)
         st.subheader("Content Gap Analysis")
         st.write(st.session_state.analysis)
 
@@ -76,20 +73,21 @@ def analyze_content():
         )
 
         if decision == "Generate content to fill gaps":
-            filled_prompt = (
-                f"Based on the identified content gaps below, generate the necessary content to fill these gaps.\n\n"
-                f"**Content Gaps:**\n{st.session_state.analysis}\n\n"
-                f"Provide the additional content required to cover these areas effectively."
-            )
-            with st.spinner("Generating additional content..."):
-                filled_content = get_openai_response(filled_prompt)
-                if filled_content:
-                    st.session_state.filled_content = filled_content
-                    st.session_state.generated_additional_content = filled_content
-                    st.success("Content gaps have been filled with generated material.")
-                    if st.button("Continue to Step 3"):
-                        st.session_state.step = 3
-                        st.rerun()
+            filled_prompt = build_content_fill_prompt(st.session_state.analysis)
+            # Show the generated content as it is written so the designer can start reading immediately
+            run_as_job("fill_job", "content_fill", content_fill_job, filled_prompt)
+            job = follow_job("fill_job", render_partial=st.markdown, label="Generating content to fill the gaps...")
+            if job is not None and job["status"] != "done":
+                show_job_error("fill_job", job)
+            filled_content = job["result"] if job is not None else None
+            if filled_content:
+                st.markdown(filled_content)
+                st.session_state.filled_content = filled_content
+                st.session_state.generated_additional_content = filled_content
+                st.success("Content gaps have been filled with generated material.")
+                if st.button("Continue to Step 3"):
+                    st.session_state.step = 3
+                    st.rerun()
 
         elif decision == "Provide additional sources":
             more_files = st.file_uploader(
@@ -99,9 +97,9 @@ def analyze_content():
                 key="more_sources"
             )
             if more_files:
-                uploaded_files.extend(more_files)
                 st.warning("Please click the 'Analyze Again' button below to include the new files.")
                 if st.button("Analyze Again"):
+                    st.session_state.additional_sources = more_files
                     st.rerun()
 
         elif decision == "No action needed":
@@ -111,6 +109,30 @@ def analyze_content():
     else:
         st.info("Please upload at least one raw content file to begin analysis.")
 
+def gap_analysis_job(job, context_summary, corpus):
+    # Large sources are reviewed in parts concurrently and the results merged
+    return analyze_gaps(context_summary, corpus, on_status=lambda message: job.progress(message=message))
+
+def content_fill_job(job, prompt):
+    return collect_stream(job, stream_openai_response(prompt, step="content_fill"))
+
+def show_boilerplate(report):
+    # Running headers/footers, page numbers and stray whitespace are removed before analysis
+    with st.expander(f"Removed repeated headers, footers and page numbers (about {report['saved_tokens']:,} tokens)"):
+        st.caption(f"{report['removed_lines']:,} lines removed. Most common:")
+        for line in report["boilerplate"]:
+            st.text(line)
+
+def show_duplicates(report):
+    # Near-duplicate passages found in more than one uploaded file are only sent to the model once
+    with st.expander(f"Skipped {report['removed_blocks']} duplicate passages (about {report['removed_tokens']:,} tokens)"):
+        st.dataframe(
+            [{"Duplicate in": f"{source}, {locator}", "Kept from": f"{kept_source}, {kept_locator}"}
+             for source, locator, kept_source, kept_locator in report["matches"]],
+            hide_index=True,
+            use_container_width=True
+        )
+
 def provide_feedback(analysis):
     feedback_message = "Analysis Results:\n"
     if analysis["content_gaps"]:
@@ -58,7 +58,7 @@ def gather_context():
                         f"Conversation History:\n{st.session_state.conversation_history}\n\n"
                         "What is the next question?"
                     )
-                    follow_up_question = get_openai_response(follow_up_prompt)
+                    follow_up_question = get_openai_response(follow_up_prompt, step="context_followup")
                     st.session_state.current_question = follow_up_question.strip()
                     st.session_state.conversation_history.append({"role": "assistant", "content": st.session_state.current_question})
                 # Clear the input box after submission
@@ -76,7 +76,7 @@ def gather_context():
             f"Context:\n{st.session_state.context}"
         )
         with st.spinner("Summarizing context..."):
-            summary_result = get_openai_response(summary_prompt)
+            summary_result = get_openai_response(summary_prompt, step="context_summary")
             st.session_state.context_summary = summary_result
             st.session_state.context_summary_persisted = summary_result
 
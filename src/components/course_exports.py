@@ -0,0 +1,33 @@
+import streamlit as st
+
+from src.components.job_status import follow_job, run_as_job, show_job_error
+from src.exporters import PPTX_MIME, ZIP_MIME, build_course_exports, content_hash
+
+
+def show_course_exports(rows, questions=None):
+    # Slide deck and SCORM package, built in the background and reused until the content changes
+    title = st.session_state.get("project_title") or "Course"
+    sections = st.session_state.get("storyboard_sections")
+    key = content_hash("course_exports", rows, questions or [], title, sections or [])
+    if st.session_state.get("course_exports_key") != key:
+        st.session_state.course_exports_key = key
+        st.session_state.pop("course_exports_job", None)
+
+    if "course_exports_job" not in st.session_state:
+        label = "🗂️ Build slide deck and SCORM package" + ("" if questions else " (without assessment)")
+        if st.button(label):
+            run_as_job("course_exports_job", "course_exports", build_course_exports, rows, questions, title, sections, key[:16])
+            st.rerun()
+        return
+
+    job = follow_job("course_exports_job", label="Building slide deck and SCORM package...")
+    if job is None:
+        return
+    if job["status"] != "done":
+        show_job_error("course_exports_job", job)
+        return
+    paths = job["result"]
+    with open(paths["pptx"], "rb") as f:
+        st.download_button("📊 Download slide deck (PPTX)", f, file_name="Storyboard.pptx", mime=PPTX_MIME)
+    with open(paths["scorm"], "rb") as f:
+        st.download_button("📦 Download SCORM 1.2 package", f, file_name="Course_SCORM.zip", mime=ZIP_MIME)
@@ -0,0 +1,50 @@
+import streamlit as st
+
+from src.job_runner import FINISHED_STATUSES, POLL_SECONDS, job_runner
+
+
+def run_as_job(state_key, kind, fn, *args, **kwargs):
+    """
+    Starts `fn` as a background job unless one is already tracked under
+    `st.session_state[state_key]`, and returns the job id.
+    """
+    job_id = st.session_state.get(state_key)
+    if job_id is None:
+        job_id = job_runner.submit(kind, fn, *args, user_id=st.session_state.get("user_id"), **kwargs)
+        st.session_state[state_key] = job_id
+    return job_id
+
+
+def follow_job(state_key, render_partial=None, label="Working..."):
+    """
+    Polls the job tracked under `st.session_state[state_key]` and shows its progress (and
+    partial result, through `render_partial`) without blocking the page. Returns the finished
+    job once it is done, failed or interrupted, otherwise None; the page is rerun when it finishes.
+    """
+    job_id = st.session_state.get(state_key)
+    job = job_runner.get(job_id) if job_id else None
+    if job is None or job["status"] in FINISHED_STATUSES:
+        return job
+
+    @st.fragment(run_every=POLL_SECONDS)
+    def poll():
+        job = job_runner.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            st.rerun()
+        st.progress(job["progress"], text=job["message"] or label)
+        if render_partial and job["partial_result"]:
+            render_partial(job["partial_result"])
+
+    poll()
+    return None
+
+
+def show_job_error(state_key, job):
+    # Clears the job so the step can be retried
+    if job["status"] == "interrupted":
+        st.error("This step was interrupted by a server restart. Please run it again.")
+    else:
+        st.error(f"This step failed: {job['error']}")
+    if st.button("🔁 Retry", key=f"retry_{state_key}"):
+        del st.session_state[state_key]
+        st.rerun()
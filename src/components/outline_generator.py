@@ -1,64 +1,47 @@
 import streamlit as st
-from src.openai_client import get_openai_response
+from src.openai_client import budget_prompt, get_openai_response
+from src.prompts import build_outline_prompt
+from src.retrieval import OUTLINE_SOURCE_TOKENS, ground_source
+from src.schemas import OUTLINE, parse_rows, to_frame, to_table_text
 
 
 def generate_outline( ):
     st.header("Step 3: Generate Content Outline")
     context_summary = st.session_state.get("context_summary_persisted", "")
     analysis = st.session_state.get("analysis", "")
-    uploaded_content = st.session_state.get("uploaded_content", "")
+    corpus = st.session_state.get("corpus")
     generated_content = st.session_state.get("generated_additional_content", "")
 
     if not context_summary:
         st.error("Context summary not available. Please complete Step 1.")
         return
 
-    if not uploaded_content and not generated_content:
+    if not corpus and not generated_content:
         st.error("No content available. Please upload content or choose to generate content in Step 2.")
         return
 
-    combined_content = uploaded_content.strip()
-    if generated_content:
-        combined_content += f"\n\n{generated_content.strip()}"
-
     if not st.session_state.get("content_outline"):
-        prompt = (
-            f"Based on the following instructional design context and source content, generate a structured content outline. Make sure that the duration indicated by the user in context_summary_persisted is adhered to when the duration in the outline is generated "
-            f"for the e-learning course.\n\n"
-            f"### Instructional Design Context:\n{context_summary}\n\n"
-            f"### Source Content:\n{combined_content}\n\n"
-            f"Present the content outline **strictly** as a table with two columns: Outline | Duration (in mins). Use pipe separators (|) and include a header row. Do not use bullets, dashes, or markdown separators.\n"
-            f"Start immediately with the table header. Separate columns using a '|' (pipe symbol).\n"
-            f"Do not add bullets or explanations before or after the table."
-        )
+        build_prompt = lambda source: build_outline_prompt(context_summary, source)
+        # Large uploads are narrowed to the passages most relevant to the course context
+        source, grounding = ground_source(corpus, context_summary, OUTLINE_SOURCE_TOKENS)
+        if grounding:
+            st.caption(grounding)
+        plan = budget_prompt(build_prompt, source, generated_content=generated_content)
+        if plan.trimmed_tokens:
+            st.warning(f"The source content is too long for {plan.model}; about {plan.trimmed_tokens:,} tokens were left out of the outline prompt.")
         with st.spinner("Generating content outline..."):
-            outline = get_openai_response(prompt)
+            outline = get_openai_response(plan.prompt, plan.max_completion_tokens, model=plan.model,
+                                          response_format=OUTLINE.response_format())
             if outline:
-                st.session_state.content_outline = outline
+                # Parsed once; later prompts quote the outline as a compact table
+                rows = parse_rows(outline, OUTLINE)
+                st.session_state.outline_rows = rows
+                st.session_state.content_outline = to_table_text(rows, OUTLINE) if rows else outline
 
     if "content_outline" in st.session_state:
         st.subheader("Generated Content Outline")
-        try:
-            import pandas as pd
-            import io
-            df = pd.read_csv(io.StringIO(st.session_state.content_outline), sep="|")
-
-            # Clean headers
-            df.columns = [col.strip() for col in df.columns]
-
-            # Drop any unnamed/empty columns
-            df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
-
-            # Reset index to remove auto-numbering from display
-            df = df.reset_index(drop=True)
-            
-            # Retain only the last two columns (in case extra sneaked in)
-            if df.shape[1] > 2:
-                df = df.iloc[:, -2:]
-
-            # Rename headers to exactly what we want
-            df.columns = ["Outline", "Duration (in mins)"]
-
+        rows = st.session_state.get("outline_rows")
+        if rows:
             # Wrap long text inside cells
             st.markdown(
                 """
@@ -73,9 +56,9 @@ def generate_outline( ):
             )
 
             # Display the table without index
-            st.dataframe(df, use_container_width=True)
+            st.dataframe(to_frame(rows, OUTLINE), use_container_width=True, hide_index=True)
 
-        except Exception as e:
+        else:
             st.error("Could not parse outline as table. Showing raw text.")
             st.code(st.session_state.content_outline)
 
@@ -0,0 +1,50 @@
+import streamlit as st
+
+from src.db_manager import index_project_content, search_content, search_question_bank
+from src.storyboard_edits import section_of
+
+KIND_LABELS = {
+    "context": "Context summary",
+    "outline": "Outline section",
+    "storyboard": "Storyboard row",
+    "question": "Assessment question",
+}
+
+
+def index_session_project(project_id, project_title):
+    """Indexes the context summary, outline, storyboard and assessment of the current session under a saved project."""
+    entries = []
+    context_summary = st.session_state.get("context_summary_persisted", "")
+    if context_summary:
+        entries.append(("context", 0, "", context_summary))
+    for i, row in enumerate(st.session_state.get("outline_rows") or []):
+        entries.append(("outline", i, row.section, f"{row.section} ({row.duration_minutes} mins)"))
+    sections = st.session_state.get("storyboard_sections")
+    for i, row in enumerate(st.session_state.get("storyboard") or []):
+        body = "\n".join((row.onscreen_text, row.voice_over_script, row.visualization_guidelines))
+        entries.append(("storyboard", i, section_of(sections, i), body))
+    question_sections = st.session_state.get("assessment_sections")
+    for i, question in enumerate(st.session_state.get("assessment_questions") or []):
+        body = "\n".join([question.question] + question.options + [question.feedback])
+        entries.append(("question", i, section_of(question_sections, i), body))
+    index_project_content(project_id, st.session_state.get("user_id"), project_title, entries)
+
+
+def show_project_search():
+    query = st.text_input("🔍 Search your projects", placeholder="e.g. fire extinguisher, onboarding, GDPR")
+    if not query.strip():
+        return
+    results = search_content(st.session_state.get("user_id"), query)
+    questions = search_question_bank(st.session_state.get("user_id"), query)
+    if not results and not questions:
+        st.info("No saved content matches your search.")
+        return
+    for result in results:
+        where = " · ".join(part for part in (result["project_title"], result["section"]) if part)
+        label = KIND_LABELS.get(result["kind"], result["kind"])
+        number = f" {result['position'] + 1}" if result["kind"] in ("storyboard", "question") else ""
+        st.markdown(f"**{label}{number}** — {where}  \n{result['snippet']}")
+    if questions:
+        with st.expander(f"{len(questions)} matching questions in your question bank"):
+            for question in questions:
+                st.markdown(f"**{question['stem']}**  \n_{question['section']}_ · correct answer: {question['answer']}")
@@ -1,8 +1,15 @@
-from datetime import datetime
 import streamlit as st
-import pandas as pd
 
-from src.openai_client import get_openai_response
+from src.components.course_exports import show_course_exports
+from src.components.job_status import follow_job, run_as_job, show_job_error
+from src.exporters import DOCX_MIME, storyboard_docx
+from src.job_runner import collect_stream
+from src.openai_client import budget_prompt, stream_openai_response
+from src.prompts import build_storyboard_prompt
+from src.retrieval import STORYBOARD_SOURCE_TOKENS, ground_sections, outline_sections
+from src.schemas import STORYBOARD, parse_rows, to_frame
+from src.storyboard_edits import push_version, revise_rows, section_bounds
+from src.storyboard_sections import SECTION_PARALLEL_DEFAULT, generate_by_section, rows_json
 
 def generate_storyboard():
     # if not context_summary or not content_outline:
@@ -28,72 +35,89 @@ def generate_storyboard():
     st.header("Step 4: Generate Storyboard")
     context_summary = st.session_state.get("context_summary_persisted", "")
     content_outline = st.session_state.get("content_outline", "")
-    uploaded_content = st.session_state.get("uploaded_content", "")
+    corpus = st.session_state.get("corpus")
     generated_content = st.session_state.get("generated_additional_content", "")
 
     if not content_outline:
         st.error("No content outline found. Please complete Step 3 before proceeding.")
         return
 
-    combined_content = uploaded_content.strip()
-    if generated_content:
-        combined_content += f"\n\n{generated_content.strip()}"
-
-    if st.button("🔁 Regenerate Storyboard"):
+    regenerate = st.button("🔁 Regenerate Storyboard")
+    if regenerate:
+        if st.session_state.get("storyboard"):
+            # The discarded storyboard can still be restored with "Undo"
+            push_version(st.session_state.setdefault("storyboard_history", []), "Before full regeneration",
+                         st.session_state.storyboard, st.session_state.get("storyboard_sections"))
         st.session_state.storyboard = None  # Reset
+        st.session_state.pop("storyboard_job", None)
                         
-    if not st.session_state.get("storyboard"):
-        prompt = (
-            f"Create a storyboard that follows instructional design theories, for the e-learning course based on the following instructional design context, content outline, and source content.\n\n"
-            f"### Instructional Design Context:\n{context_summary}\n\n"
-            f"### Content Outline:\n{content_outline}\n\n"
-            f"### Source Content:\n{combined_content}\n\n"
-            f"Provide the storyboard as a table with three columns: Onscreen Text | Voice Over Script | Visualization Guidelines.\n"
-            f"Start immediately with the table header. Separate columns using a '|' (pipe symbol).\n"
-            f"Make sure that the Onscreen text column contains the entire text we want to include in the slide, not just slide titles. In the Voice over script column, include the entire narrative voice over script, not just an introduction.\n"
-            f"Let knowledge checks not be too many. Also when knowledge checks are used include all the details - the question, the answer options, the correct answer and also correct and wrong answer feedback. \n"
-            f"Do not add any explanation before or after the table. Each row must be properly formatted without bullets or other formatting."
-        )
+    outline_rows = st.session_state.get("outline_rows") or []
+    section_mode = len(outline_rows) > 1 and st.checkbox(
+        "Generate sections in parallel", value=SECTION_PARALLEL_DEFAULT,
+        help="Storyboard each outline section in its own request, all at once. Faster for long courses, and no section is cut short."
+    )
 
-        with st.spinner("Generating storyboard. This may take a while..."):
-            storyboard = get_openai_response(prompt, max_completion_tokens=16384)
-            if storyboard:
-                st.session_state.storyboard = storyboard
+    if not st.session_state.get("storyboard"):
+        if "storyboard_job" not in st.session_state and section_mode:
+            st.session_state.storyboard_grounding = None
+            st.session_state.storyboard_trimmed = (None, 0)
+            run_as_job("storyboard_job", "storyboard", section_storyboard_job, context_summary, content_outline,
+                       outline_rows, corpus, generated_content, not regenerate)
+        elif "storyboard_job" not in st.session_state:
+            build_prompt = lambda source: build_storyboard_prompt(context_summary, content_outline, source)
+            # Ground each outline section on its most relevant passages instead of the whole upload
+            source, grounding = ground_sections(corpus, outline_sections(content_outline), context_summary, STORYBOARD_SOURCE_TOKENS)
+            plan = budget_prompt(build_prompt, source, max_completion_tokens=16384, generated_content=generated_content)
+            st.session_state.storyboard_grounding = grounding
+            st.session_state.storyboard_trimmed = (plan.model, plan.trimmed_tokens)
+            # Generated in the background; skip the response cache when the user explicitly asked for a fresh storyboard
+            run_as_job("storyboard_job", "storyboard", storyboard_job, plan.prompt, plan.max_completion_tokens, not regenerate, plan.model)
+
+        if st.session_state.get("storyboard_grounding"):
+            st.caption(st.session_state.storyboard_grounding)
+        model, trimmed_tokens = st.session_state.get("storyboard_trimmed", (None, 0))
+        if trimmed_tokens:
+            st.warning(f"The source content is too long for {model}; about {trimmed_tokens:,} tokens were left out of the storyboard prompt.")
+
+        # Render each table row as soon as it is complete
+        job = follow_job("storyboard_job", render_partial=show_partial_storyboard,
+                         label="Generating storyboard. Rows will appear below as they are written...")
+        if job is None:
+            return
+        if job["status"] != "done":
+            show_job_error("storyboard_job", job)
+            return
+        # Parsed once here; the viewer and the Word export work from the rows
+        result = job["result"]
+        if isinstance(result, dict):
+            set_storyboard_version(parse_rows(result["storyboard"], STORYBOARD), result["sections"])
+            st.session_state.storyboard_warnings = result["warnings"]
+        else:
+            set_storyboard_version(parse_rows(result, STORYBOARD), None)
+            st.session_state.storyboard_warnings = []
 
-    storyboard_text = st.session_state.get("storyboard", "")
+    rows = st.session_state.get("storyboard")
 
-    if storyboard_text:
+    if rows:
         st.subheader("Generated Storyboard")
-        import io
-        import pandas as pd
-        try:
-            df = pd.read_csv(io.StringIO(st.session_state.storyboard), sep="|")
-            df.columns = [col.strip() for col in df.columns]
-            df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
-            df = df.reset_index(drop=True)
-
-            if df.shape[1] > 3:
-                df = df.iloc[:, -3:]
-
-            df.columns = ["Onscreen Text", "Voice Over Script", "Visualization Guidelines"]
-
-            st.markdown(
-                """
-                <style>
-                .stDataFrame td {
-                    white-space: pre-wrap !important;
-                    word-break: break-word !important;
-                }
-                </style>
-                """,
-                unsafe_allow_html=True
-            )
-
-            st.dataframe(df, use_container_width=True)
-
-        except Exception:
-            st.error("Could not render storyboard as a table here. Showing raw text instead. Don't worry, export to word and it will be fine")
-            st.code(st.session_state.storyboard)
+        for warning in st.session_state.get("storyboard_warnings") or []:
+            st.warning(warning)
+        st.markdown(
+            """
+            <style>
+            .stDataFrame td {
+                white-space: pre-wrap !important;
+                word-break: break-word !important;
+            }
+            </style>
+            """,
+            unsafe_allow_html=True
+        )
+
+        # Rows selected here can be regenerated on their own below
+        event = st.dataframe(to_frame(rows, STORYBOARD), use_container_width=True, on_select="rerun",
+                             selection_mode="multi-row", key=f"storyboard_table_{st.session_state.get('storyboard_version', 0)}")
+        show_revision_panel(context_summary, rows, list(event.selection.rows))
 
         # Show "Continue to Step 5" only if storyboard exists
         with st.form("approve_storyboard_form"):
@@ -102,61 +126,14 @@ def generate_storyboard():
                 st.session_state.step = 5
                 st.rerun()
             
-        # Export to Word
-        from docx import Document
-        from docx.shared import Pt, Inches
-        from docx.oxml.ns import qn
-        from docx.oxml import OxmlElement
-        import io
-
-        lines = storyboard_text.strip().split("\n")
-
-        if len(lines) >= 2:
-            buffer = io.BytesIO()
-            doc = Document()
-            doc.add_heading('Storyboard', level=1)
-
-            headers = [h.strip() for h in lines[0].split("|") if h.strip()]
-            table = doc.add_table(rows=1, cols=len(headers))
-            table.style = 'Table Grid'
-            table.autofit = True
-            hdr_cells = table.rows[0].cells
-            for idx, col in enumerate(headers):
-                cell = hdr_cells[idx]
-                cell.text = col
-                for paragraph in cell.paragraphs:
-                    run = paragraph.runs[0]
-                    run.bold = True
-                    run.font.size = Pt(11)
-
-            for line in lines[2:]:
-                columns = [c.strip() for c in line.split("|") if c.strip()]
-                if len(columns) == len(headers):
-                    row_cells = table.add_row().cells
-                    for idx, val in enumerate(columns):
-                        cell = row_cells[idx]
-                        paragraph = cell.paragraphs[0]
-                        run = paragraph.add_run(str(val))
-                        run.font.size = Pt(10)
-
-                        tc = cell._tc
-                        tcPr = tc.get_or_add_tcPr()
-                        tcW = OxmlElement('w:tcW')
-                        tcW.set(qn('w:type'), 'auto')
-                        tcW.set(qn('w:w'), '0')
-                        tcPr.append(tcW)
-
-            doc.save(buffer)
-            buffer.seek(0)
-
-            st.download_button(
-                label="\U0001F4C4 Download Storyboard as Word file",
-                data=buffer,
-                file_name="Storyboard.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            )
-        else:
-            st.error("Storyboard format not valid. Cannot export to Word.")
+        # Export to Word; the document is only rebuilt when the rows change
+        st.download_button(
+            label="\U0001F4C4 Download Storyboard as Word file",
+            data=storyboard_docx(rows),
+            file_name="Storyboard.docx",
+            mime=DOCX_MIME
+        )
+        show_course_exports(rows, st.session_state.get("assessment_questions"))
     else:
         st.error("Storyboard could not be generated. Please retry.")
 
@@ -174,4 +151,72 @@ def save_storyboard_to_file(storyboard, file_path):
 
 def load_storyboard_from_file(file_path):
     with open(file_path, 'r') as file:
-        return file.read()
\ No newline at end of file
+        return file.read()
+
+
+def storyboard_job(job, prompt, max_completion_tokens, use_cache, model):
+    return collect_stream(job, stream_openai_response(prompt, max_completion_tokens, use_cache=use_cache, model=model,
+                                                      step="storyboard", response_format=STORYBOARD.response_format()))
+
+
+def set_storyboard_version(rows, sections):
+    st.session_state.storyboard = rows
+    st.session_state.storyboard_sections = sections
+    # A new table key clears the row selection, whose indexes no longer match
+    st.session_state.storyboard_version = st.session_state.get("storyboard_version", 0) + 1
+
+
+def show_revision_panel(context_summary, rows, selected):
+    sections = st.session_state.get("storyboard_sections")
+    history = st.session_state.setdefault("storyboard_history", [])
+    with st.expander("✏️ Revise rows", expanded=bool(selected)):
+        if sections:
+            titles = [title for title, _ in sections]
+            section = st.selectbox("Revise a whole section", ["Selected rows only"] + titles)
+            if section in titles:
+                _, start, end = section_bounds(sections)[titles.index(section)]
+                selected = list(range(start, end))
+        if selected:
+            st.caption(f"Rows selected: {', '.join(str(i + 1) for i in sorted(selected))}")
+        else:
+            st.caption("Select rows in the table above, then describe the change.")
+        instruction = st.text_area("What should change?", key="revision_instruction")
+        for warning in st.session_state.pop("revision_warnings", []):
+            st.warning(warning)
+
+        if st.button("🔁 Regenerate selected rows", disabled=not (selected and instruction.strip())):
+            with st.spinner(f"Regenerating {len(selected)} rows..."):
+                new_rows, new_sections, warnings = revise_rows(context_summary, rows, selected, instruction.strip(), sections)
+            if new_rows != rows:
+                push_version(history, f"Before: {instruction.strip()[:80]}", rows, sections)
+                set_storyboard_version(new_rows, new_sections)
+            st.session_state.revision_warnings = warnings
+            st.rerun()
+
+        if history:
+            st.caption(f"{len(history)} earlier versions. Last change: {history[-1]['label']}")
+            if st.button("↩️ Undo last change"):
+                version = history.pop()
+                st.session_state.pop("storyboard_job", None)
+                set_storyboard_version(version["rows"], version["sections"])
+                st.rerun()
+
+
+def section_storyboard_job(job, context_summary, content_outline, outline_rows, corpus, generated_content, use_cache):
+    def on_progress(done, total, rows):
+        job.progress(done / total, f"Generated {done} of {total} sections...")
+        job.partial(rows_json(rows))
+
+    job.progress(0.0, f"Generating {len(outline_rows)} sections in parallel. Rows will appear below as sections finish...")
+    rows, sections, warnings = generate_by_section(
+        context_summary, content_outline, outline_rows, corpus, generated_content, use_cache, on_progress
+    )
+    return {"storyboard": rows_json(rows), "sections": sections, "warnings": warnings}
+
+
+def show_partial_storyboard(text):
+    # Only rows whose JSON object is complete are shown
+    rows = parse_rows(text, STORYBOARD)
+    if rows:
+        st.caption(f"{len(rows)} rows so far.")
+        st.dataframe(to_frame(rows, STORYBOARD), use_container_width=True)
@@ -1,3 +1,4 @@
+import json
 import sqlite3
 from datetime import datetime
 import logging
@@ -105,7 +106,7 @@ def get_user_projects(user_id):
 
 # --- STORYBOARD MANAGEMENT ---
 def save_storyboard(project_id, storyboard_title, file_path):
-    """Saves a new storyboard for a specific project."""
+    """Saves a new storyboard for a specific project and returns its ID."""
     created_at = datetime.now().isoformat()
     try:
         with sqlite3.connect(DB_FILE) as conn:
@@ -114,8 +115,10 @@ def save_storyboard(project_id, storyboard_title, file_path):
                       (project_id, storyboard_title, file_path, created_at))
             conn.commit()
             logging.info(f"Saved storyboard '{storyboard_title}' for project ID {project_id}.")
+            return c.lastrowid
     except sqlite3.Error as e:
         logging.error(f"Failed to save storyboard for project ID {project_id}: {e}")
+        return None
 
 def get_project_storyboards(project_id):
     """Retrieves all storyboards for a specific project."""
@@ -145,4 +148,319 @@ def get_user_storyboards(user_email):
             return c.fetchall()
     except sqlite3.Error as e:
         logging.error(f"Failed to get storyboards for user '{user_email}': {e}")
-        return []
\ No newline at end of file
+        return []
+
+# --- JOB MANAGEMENT ---
+def init_jobs_table():
+    """Creates the jobs table used by src.job_runner to persist long-running LLM steps."""
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            # Job tables created before jobs were keyed on the user ID (the session has no user email)
+            c.execute("PRAGMA table_info(jobs)")
+            if "user_email" in [column[1] for column in c.fetchall()]:
+                c.execute("ALTER TABLE jobs RENAME COLUMN user_email TO user_id")
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    partial_result TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_id, kind, created_at)")
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to create jobs table: {e}")
+
+def create_job(job_id, kind, user_id=None):
+    """Records a new queued job."""
+    now = datetime.now().isoformat()
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            c.execute("INSERT INTO jobs (id, user_id, kind, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                      (job_id, str(user_id) if user_id is not None else None, kind, now, now))
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to create job {job_id}: {e}")
+
+def update_job(job_id, **fields):
+    """Updates any of status, progress, message, partial_result, result and error of a job."""
+    columns = [name for name in ("status", "progress", "message", "partial_result", "result", "error") if name in fields]
+    if not columns:
+        return
+    assignments = ", ".join(f"{name} = ?" for name in columns)
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            c.execute(f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?",
+                      [fields[name] for name in columns] + [datetime.now().isoformat(), job_id])
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to update job {job_id}: {e}")
+
+def get_job(job_id):
+    """Retrieves a job as a dict, or None if it does not exist."""
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            conn.row_factory = sqlite3.Row
+            c = conn.cursor()
+            c.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = c.fetchone()
+            return dict(row) if row else None
+    except sqlite3.Error as e:
+        logging.error(f"Failed to get job {job_id}: {e}")
+        return None
+
+def mark_interrupted_jobs():
+    """Marks jobs left queued or running by a previous server process as interrupted."""
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            c.execute("UPDATE jobs SET status = 'interrupted', updated_at = ? WHERE status IN ('queued', 'running')",
+                      (datetime.now().isoformat(),))
+            conn.commit()
+            return c.rowcount
+    except sqlite3.Error as e:
+        logging.error(f"Failed to mark interrupted jobs: {e}")
+        return 0
+
+# --- QUESTION BANK ---
+def init_question_bank_table():
+    """Creates the question bank that section-by-section assessments reuse and top up."""
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            # Banks created before they were keyed on the user ID (the session has no user email)
+            c.execute("PRAGMA table_info(question_bank)")
+            if "user_email" in [column[1] for column in c.fetchall()]:
+                c.execute("ALTER TABLE question_bank RENAME COLUMN user_email TO user_id")
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS question_bank (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    section TEXT NOT NULL,
+                    section_key TEXT NOT NULL,
+                    stem TEXT NOT NULL,
+                    stem_key TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    feedback TEXT,
+                    difficulty TEXT,
+                    model TEXT,
+                    times_used INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    UNIQUE (user_id, stem_key)
+                )
+            ''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_question_bank_section ON question_bank (user_id, section_key)")
+
+            # Full-text index over the bank, kept in sync by triggers
+            c.execute("SELECT 1 FROM sqlite_master WHERE name = 'question_bank_fts'")
+            is_new = c.fetchone() is None
+            c.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS question_bank_fts USING fts5 (
+                    section, stem, options, feedback,
+                    content = 'question_bank', content_rowid = 'id', tokenize = 'porter unicode61'
+                )
+            ''')
+            c.execute('''
+                CREATE TRIGGER IF NOT EXISTS question_bank_ai AFTER INSERT ON question_bank BEGIN
+                    INSERT INTO question_bank_fts (rowid, section, stem, options, feedback)
+                    VALUES (new.id, new.section, new.stem, new.options, new.feedback);
+                END
+            ''')
+            c.execute('''
+                CREATE TRIGGER IF NOT EXISTS question_bank_ad AFTER DELETE ON question_bank BEGIN
+                    INSERT INTO question_bank_fts (question_bank_fts, rowid, section, stem, options, feedback)
+                    VALUES ('delete', old.id, old.section, old.stem, old.options, old.feedback);
+                END
+            ''')
+            # Only edits to indexed columns touch the index (times_used changes on every reuse)
+            c.execute('''
+                CREATE TRIGGER IF NOT EXISTS question_bank_au AFTER UPDATE OF section, stem, options, feedback ON question_bank BEGIN
+                    INSERT INTO question_bank_fts (question_bank_fts, rowid, section, stem, options, feedback)
+                    VALUES ('delete', old.id, old.section, old.stem, old.options, old.feedback);
+                    INSERT INTO question_bank_fts (rowid, section, stem, options, feedback)
+                    VALUES (new.id, new.section, new.stem, new.options, new.feedback);
+                END
+            ''')
+            if is_new:
+                # Questions banked before the index existed
+                c.execute("INSERT INTO question_bank_fts (question_bank_fts) VALUES ('rebuild')")
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to create question bank table: {e}")
+
+def save_bank_questions(user_id, section, section_key, questions, model=None):
+    """
+    Adds (stem, options, answer, feedback, difficulty) dicts to a user's bank under a section.
+    Questions whose normalized stem is already banked are skipped. Returns the number added.
+    """
+    now = datetime.now().isoformat()
+    records = [
+        (str(user_id), section, section_key, q["stem"], " ".join(q["stem"].lower().split()), json.dumps(q["options"]),
+         q["answer"], q.get("feedback"), q.get("difficulty"), model, now)
+        for q in questions
+    ]
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            before = conn.total_changes
+            c.executemany('''
+                INSERT OR IGNORE INTO question_bank
+                    (user_id, section, section_key, stem, stem_key, options, answer, feedback, difficulty, model, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', records)
+            conn.commit()
+            return conn.total_changes - before
+    except sqlite3.Error as e:
+        logging.error(f"Failed to save questions to the bank: {e}")
+        return 0
+
+def get_bank_section_keys(user_id):
+    """Distinct section keys in a user's bank with their question counts."""
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            c.execute("SELECT section_key, COUNT(*) FROM question_bank WHERE user_id = ? GROUP BY section_key",
+                      (str(user_id),))
+            return c.fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to list question bank sections: {e}")
+        return []
+
+def get_bank_questions(user_id, section_key, limit):
+    """Up to `limit` banked questions of a section as dicts, oldest first so re-runs get the same ones."""
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            conn.row_factory = sqlite3.Row
+            c = conn.cursor()
+            c.execute("SELECT * FROM question_bank WHERE user_id = ? AND section_key = ? ORDER BY id LIMIT ?",
+                      (str(user_id), section_key, limit))
+            return [dict(row, options=json.loads(row["options"])) for row in c.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Failed to get questions from the bank: {e}")
+        return []
+
+def record_question_use(question_ids):
+    """Counts a use of each banked question placed in an assessment."""
+    if not question_ids:
+        return
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            c.executemany("UPDATE question_bank SET times_used = times_used + 1 WHERE id = ?", [(i,) for i in question_ids])
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to record question use: {e}")
+
+# --- CONTENT SEARCH ---
+def init_search_index():
+    """
+    Creates the full-text index over saved projects: one entry per storyboard row, assessment
+    question, outline section and context summary, so earlier material can be found and reused.
+    """
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            c.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS content_index USING fts5 (
+                    project_title, section, body,
+                    kind UNINDEXED, project_id UNINDEXED, user_id UNINDEXED, position UNINDEXED,
+                    tokenize = 'porter unicode61'
+                )
+            ''')
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to create search index: {e}")
+
+def index_project_content(project_id, user_id, project_title, entries):
+    """
+    Replaces the indexed content of one project with `entries`, a list of
+    (kind, position, section, body) tuples. Only this project's entries are rewritten.
+    """
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM content_index WHERE project_id = ?", (project_id,))
+            c.executemany(
+                "INSERT INTO content_index (project_title, section, body, kind, project_id, user_id, position) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(project_title, section or "", body, kind, project_id, str(user_id), position)
+                 for kind, position, section, body in entries if body]
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to index content of project ID {project_id}: {e}")
+
+def fts_query(text):
+    """
+    A safe FTS5 query from free text: every word must match, the last one as a prefix so
+    results update while typing. Quoting keeps FTS5 operators and punctuation literal.
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+def search_content(user_id, query, limit=20):
+    """
+    Best-matching indexed entries of a user's saved projects as dicts with kind, project_id,
+    project_title, section, position and a highlighted snippet.
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            conn.row_factory = sqlite3.Row
+            c = conn.cursor()
+            c.execute('''
+                SELECT kind, project_id, project_title, section, position,
+                       snippet(content_index, 2, '**', '**', '…', 16) AS snippet
+                FROM content_index
+                WHERE content_index MATCH ? AND user_id = ?
+                ORDER BY bm25(content_index, 2.0, 3.0, 1.0)
+                LIMIT ?
+            ''', (match, str(user_id), limit))
+            return [dict(row) for row in c.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Search failed for user ID {user_id}: {e}")
+        return []
+
+def search_question_bank(user_id, query, limit=20):
+    """Best-matching questions of a user's question bank, as dicts like get_bank_questions."""
+    match = fts_query(query)
+    if not match:
+        return []
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            conn.row_factory = sqlite3.Row
+            c = conn.cursor()
+            c.execute('''
+                SELECT q.* FROM question_bank_fts f
+                JOIN question_bank q ON q.id = f.rowid
+                WHERE question_bank_fts MATCH ? AND q.user_id = ?
+                ORDER BY bm25(question_bank_fts, 3.0, 2.0, 1.0, 1.0)
+                LIMIT ?
+            ''', (match, str(user_id), limit))
+            return [dict(row, options=json.loads(row["options"])) for row in c.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Question bank search failed for user ID {user_id}: {e}")
+        return []
+
+# --- SCHEMA ---
+def init_all():
+    """Creates every table the app uses. IDA.main() calls this once per server process."""
+    init_db()
+    init_jobs_table()
+    init_question_bank_table()
+    init_search_index()
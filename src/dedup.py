@@ -0,0 +1,114 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+from src.token_budget import count_tokens
+
+# --- CONFIGURATION ---
+DEDUP_ENABLED = os.getenv("IDA_DEDUP", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("IDA_DEDUP_THRESHOLD", 0.8))  # Estimated Jaccard similarity that counts as a duplicate
+MIN_BLOCK_WORDS = 8  # Shorter blocks (headings, labels) are always kept
+MAX_BLOCK_WORDS = 150  # Longer paragraphs are compared in sentence groups of about this size
+SHINGLE_WORDS = 5
+
+# MinHash signatures of NUM_PERM values, bucketed by LSH in BANDS bands of ROWS values each.
+# Blocks sharing any band become candidates and are then compared on the full signature.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(42)
+_PERM_A = _rng.randint(1, 2 ** 32 - 1, NUM_PERM, dtype=np.int64).astype(np.uint64)
+_PERM_B = _rng.randint(0, 2 ** 32 - 1, NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+WORD_PATTERN = re.compile(r"\w+")
+PARAGRAPH_BREAK = re.compile(r"(\n\s*\n)")
+SENTENCE_END = re.compile(r"(?<=[.!?]\s)")
+
+
+def minhash(words):
+    """MinHash signature of the word shingles of a block."""
+    count = max(1, len(words) - SHINGLE_WORDS + 1)
+    shingles = np.fromiter(
+        (zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8")) for i in range(count)),
+        dtype=np.uint64, count=count,
+    )
+    hashed = (np.outer(shingles, _PERM_A) + _PERM_B) % _MERSENNE_PRIME
+    return hashed.min(axis=0)
+
+
+def split_blocks(text):
+    """Splits text into paragraph (or, for long paragraphs, sentence-group) blocks that join back to `text`."""
+    blocks = []
+    for part in PARAGRAPH_BREAK.split(text):
+        if len(part.split()) <= MAX_BLOCK_WORDS:
+            blocks.append(part)
+            continue
+        group, words = "", 0
+        for sentence in SENTENCE_END.split(part):
+            group += sentence
+            words += len(sentence.split())
+            if words >= MAX_BLOCK_WORDS:
+                blocks.append(group)
+                group, words = "", 0
+        if group:
+            blocks.append(group)
+    return blocks
+
+
+class NearDuplicateFilter:
+    """
+    Drops blocks of text that nearly duplicate a block already seen in a different file.
+    Each block is hashed once and looked up in the LSH buckets, so filtering is linear in
+    the size of the corpus. Call it on each chunk as it is added; the first copy of a block
+    is kept and every dropped copy is recorded in `matches`.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.removed_blocks = 0
+        self.removed_tokens = 0
+        self.matches = []  # (dropped source, dropped locator, kept source, kept locator)
+        self._buckets = [{} for _ in range(BANDS)]
+        self._kept = []  # (source, locator, signature)
+
+    def __call__(self, source, locator, text):
+        kept = []
+        for block in split_blocks(text):
+            words = WORD_PATTERN.findall(block.lower())
+            if len(words) < MIN_BLOCK_WORDS:
+                kept.append(block)
+                continue
+            signature = minhash(words)
+            original = self._find(signature, source)
+            if original is not None:
+                self.removed_blocks += 1
+                self.removed_tokens += count_tokens(block)
+                self.matches.append((source, locator, original[0], original[1]))
+                continue
+            self._add(signature, source, locator)
+            kept.append(block)
+        return "".join(kept)
+
+    def _find(self, signature, source):
+        for band, buckets in enumerate(self._buckets):
+            for candidate in buckets.get(signature[band * ROWS:(band + 1) * ROWS].tobytes(), ()):
+                kept_source, kept_locator, kept_signature = self._kept[candidate]
+                if kept_source != source and np.mean(kept_signature == signature) >= self.threshold:
+                    return kept_source, kept_locator
+        return None
+
+    def _add(self, signature, source, locator):
+        block_id = len(self._kept)
+        self._kept.append((source, locator, signature))
+        for band, buckets in enumerate(self._buckets):
+            buckets.setdefault(signature[band * ROWS:(band + 1) * ROWS].tobytes(), []).append(block_id)
+
+    def report(self):
+        return {
+            "removed_blocks": self.removed_blocks,
+            "removed_tokens": self.removed_tokens,
+            "matches": list(self.matches),
+        }
@@ -0,0 +1,520 @@
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from dataclasses import asdict, is_dataclass
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+from src.schemas import STORYBOARD
+
+# --- CONFIGURATION ---
+# Exports are built once per content hash and the bytes kept in memory, so reruns (which re-render
+# the download buttons) cost one hash of the rows instead of a full document build.
+EXPORT_CACHE_ENTRIES = int(os.getenv("IDA_EXPORT_CACHE_ENTRIES", 16))
+# Slide decks and SCORM packages are written to disk under EXPORT_DIR/<content hash>/ and reused
+EXPORT_DIR = os.getenv("IDA_EXPORT_DIR", "exports")
+SCORM_MASTERY_SCORE = int(os.getenv("IDA_SCORM_MASTERY_SCORE", 80))
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+ZIP_MIME = "application/zip"
+
+TEXT_WIDTH_TWIPS = 8640  # 6 inches: the default template's page width less its margins
+WORD_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def content_hash(kind, *parts):
+    """Hash of an export's inputs; rows are hashed through their JSON form."""
+    payload = json.dumps(
+        [kind] + [[asdict(item) if is_dataclass(item) else item for item in part] if isinstance(part, list) else part
+                  for part in parts],
+        ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExportCache:
+    """Small in-memory LRU of built export files (bytes), keyed by content hash."""
+
+    def __init__(self, max_entries=EXPORT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        data = build()
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+
+export_cache = ExportCache()
+
+
+# --- WORD ---
+def _run_xml(text, size_half_points, bold=False):
+    # One run per cell; line breaks inside the text become <w:br/>
+    props = f"<w:rPr>{'<w:b/>' if bold else ''}<w:sz w:val=\"{size_half_points}\"/></w:rPr>"
+    lines = INVALID_XML_CHARS.sub("", text or "").split("\n")
+    body = "<w:br/>".join(f"<w:t xml:space=\"preserve\">{escape(line)}</w:t>" for line in lines)
+    return f"<w:r>{props}{body}</w:r>"
+
+
+def _row_xml(cells, size_half_points, bold=False, header=False):
+    row_props = "<w:trPr><w:tblHeader/></w:trPr>" if header else ""
+    return "<w:tr>" + row_props + "".join(
+        f"<w:tc><w:tcPr><w:tcW w:w=\"0\" w:type=\"auto\"/></w:tcPr><w:p>{_run_xml(cell, size_half_points, bold)}</w:p></w:tc>"
+        for cell in cells
+    ) + "</w:tr>"
+
+
+def table_xml(columns, rows):
+    """
+    A 'Table Grid' table as one WordprocessingML string. Building the XML in bulk and parsing it
+    once is much faster for long storyboards than adding cells through python-docx objects.
+    """
+    width = TEXT_WIDTH_TWIPS // len(columns)
+    parts = [
+        f"<w:tbl xmlns:w=\"{WORD_NS}\">",
+        "<w:tblPr><w:tblStyle w:val=\"TableGrid\"/><w:tblW w:w=\"0\" w:type=\"auto\"/>"
+        "<w:tblLook w:val=\"04A0\" w:firstRow=\"1\" w:lastRow=\"0\" w:firstColumn=\"1\" w:lastColumn=\"0\" w:noHBand=\"0\" w:noVBand=\"1\"/></w:tblPr>",
+        "<w:tblGrid>" + f"<w:gridCol w:w=\"{width}\"/>" * len(columns) + "</w:tblGrid>",
+        _row_xml(columns, 22, bold=True, header=True),
+    ]
+    parts.extend(_row_xml(cells, 20) for cells in rows)
+    parts.append("</w:tbl>")
+    return "".join(parts)
+
+
+def add_table(doc, columns, rows):
+    from docx.oxml import parse_xml
+    # Inserted before the body's section properties, where python-docx adds its own tables
+    doc.element.body._insert_tbl(parse_xml(table_xml(columns, rows)))
+
+
+def storyboard_cells(rows):
+    return [[getattr(row, name) for name in STORYBOARD.fields] for row in rows]
+
+
+def _docx_bytes(doc):
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def build_storyboard_docx(rows):
+    from docx import Document
+    doc = Document()
+    doc.add_heading("Storyboard", level=1)
+    add_table(doc, STORYBOARD.columns, storyboard_cells(rows))
+    return _docx_bytes(doc)
+
+
+def build_project_docx(rows, assessment):
+    from docx import Document
+    doc = Document()
+    doc.add_heading("Storyboard", level=1)
+    add_table(doc, STORYBOARD.columns, storyboard_cells(rows))
+    doc.add_page_break()
+    doc.add_heading("Final Assessment", level=1)
+    doc.add_paragraph(assessment)
+    return _docx_bytes(doc)
+
+
+def storyboard_docx(rows):
+    """The storyboard as .docx bytes, built once per distinct storyboard."""
+    return export_cache.get_or_build(content_hash("storyboard_docx", rows), lambda: build_storyboard_docx(rows))
+
+
+def project_docx(rows, assessment):
+    """Storyboard and final assessment as one .docx, built once per distinct content."""
+    return export_cache.get_or_build(content_hash("project_docx", rows, assessment),
+                                     lambda: build_project_docx(rows, assessment))
+
+
+# --- POWERPOINT ---
+COMMENT_AUTHOR = "IDA"
+PRESENTATION_NS = "http://schemas.openxmlformats.org/presentationml/2006/main"
+
+
+def slide_titles(rows, sections=None):
+    """A title per screen: its section and position when known, else the first short line of its text."""
+    titles = []
+    for title, count in sections or []:
+        titles.extend(f"{title} ({i + 1}/{count})" if count > 1 else title for i in range(count))
+    for i in range(len(titles), len(rows)):
+        first_line = rows[i].onscreen_text.strip().split("\n", 1)[0]
+        titles.append(first_line if 0 < len(first_line) <= 80 else f"Screen {i + 1}")
+    return titles
+
+
+def _add_comment(slide, text, index):
+    # python-pptx has no comments API; slide comments are a cmLst part related from the slide
+    from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+    from pptx.opc.package import Part
+    from pptx.opc.packuri import PackURI
+    created = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000")
+    xml = (f'<p:cmLst xmlns:p="{PRESENTATION_NS}"><p:cm authorId="0" dt="{created}" idx="{index}">'
+           f'<p:pos x="10" y="10"/><p:text>{escape(INVALID_XML_CHARS.sub("", text))}</p:text></p:cm></p:cmLst>')
+    part = Part(PackURI(f"/ppt/comments/comment{index}.xml"), CT.PML_COMMENTS, slide.part.package, xml.encode("utf-8"))
+    slide.part.relate_to(part, RT.COMMENTS)
+
+
+def _add_comment_authors(prs, last_index):
+    from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+    from pptx.opc.package import Part
+    from pptx.opc.packuri import PackURI
+    xml = (f'<p:cmAuthorLst xmlns:p="{PRESENTATION_NS}"><p:cmAuthor id="0" name="{COMMENT_AUTHOR}" '
+           f'initials="{COMMENT_AUTHOR}" lastIdx="{last_index}" clrIdx="0"/></p:cmAuthorLst>')
+    part = Part(PackURI("/ppt/commentAuthors.xml"), CT.PML_COMMENT_AUTHORS, prs.part.package, xml.encode("utf-8"))
+    prs.part.relate_to(part, RT.COMMENT_AUTHORS)
+
+
+def build_pptx(rows, path, title="Course", sections=None):
+    """
+    One slide per storyboard row: on-screen text on the slide, the voice-over script in the
+    speaker notes and the visualization guidelines as a slide comment for the designer.
+    """
+    from pptx import Presentation
+    from pptx.enum.text import MSO_AUTO_SIZE
+    from pptx.util import Pt
+
+    prs = Presentation()
+    cover = prs.slides.add_slide(prs.slide_layouts[0])
+    cover.shapes.title.text = title
+    cover.placeholders[1].text = f"Storyboard, {len(rows)} screens"
+    commented = 0
+    for row, slide_title in zip(rows, slide_titles(rows, sections)):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = slide_title
+        body = slide.placeholders[1].text_frame
+        body.word_wrap = True
+        body.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
+        lines = [line.strip() for line in INVALID_XML_CHARS.sub("", row.onscreen_text).split("\n") if line.strip()]
+        for i, line in enumerate(lines or [""]):
+            paragraph = body.paragraphs[0] if i == 0 else body.add_paragraph()
+            paragraph.text = line
+            paragraph.font.size = Pt(18)
+        slide.notes_slide.notes_text_frame.text = INVALID_XML_CHARS.sub("", row.voice_over_script)
+        if row.visualization_guidelines.strip():
+            commented += 1
+            _add_comment(slide, row.visualization_guidelines, commented)
+    if commented:
+        _add_comment_authors(prs, commented)
+    prs.save(path)
+    return path
+
+
+# --- SCORM ---
+SCORM_API_JS = """var scormApi = null;
+var scormFinished = false;
+
+function findApi(win) {
+  var tries = 0;
+  while (win && !win.API && win.parent && win.parent !== win && tries < 10) {
+    win = win.parent;
+    tries++;
+  }
+  return win ? win.API || null : null;
+}
+
+function scormInit() {
+  scormApi = findApi(window) || (window.opener ? findApi(window.opener) : null);
+  if (scormApi) {
+    scormApi.LMSInitialize("");
+    if (scormApi.LMSGetValue("cmi.core.lesson_status") === "not attempted") {
+      scormSet("cmi.core.lesson_status", "incomplete");
+    }
+  }
+}
+
+function scormGet(name) {
+  return scormApi ? scormApi.LMSGetValue(name) : "";
+}
+
+function scormSet(name, value) {
+  if (scormApi) {
+    scormApi.LMSSetValue(name, value);
+    scormApi.LMSCommit("");
+  }
+}
+
+function scormComplete() {
+  var status = scormGet("cmi.core.lesson_status");
+  if (status !== "passed" && status !== "failed") {
+    scormSet("cmi.core.lesson_status", "completed");
+  }
+}
+
+function scormScore(percent, mastery) {
+  scormSet("cmi.core.score.min", "0");
+  scormSet("cmi.core.score.max", "100");
+  scormSet("cmi.core.score.raw", String(percent));
+  scormSet("cmi.core.lesson_status", percent >= mastery ? "passed" : "failed");
+}
+
+function scormFinish() {
+  if (scormApi && !scormFinished) {
+    scormFinished = true;
+    scormApi.LMSFinish("");
+  }
+}
+"""
+
+SCORM_CSS = """body { font-family: Arial, Helvetica, sans-serif; margin: 0; color: #222; }
+header { display: flex; justify-content: space-between; align-items: center; padding: 8px 16px; background: #1f3b57; color: #fff; }
+header h1 { font-size: 18px; margin: 0; }
+iframe { border: 0; width: 100%; height: calc(100vh - 110px); }
+nav { display: flex; justify-content: space-between; padding: 8px 16px; }
+button { padding: 8px 16px; font-size: 15px; }
+main { max-width: 860px; margin: 0 auto; padding: 16px; line-height: 1.5; }
+fieldset { margin-bottom: 16px; }
+.result { font-weight: bold; }
+"""
+
+PLAYER_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<link rel="stylesheet" href="style.css">
+<script src="scorm_api.js"></script>
+</head>
+<body onload="start()" onunload="scormFinish()" onbeforeunload="scormFinish()">
+<header><h1>{title}</h1><span id="progress"></span></header>
+<iframe id="screen" title="Course screen"></iframe>
+<nav><button id="prev" onclick="go(-1)">Previous</button><button id="next" onclick="go(1)">Next</button></nav>
+<script>
+var pages = {pages};
+var hasAssessment = {has_assessment};
+var current = 0;
+
+function start() {{
+  scormInit();
+  var saved = parseInt(scormGet("cmi.core.lesson_location"), 10);
+  if (!isNaN(saved) && saved >= 0 && saved < pages.length) {{
+    current = saved;
+  }}
+  show();
+}}
+
+function show() {{
+  document.getElementById("screen").src = pages[current];
+  document.getElementById("progress").textContent = (current + 1) + " / " + pages.length;
+  document.getElementById("prev").disabled = current === 0;
+  document.getElementById("next").disabled = current === pages.length - 1;
+  scormSet("cmi.core.lesson_location", String(current));
+  if (current === pages.length - 1 && !hasAssessment) {{
+    scormComplete();
+  }}
+}}
+
+function go(step) {{
+  current = Math.min(Math.max(current + step, 0), pages.length - 1);
+  show();
+}}
+</script>
+</body>
+</html>
+"""
+
+SCREEN_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<link rel="stylesheet" href="../style.css">
+</head>
+<body>
+<main>
+<h2>{title}</h2>
+{paragraphs}
+<details><summary>Transcript</summary>{transcript}</details>
+</main>
+</body>
+</html>
+"""
+
+ASSESSMENT_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Final Assessment</title>
+<link rel="stylesheet" href="style.css">
+</head>
+<body>
+<main>
+<h2>Final Assessment</h2>
+<form id="quiz" onsubmit="return submitQuiz()"></form>
+<p id="result" class="result"></p>
+</main>
+<script>
+var questions = {questions};
+var mastery = {mastery};
+var form = document.getElementById("quiz");
+
+questions.forEach(function (q, i) {{
+  var fieldset = document.createElement("fieldset");
+  var legend = document.createElement("legend");
+  legend.textContent = (i + 1) + ". " + q.question;
+  fieldset.appendChild(legend);
+  q.options.forEach(function (option, j) {{
+    var label = document.createElement("label");
+    var input = document.createElement("input");
+    input.type = "radio";
+    input.name = "q" + i;
+    input.value = j;
+    label.appendChild(input);
+    label.appendChild(document.createTextNode(" " + option));
+    fieldset.appendChild(label);
+    fieldset.appendChild(document.createElement("br"));
+  }});
+  form.appendChild(fieldset);
+}});
+var submit = document.createElement("button");
+submit.type = "submit";
+submit.textContent = "Submit answers";
+form.appendChild(submit);
+
+function submitQuiz() {{
+  var correct = 0;
+  questions.forEach(function (q, i) {{
+    var chosen = form.querySelector("input[name=q" + i + "]:checked");
+    if (chosen && parseInt(chosen.value, 10) === q.answer) {{
+      correct++;
+    }}
+  }});
+  var percent = questions.length ? Math.round(100 * correct / questions.length) : 100;
+  document.getElementById("result").textContent = "You scored " + percent + "% (" + correct + " of " + questions.length + " correct).";
+  if (window.parent && window.parent.scormScore) {{
+    window.parent.scormScore(percent, mastery);
+  }}
+  return false;
+}}
+</script>
+</body>
+</html>
+"""
+
+
+def answer_index(question):
+    """Index of the correct option, matched by text or by option letter; -1 if it cannot be found."""
+    correct = question.correct_option.strip().lower()
+    for i, option in enumerate(question.options):
+        if option.strip().lower() == correct:
+            return i
+    match = re.match(r"^\(?([a-z])[).:]?(\s|$)", correct)
+    if match and ord(match.group(1)) - ord("a") < len(question.options):
+        return ord(match.group(1)) - ord("a")
+    return -1
+
+
+def _script_json(value):
+    # Safe to embed inside a <script> element
+    return json.dumps(value, ensure_ascii=False).replace("</", "<\\/")
+
+
+def _paragraphs(text):
+    return "\n".join(f"<p>{html.escape(line.strip())}</p>" for line in text.split("\n") if line.strip())
+
+
+def scorm_manifest(title, files):
+    identifier = "IDA_" + hashlib.sha1(title.encode("utf-8")).hexdigest()[:12]
+    file_list = "\n".join(f"      <file href={quoteattr(name)}/>" for name in files)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<manifest identifier="{identifier}" version="1.0"
+  xmlns="http://www.imsproject.org/xsd/imscp_rootv1p1p2"
+  xmlns:adlcp="http://www.adlnet.org/xsd/adlcp_rootv1p2"
+  xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+  xsi:schemaLocation="http://www.imsproject.org/xsd/imscp_rootv1p1p2 imscp_rootv1p1p2.xsd http://www.imsglobal.org/xsd/imsmd_rootv1p2p1 imsmd_rootv1p2p1.xsd http://www.adlnet.org/xsd/adlcp_rootv1p2 adlcp_rootv1p2.xsd">
+  <metadata>
+    <schema>ADL SCORM</schema>
+    <schemaversion>1.2</schemaversion>
+  </metadata>
+  <organizations default="ORG-1">
+    <organization identifier="ORG-1">
+      <title>{escape(title)}</title>
+      <item identifier="ITEM-1" identifierref="RES-1" isvisible="true">
+        <title>{escape(title)}</title>
+        <adlcp:masteryscore>{SCORM_MASTERY_SCORE}</adlcp:masteryscore>
+      </item>
+    </organization>
+  </organizations>
+  <resources>
+    <resource identifier="RES-1" type="webcontent" adlcp:scormtype="sco" href="index.html">
+{file_list}
+    </resource>
+  </resources>
+</manifest>
+"""
+
+
+def build_scorm(rows, questions, path, title="Course", sections=None, on_progress=None):
+    """
+    A SCORM 1.2 package: a single SCO that pages through one HTML screen per storyboard row
+    (voice-over as a transcript) and ends with the scored final assessment, if there is one.
+    Entries are streamed into the zip on disk one at a time, so memory use does not grow with
+    the size of the course. `on_progress(done, total)` is called as screens are written.
+    """
+    files = []
+    pages = []
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        def write(name, text):
+            with zf.open(name, "w") as f:
+                f.write(text.encode("utf-8"))
+            files.append(name)
+
+        write("scorm_api.js", SCORM_API_JS)
+        write("style.css", SCORM_CSS)
+        for i, (row, screen_title) in enumerate(zip(rows, slide_titles(rows, sections))):
+            name = f"screens/screen_{i + 1:04d}.html"
+            write(name, SCREEN_HTML.format(
+                title=html.escape(screen_title), paragraphs=_paragraphs(row.onscreen_text),
+                transcript=_paragraphs(row.voice_over_script)
+            ))
+            pages.append(name)
+            if on_progress and (i + 1) % 25 == 0:
+                on_progress(i + 1, len(rows))
+        if questions:
+            items = [{"question": q.question, "options": q.options, "answer": answer_index(q)} for q in questions]
+            write("assessment.html", ASSESSMENT_HTML.format(questions=_script_json(items), mastery=SCORM_MASTERY_SCORE))
+            pages.append("assessment.html")
+        write("index.html", PLAYER_HTML.format(
+            title=html.escape(title), pages=_script_json(pages), has_assessment="true" if questions else "false"
+        ))
+        with zf.open("imsmanifest.xml", "w") as f:
+            f.write(scorm_manifest(title, files).encode("utf-8"))
+    return path
+
+
+def build_course_exports(job, rows, questions, title, sections, key):
+    """
+    Background job (see src/job_runner.py) that writes the slide deck and the SCORM package
+    under EXPORT_DIR/<key>/ and returns their paths; files already built for `key` are reused.
+    """
+    out_dir = os.path.join(EXPORT_DIR, key)
+    os.makedirs(out_dir, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", title).strip("_") or "Course"
+    paths = {"pptx": os.path.join(out_dir, f"{slug}.pptx"), "scorm": os.path.join(out_dir, f"{slug}_SCORM.zip")}
+    if not os.path.exists(paths["pptx"]):
+        job.progress(0.1, "Building the slide deck...")
+        build_pptx(rows, paths["pptx"] + ".tmp", title, sections)
+        os.replace(paths["pptx"] + ".tmp", paths["pptx"])
+    if not os.path.exists(paths["scorm"]):
+        job.progress(0.5, "Writing the SCORM package...")
+        build_scorm(rows, questions, paths["scorm"] + ".tmp", title, sections,
+                    on_progress=lambda done, total: job.progress(0.5 + 0.5 * done / total, f"Wrote {done} of {total} screens..."))
+        os.replace(paths["scorm"] + ".tmp", paths["scorm"])
+    return paths
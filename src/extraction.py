@@ -0,0 +1,607 @@
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from src.dedup import DEDUP_ENABLED, NearDuplicateFilter
+from src.text_normalizer import NORMALIZE_ENABLED, TextNormalizer
+from src.token_budget import count_tokens, split_to_tokens
+
+logging.basicConfig(level=logging.INFO)
+
+# --- CONFIGURATION ---
+EXTRACT_CACHE_MAX_BYTES = int(os.getenv("IDA_EXTRACT_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # 64 MB of text
+EXTRACT_CACHE_DIR = os.getenv("IDA_EXTRACT_CACHE_DIR", "")  # e.g. .ida_cache/extract; empty disables the disk tier
+EXTRACT_WORKERS = int(os.getenv("IDA_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))  # 0 parses in-process
+MAX_FILE_BYTES = int(os.getenv("IDA_EXTRACT_MAX_FILE_MB", 100)) * 1024 * 1024
+FILE_TIMEOUT_SECONDS = float(os.getenv("IDA_EXTRACT_TIMEOUT_SECONDS", 120))  # Per parsing task, from when a worker starts it
+PDF_PAGES_PER_TASK = int(os.getenv("IDA_EXTRACT_PDF_PAGES_PER_TASK", 25))
+CORPUS_SPOOL_BYTES = int(os.getenv("IDA_CORPUS_SPOOL_MB", 4)) * 1024 * 1024  # Corpus text kept in memory before spilling to disk
+XLSX_MAX_ROWS = int(os.getenv("IDA_XLSX_MAX_ROWS", 50))  # Data rows shown per sheet; the rest are summarized
+XLSX_HEADER_SCAN_ROWS = 10  # Rows searched for the header row (titles and blank rows often come first)
+
+PDF_TYPE = "application/pdf"
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PPTX_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+XLSX_TYPES = ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "application/vnd.ms-excel")
+TEXT_TYPE = "text/plain"
+
+
+@dataclass
+class TextChunk:
+    source: str  # Uploaded file name
+    locator: str  # Where in the file, e.g. "page 3", "slide 2", "sheet Budget"
+    offset: int  # Character offset of the chunk within the file's extracted text
+    text: str
+
+
+# --- EXTRACTORS ---
+# Each extractor takes the raw file bytes and yields (locator, text) pieces in document order.
+def iter_pdf(data):
+    return iter_pdf_pages(io.BytesIO(data))
+
+
+def iter_pdf_pages(stream, start=0, stop=None):
+    from PyPDF2 import PdfReader
+    reader = PdfReader(stream)
+    for number, page in enumerate(reader.pages[start:stop], start=start + 1):
+        page_text = page.extract_text()
+        if page_text:
+            yield f"page {number}", page_text + "\n"
+
+
+def iter_docx(data):
+    import docx
+    doc = docx.Document(io.BytesIO(data))
+    for number, para in enumerate(doc.paragraphs, start=1):
+        yield f"paragraph {number}", para.text + "\n"
+
+
+def iter_pptx(data):
+    from pptx import Presentation
+    prs = Presentation(io.BytesIO(data))
+    for number, slide in enumerate(prs.slides, start=1):
+        slide_text = "".join(shape.text + "\n" for shape in slide.shapes if hasattr(shape, "text"))
+        if slide_text:
+            yield f"slide {number}", slide_text
+
+
+def iter_xlsx(data):
+    import pandas as pd
+    # One pass over the workbook parses every sheet; headers are detected per sheet afterwards
+    sheets = pd.read_excel(io.BytesIO(data), sheet_name=None, header=None)
+    for sheet_name, df in sheets.items():
+        yield f"sheet {sheet_name}", format_sheet(sheet_name, df)
+
+
+def _find_header_row(df):
+    # The header is the first row that is mostly text and about as wide as the table
+    widths = df.notna().sum(axis=1)
+    widest = widths.max()
+    for i in range(min(XLSX_HEADER_SCAN_ROWS, len(df))):
+        cells = df.iloc[i].dropna()
+        if len(cells) and len(cells) >= 0.5 * widest and sum(isinstance(c, str) for c in cells) >= 0.5 * len(cells):
+            return i
+    return None
+
+
+def _unique_headers(headers):
+    # Repeated names get a pandas-style suffix ("Total", "Total.1") so df[name] is one column
+    seen, unique = {}, []
+    for name in headers:
+        candidate = name
+        while candidate in seen:
+            seen[name] += 1
+            candidate = f"{name}.{seen[name]}"
+        seen[candidate] = 0
+        unique.append(candidate)
+    return unique
+
+
+def _format_cell(value):
+    import pandas as pd
+    if pd.isna(value):
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    return " ".join(str(value).split())
+
+
+def format_sheet(sheet_name, df, max_rows=XLSX_MAX_ROWS):
+    """
+    Renders a sheet compactly for prompts: a schema line, up to `max_rows` rows as CSV and, when
+    rows are left out, per-column numeric summaries of the whole sheet.
+    """
+    import csv
+    import pandas as pd
+    df = df.dropna(how="all").dropna(axis=1, how="all")
+    if df.empty:
+        return f"\n--- Sheet: {sheet_name} (empty) ---\n"
+
+    header_row = _find_header_row(df)
+    if header_row is None:
+        headers = [f"Column {i + 1}" for i in range(df.shape[1])]
+    else:
+        headers = [str(h).strip() if pd.notna(h) else f"Column {i + 1}" for i, h in enumerate(df.iloc[header_row])]
+        df = df.iloc[header_row + 1:]
+    headers = _unique_headers(headers)
+    df.columns = headers
+    df = df.infer_objects()
+
+    column_types = []
+    for name in headers:
+        column = df[name]
+        if pd.api.types.is_numeric_dtype(column):
+            column_types.append((name, "number"))
+        elif pd.api.types.is_datetime64_any_dtype(column):
+            column_types.append((name, "date"))
+        else:
+            column_types.append((name, "text"))
+
+    out = io.StringIO()
+    out.write(f"\n--- Sheet: {sheet_name} ({len(df):,} rows x {len(headers)} columns) ---\n")
+    out.write("Columns: " + ", ".join(f"{name} ({kind})" for name, kind in column_types) + "\n")
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(headers)
+    for row in df.head(max_rows).itertuples(index=False):
+        writer.writerow([_format_cell(v) for v in row])
+
+    if len(df) > max_rows:
+        out.write(f"... {len(df) - max_rows:,} more rows not shown\n")
+        for name, kind in column_types:
+            if kind == "number" and df[name].notna().any():
+                column = df[name]
+                out.write(f"{name}: min {column.min():g}, max {column.max():g}, mean {column.mean():g}, sum {column.sum():g}\n")
+            elif kind == "text":
+                distinct = df[name].nunique()
+                if 0 < distinct <= 20:
+                    top = df[name].value_counts().head(5)
+                    out.write(f"{name}: {distinct} distinct values, most common " + ", ".join(f"{v} ({n})" for v, n in top.items()) + "\n")
+    return out.getvalue()
+
+
+def iter_txt(data):
+    yield "text", data.decode("utf-8") + "\n"
+
+
+def get_extractor(mime_type):
+    if mime_type == PDF_TYPE:
+        return iter_pdf
+    if mime_type == DOCX_TYPE:
+        return iter_docx
+    if mime_type == PPTX_TYPE:
+        return iter_pptx
+    if mime_type in XLSX_TYPES:
+        return iter_xlsx
+    if mime_type == TEXT_TYPE:
+        return iter_txt
+    return None
+
+
+# --- CORPUS ---
+class Corpus:
+    """
+    The extracted text of a set of uploads as an ordered sequence of TextChunks.
+    Text is appended to a spooled temporary file that moves to disk once it outgrows
+    `spool_bytes`, so a session holds only the chunk index in memory however large the
+    upload. Chunks are read back lazily.
+    `normalizer(pieces)`, if given, rewrites each file's (locator, text) pieces as the file is added
+    and `block_filter(source, locator, text)` each chunk's text.
+    Background jobs read a session's corpus while the script thread may still append to it, so
+    the spool file's shared seek position is only used under a lock.
+    """
+
+    def __init__(self, spool_bytes=CORPUS_SPOOL_BYTES, normalizer=None, block_filter=None):
+        self.normalizer = normalizer
+        self.block_filter = block_filter
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode="w+b", prefix="ida_corpus_")
+        self._lock = threading.Lock()
+        self._index = []  # (source, locator, offset, byte_start, byte_length, tokens)
+        self._source_offsets = {}
+        self._size = 0
+        self._has_text = False
+        self.tokens = 0
+
+    def extend(self, source, pieces):
+        """Appends the (locator, text) pieces of one file."""
+        if self.normalizer is not None:
+            pieces = self.normalizer(pieces)
+        for locator, text in pieces:
+            self.append(source, locator, text)
+
+    def append(self, source, locator, text):
+        if self.block_filter is not None:
+            text = self.block_filter(source, locator, text)
+        data = text.encode("utf-8")
+        tokens = count_tokens(text)
+        with self._lock:
+            self._buffer.seek(0, io.SEEK_END)
+            self._buffer.write(data)
+            offset = self._source_offsets.get(source, 0)
+            self._source_offsets[source] = offset + len(text)
+            # Indexed only once its bytes are written, so readers never see a chunk they can't read
+            self._index.append((source, locator, offset, self._size, len(data), tokens))
+            self._size += len(data)
+            self.tokens += tokens
+        self._has_text = self._has_text or bool(text.strip())
+
+    def __iter__(self):
+        for source, locator, offset, start, length, _ in self._index:
+            yield TextChunk(source, locator, offset, self._read_bytes(start, length))
+
+    def chunk(self, i):
+        source, locator, offset, start, length, _ = self._index[i]
+        return TextChunk(source, locator, offset, self._read_bytes(start, length))
+
+    def _read_bytes(self, start, length):
+        with self._lock:
+            self._buffer.seek(start)
+            return self._buffer.read(length).decode("utf-8")
+
+    def __len__(self):
+        return len(self._index)
+
+    def __bool__(self):
+        return self._has_text
+
+    @property
+    def size_bytes(self):
+        return self._size
+
+    @property
+    def spilled(self):
+        return bool(getattr(self._buffer, "_rolled", False))
+
+    def read(self, max_tokens=None):
+        """
+        Returns (text, omitted_tokens): the chunks that fit in `max_tokens` (the chunk that crosses
+        the limit is included whole, for the prompt budget to trim) and the tokens left out.
+        """
+        parts, used = [], 0
+        for _, _, _, start, length, tokens in self._index:
+            if max_tokens is not None and used >= max_tokens:
+                return "".join(parts), self.tokens - used
+            parts.append(self._read_bytes(start, length))
+            used += tokens
+        return "".join(parts), 0
+
+    def windows(self, max_tokens):
+        """Yields the text in consecutive pieces of at most `max_tokens`, split between chunks where possible."""
+        parts, used = [], 0
+        for _, _, _, start, length, tokens in self._index:
+            if parts and used + tokens > max_tokens:
+                yield "".join(parts)
+                parts, used = [], 0
+            if tokens > max_tokens:
+                yield from split_to_tokens(self._read_bytes(start, length), max_tokens)
+                continue
+            parts.append(self._read_bytes(start, length))
+            used += tokens
+        if parts:
+            yield "".join(parts)
+
+    def text(self):
+        return self.read()[0]
+
+
+# --- CACHE ---
+def content_key(mime_type, data):
+    """Content hash of an uploaded file; renaming or re-uploading the same file keeps its key."""
+    digest = hashlib.sha256(mime_type.encode("utf-8"))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Extracted (locator, text) pieces keyed by content hash.
+    Keeps up to `max_bytes` of text in memory (least recently used evicted first) and, when
+    `cache_dir` is set, also stores every entry on disk so it survives server restarts.
+    """
+
+    def __init__(self, max_bytes=EXTRACT_CACHE_MAX_BYTES, cache_dir=EXTRACT_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (pieces, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        pieces = self._read_disk(key)
+        with self._lock:
+            if pieces is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, pieces)
+        return pieces
+
+    def set(self, key, pieces):
+        self._remember(key, pieces)
+        self._write_disk(key, pieces)
+
+    def _remember(self, key, pieces):
+        size = sum(len(text) for _, text in pieces)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (pieces, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def _read_disk(self, key):
+        if not self.cache_dir or not os.path.exists(self._disk_path(key)):
+            return None
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                return [tuple(piece) for piece in json.load(f)]
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to read cached extraction '{key}': {e}")
+            return None
+
+    def _write_disk(self, key, pieces):
+        if not self.cache_dir:
+            return
+        tmp_path = f"{self._disk_path(key)}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(pieces, f, ensure_ascii=False)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            logging.error(f"Failed to cache extraction '{key}': {e}")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+
+# Shared across sessions so every user benefits from files already parsed on this server
+extraction_cache = ExtractionCache()
+
+
+# --- PROCESS POOL ---
+# Parsing is CPU-bound, so files (and page ranges of large PDFs) are parsed in worker processes.
+# Workers read the upload from a temporary file rather than having the bytes pickled per task.
+# Every extraction call gets its own pool, so a file that hangs a worker (which can only be
+# terminated, breaking its pool) never affects other sessions' uploads.
+TASK_POLL_SECONDS = 0.5
+MAX_REMEMBERED_FAILURES = 256
+# Content hash -> reason for files that failed to parse, so they aren't re-parsed on every upload
+# change. Timeouts aren't remembered: a file that was slow once may well be read the next time.
+_failures = OrderedDict()
+_failures_lock = threading.Lock()
+
+
+def _remember_failure(key, reason):
+    with _failures_lock:
+        _failures[key] = reason
+        _failures.move_to_end(key)
+        while len(_failures) > MAX_REMEMBERED_FAILURES:
+            _failures.popitem(last=False)
+
+
+_task_starts = None  # In a worker: the queue it reports (task id, pid, start time) on
+
+
+def _init_worker(task_starts):
+    global _task_starts
+    _task_starts = task_starts
+
+
+def _run_task(task_id, fn, *args):
+    _task_starts.put((task_id, os.getpid(), time.time()))
+    return fn(*args)
+
+
+class ExtractionRun:
+    """
+    The worker processes of one extraction call. Each task's time limit runs from when a worker
+    picks it up, and workers stuck on a task that ran out of time are terminated by close().
+    """
+
+    def __init__(self, workers):
+        context = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self._task_starts = context.SimpleQueue()
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                         initializer=_init_worker, initargs=(self._task_starts,))
+        self._futures = {}  # task id -> future
+        self._started = {}  # task id -> (pid, start time)
+        self._timed_out = set()
+
+    def submit(self, fn, *args):
+        task_id = len(self._futures)
+        future = self._pool.submit(_run_task, task_id, fn, *args)
+        self._futures[task_id] = future
+        future.task_id = task_id
+        return future
+
+    def _collect_starts(self):
+        while not self._task_starts.empty():
+            task_id, pid, started = self._task_starts.get()
+            self._started[task_id] = (pid, started)
+
+    def result(self, future, timeout=FILE_TIMEOUT_SECONDS):
+        """
+        The task's result, or FutureTimeoutError once it has run for `timeout` seconds, or when
+        it can't start because every worker is stuck on a task that already ran out of time.
+        """
+        while True:
+            try:
+                return future.result(timeout=TASK_POLL_SECONDS)
+            except FutureTimeoutError:
+                self._collect_starts()
+                started = self._started.get(future.task_id)
+                stuck = sum(not self._futures[t].done() for t in self._timed_out)
+                if (started and time.time() - started[1] > timeout) or (not started and stuck >= self.workers):
+                    self._timed_out.add(future.task_id)
+                    raise
+
+    def close(self):
+        # A worker can't be interrupted mid-task, only terminated
+        self._collect_starts()
+        for task_id, future in self._futures.items():
+            if not future.done() and task_id in self._started:
+                try:
+                    os.kill(self._started[task_id][0], signal.SIGTERM)
+                except OSError:
+                    pass  # Already exited
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_path(mime_type, path):
+    with open(path, "rb") as f:
+        return list(get_extractor(mime_type)(f.read()))
+
+
+def _extract_pdf_path(path, start, stop):
+    with open(path, "rb") as f:
+        return list(iter_pdf_pages(f, start, stop))
+
+
+def _pdf_page_count(data):
+    from PyPDF2 import PdfReader
+    return len(PdfReader(io.BytesIO(data)).pages)
+
+
+def _submit(run, mime_type, data):
+    """Writes the upload to a temporary file and submits its parsing tasks; returns (path, futures)."""
+    suffix = ".pdf" if mime_type == PDF_TYPE else ""
+    with tempfile.NamedTemporaryFile(prefix="ida_upload_", suffix=suffix, delete=False) as f:
+        f.write(data)
+        path = f.name
+    if mime_type == PDF_TYPE:
+        pages = _pdf_page_count(data)
+        ranges = [(start, min(start + PDF_PAGES_PER_TASK, pages)) for start in range(0, pages, PDF_PAGES_PER_TASK)]
+        return path, [run.submit(_extract_pdf_path, path, start, stop) for start, stop in ranges]
+    return path, [run.submit(_extract_path, mime_type, path)]
+
+
+# --- PUBLIC API ---
+def extract_file(mime_type, data, key=None):
+    """Returns the (locator, text) pieces of one file, parsing it only if its content hash isn't cached."""
+    key = key or content_key(mime_type, data)
+    pieces = extraction_cache.get(key)
+    if pieces is None:
+        extractor = get_extractor(mime_type)
+        pieces = list(extractor(data)) if extractor else []
+        extraction_cache.set(key, pieces)
+    return pieces
+
+
+def extract_uploaded_files(uploaded_files, on_progress=None, base=None):
+    """
+    Returns (keys, corpus, errors) for Streamlit uploads, with the corpus in upload order.
+    Files already seen are served from the cache, so on a rerun only new or changed files are
+    parsed. Files over the size limit, files that fail to parse and files with a parsing task
+    that runs longer than FILE_TIMEOUT_SECONDS are left out and reported in `errors`.
+    `base` is the (keys, corpus) of a previous call; when the uploads only add files after those,
+    the new files are appended to that corpus (and anything indexed over it) instead of a new one.
+    `on_progress(done, total, file_name)` is called as each file finishes.
+    """
+    keys = [content_key(f.type, f.getvalue()) for f in uploaded_files]
+    # Running headers and footers are stripped per file, and blocks repeated across files
+    # (e.g. two versions of a deck) are kept only once
+    corpus = Corpus(
+        normalizer=TextNormalizer() if NORMALIZE_ENABLED else None,
+        block_filter=NearDuplicateFilter() if DEDUP_ENABLED else None,
+    )
+    if base and keys[:len(base[0])] == list(base[0]):
+        corpus = base[1]
+        uploaded_files = uploaded_files[len(base[0]):]
+        if not uploaded_files:
+            return keys, corpus, []
+
+    errors, plans = [], []
+    run = None  # Started with the first file that needs parsing
+    for uploaded_file, key in zip(uploaded_files, keys[len(keys) - len(uploaded_files):]):
+        data = uploaded_file.getvalue()
+        pieces = extraction_cache.get(key)
+        plan = {"name": uploaded_file.name, "key": key, "pieces": pieces}
+        if pieces is not None:
+            pass
+        elif failure := _failures.get(key):
+            errors.append(f"{uploaded_file.name}: {failure}")
+        elif get_extractor(uploaded_file.type) is None:
+            pass
+        elif len(data) > MAX_FILE_BYTES:
+            errors.append(f"{uploaded_file.name}: larger than the {MAX_FILE_BYTES // (1024 * 1024)} MB limit, skipped.")
+        elif uploaded_file.type == TEXT_TYPE or EXTRACT_WORKERS == 0:
+            try:
+                plan["pieces"] = extract_file(uploaded_file.type, data, key)
+            except Exception as e:
+                _remember_failure(key, str(e))
+                errors.append(f"{uploaded_file.name}: {e}")
+        else:
+            try:
+                run = run or ExtractionRun(EXTRACT_WORKERS)
+                plan["path"], plan["futures"] = _submit(run, uploaded_file.type, data)
+            except Exception as e:
+                _remember_failure(key, str(e))
+                errors.append(f"{uploaded_file.name}: {e}")
+        plans.append(plan)
+
+    # Collect in upload order; each file's pieces go straight into the corpus
+    try:
+        for done, plan in enumerate(plans, start=1):
+            pieces = plan["pieces"]
+            if "futures" in plan:
+                try:
+                    pieces = [piece for f in plan["futures"] for piece in run.result(f)]
+                    extraction_cache.set(plan["key"], pieces)
+                except FutureTimeoutError:
+                    for f in plan["futures"]:
+                        f.cancel()
+                    errors.append(f"{plan['name']}: took longer than {FILE_TIMEOUT_SECONDS:.0f}s to read, skipped.")
+                except BrokenProcessPool:
+                    # A worker crashed; the file may not be at fault, so it isn't remembered as failed
+                    errors.append(f"{plan['name']}: the extraction worker stopped unexpectedly, skipped.")
+                except Exception as e:
+                    _remember_failure(plan["key"], str(e))
+                    errors.append(f"{plan['name']}: {e}")
+            corpus.extend(plan["name"], pieces or [])
+            if on_progress:
+                on_progress(done, len(plans), plan["name"])
+    finally:
+        for plan in plans:
+            if "path" in plan:
+                try:
+                    os.remove(plan["path"])
+                except OSError:
+                    pass
+        if run is not None:
+            run.close()
+    return keys, corpus, errors
@@ -0,0 +1,71 @@
+import logging
+import os
+from itertools import islice
+
+from src.openai_client import budget_prompt, gather_openai_responses, get_openai_response
+from src.prompts import build_gap_analysis_prompt, build_gap_map_prompt, build_gap_reduce_prompt
+
+logging.basicConfig(level=logging.INFO)
+
+# --- CONFIGURATION ---
+# Sources larger than MAP_REDUCE_MIN_TOKENS are reviewed in parts concurrently (map) and the
+# per-part notes merged into one gap list (reduce), instead of in one long request.
+MAP_REDUCE_MIN_TOKENS = int(os.getenv("IDA_GAP_MAP_REDUCE_MIN_TOKENS", 24000))
+MAP_CHUNK_TOKENS = int(os.getenv("IDA_GAP_CHUNK_TOKENS", 12000))
+MAP_CONCURRENCY = int(os.getenv("IDA_GAP_MAP_CONCURRENCY", 4))
+MAP_COMPLETION_TOKENS = 1000
+
+
+def analyze_gaps(context_summary, corpus, on_status=None):
+    """
+    Returns (analysis, warning) for the uploaded corpus; `warning` is None or a message about
+    content that was left out. `on_status(message)` reports which mode is running.
+    """
+    if corpus.tokens <= MAP_REDUCE_MIN_TOKENS:
+        if on_status:
+            on_status("Analyzing content gaps...")
+        plan = budget_prompt(lambda source: build_gap_analysis_prompt(context_summary, source), corpus)
+        warning = None
+        if plan.trimmed_tokens:
+            warning = f"The uploaded content is too long for {plan.model}; about {plan.trimmed_tokens:,} tokens were left out of the analysis."
+        return get_openai_response(plan.prompt, plan.max_completion_tokens, model=plan.model, step="gap_analysis"), warning
+    return map_reduce_gaps(context_summary, corpus, on_status)
+
+
+def map_reduce_gaps(context_summary, corpus, on_status=None):
+    # The corpus is read from its spool file one batch of windows at a time, so only
+    # MAP_CONCURRENCY parts are held in memory however large the upload
+    total = sum(1 for _ in corpus.windows(MAP_CHUNK_TOKENS))
+    if on_status:
+        on_status(f"Reviewing {total} parts of the content ({corpus.tokens:,} tokens)...")
+    windows = corpus.windows(MAP_CHUNK_TOKENS)
+    notes = []
+    while batch := list(islice(windows, MAP_CONCURRENCY)):
+        prompts = [build_gap_map_prompt(context_summary, window, len(notes) + i + 1, total) for i, window in enumerate(batch)]
+        del batch
+        notes.extend(gather_openai_responses(
+            prompts, max_completion_tokens=MAP_COMPLETION_TOKENS, concurrency=MAP_CONCURRENCY,
+            return_exceptions=True, step="gap_analysis_map"
+        ))
+        del prompts
+        if on_status and len(notes) < total:
+            on_status(f"Reviewed {len(notes)} of {total} parts of the content...")
+    failed = [i + 1 for i, note in enumerate(notes) if isinstance(note, Exception)]
+    if len(failed) == len(notes):
+        raise notes[0]
+    for part in failed:
+        logging.error(f"Gap analysis of part {part} failed: {notes[part - 1]}")
+
+    if on_status:
+        on_status("Merging the reviews into one gap list...")
+    findings = "\n\n".join(
+        f"### Part {i + 1}\n{note}" for i, note in enumerate(notes) if not isinstance(note, Exception)
+    )
+    plan = budget_prompt(lambda source: build_gap_reduce_prompt(context_summary, source), findings)
+    analysis = get_openai_response(plan.prompt, plan.max_completion_tokens, model=plan.model, step="gap_analysis_reduce")
+    warning = None
+    if failed:
+        warning = f"Parts {', '.join(map(str, failed))} of {len(notes)} could not be reviewed and were left out of the analysis."
+    elif plan.trimmed_tokens:
+        warning = f"The part reviews were too long for {plan.model}; about {plan.trimmed_tokens:,} tokens were left out when merging them."
+    return analysis, warning
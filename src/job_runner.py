@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from src.db_manager import create_job, get_job, init_jobs_table, mark_interrupted_jobs, update_job
+from src.util import snapshot_session_settings, use_session_settings
+
+logging.basicConfig(level=logging.INFO)
+
+# --- CONFIGURATION ---
+# Long LLM steps run on a small thread pool so a Streamlit rerun (any widget click) neither
+# blocks on them nor restarts them. Job state is kept in memory while the job runs and written
+# to the jobs table every SAVE_INTERVAL_SECONDS and when it finishes.
+JOB_WORKERS = int(os.getenv("IDA_JOB_WORKERS", 4))
+SAVE_INTERVAL_SECONDS = float(os.getenv("IDA_JOB_SAVE_INTERVAL_SECONDS", 2))
+POLL_SECONDS = float(os.getenv("IDA_JOB_POLL_SECONDS", 1))
+# Streamed text is published as the partial result at most this often (the page polls every POLL_SECONDS)
+PARTIAL_INTERVAL_SECONDS = float(os.getenv("IDA_JOB_PARTIAL_INTERVAL_SECONDS", 0.25))
+
+FINISHED_STATUSES = ("done", "failed", "interrupted")
+
+
+class JobContext:
+    """Handed to a job function to report progress and partial results while it runs."""
+
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+
+    def progress(self, fraction=None, message=None):
+        fields = {}
+        if fraction is not None:
+            fields["progress"] = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            fields["message"] = message
+        self.runner._update(self.job_id, **fields)
+
+    def partial(self, text):
+        # The text produced so far, e.g. the accumulated deltas of a streamed response
+        self.runner._update(self.job_id, partial_result=text)
+
+
+class JobRunner:
+    def __init__(self, workers=JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ida-job")
+        self._lock = threading.Lock()
+        self._live = {}  # job_id -> job dict, while the job is queued or running
+        self._saved_at = {}
+        init_jobs_table()
+        # Worker threads do not outlive the server, so jobs it left running can never finish
+        interrupted = mark_interrupted_jobs()
+        if interrupted:
+            logging.info(f"Marked {interrupted} jobs from a previous run as interrupted.")
+
+    def submit(self, kind, fn, *args, user_id=None, **kwargs):
+        """
+        Runs `fn(job, *args, **kwargs)` in the background, where `job` is a JobContext, and
+        returns the job id. The return value of `fn` must be JSON serializable and becomes the
+        job's result.
+        """
+        job_id = uuid.uuid4().hex
+        create_job(job_id, kind, user_id)
+        with self._lock:
+            self._live[job_id] = {
+                "id": job_id, "user_id": user_id, "kind": kind, "status": "queued", "progress": 0.0,
+                "message": None, "partial_result": None, "result": None, "error": None,
+            }
+        # The model selection etc. are read now, while the submitting session is at hand
+        self._executor.submit(self._run, job_id, snapshot_session_settings(), fn, args, kwargs)
+        return job_id
+
+    def get(self, job_id):
+        """The job as a dict (see db_manager.get_job) with `result` decoded, or None."""
+        with self._lock:
+            job = dict(self._live[job_id]) if job_id in self._live else None
+        if job is None:
+            job = get_job(job_id)
+            if job and job["result"] is not None:
+                job["result"] = json.loads(job["result"])
+        return job
+
+    def _run(self, job_id, settings, fn, args, kwargs):
+        self._update(job_id, status="running")
+        try:
+            with use_session_settings(settings):
+                result = fn(JobContext(self, job_id), *args, **kwargs)
+            json.dumps(result)  # Fail the job here rather than when it is saved
+            self._finish(job_id, status="done", progress=1.0, result=result)
+        except Exception as e:
+            logging.exception(f"Job {job_id} failed")
+            self._finish(job_id, status="failed", error=str(e))
+
+    def _update(self, job_id, **fields):
+        now = time.monotonic()
+        with self._lock:
+            job = self._live.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            if "status" not in fields and now - self._saved_at.get(job_id, 0) < SAVE_INTERVAL_SECONDS:
+                return
+            self._saved_at[job_id] = now
+            snapshot = {name: job[name] for name in ("status", "progress", "message", "partial_result")}
+        update_job(job_id, **snapshot)
+
+    def _finish(self, job_id, result=None, **fields):
+        with self._lock:
+            job = dict(self._live.get(job_id, {}))
+        # Written before the job leaves memory so get() never sees it half-finished
+        update_job(job_id, result=json.dumps(result) if result is not None else None,
+                   partial_result=job.get("partial_result"), message=job.get("message"), **fields)
+        with self._lock:
+            self._live.pop(job_id, None)
+            self._saved_at.pop(job_id, None)
+
+
+def collect_stream(job, chunks):
+    """
+    Joins a stream of text deltas, publishing the text so far as the job's partial result every
+    PARTIAL_INTERVAL_SECONDS rather than on every delta, which would re-join the text each time.
+    """
+    parts = []
+    published_at = time.monotonic()
+    for delta in chunks:
+        parts.append(delta)
+        now = time.monotonic()
+        if now - published_at >= PARTIAL_INTERVAL_SECONDS:
+            job.partial("".join(parts))
+            published_at = now
+    text = "".join(parts)
+    job.partial(text)
+    return text.strip()
+
+
+job_runner = JobRunner()
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# --- CONFIGURATION ---
+CACHE_DB_FILE = os.getenv("IDA_LLM_CACHE_DB", "llm_cache.db")
+CACHE_TTL_SECONDS = int(os.getenv("IDA_LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))  # One week
+CACHE_MAX_BYTES = int(os.getenv("IDA_LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))  # 256 MB
+logging.basicConfig(level=logging.INFO)
+
+
+def make_cache_key(model, system_message, prompt, max_completion_tokens, n, response_format=None):
+    """Returns a content-addressed key for a chat completion request."""
+    request = [model, system_message, prompt, max_completion_tokens, n]
+    if response_format is not None:
+        request.append(response_format)  # Unstructured requests keep their existing keys
+    payload = json.dumps(
+        request,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Disk-backed (SQLite) cache of OpenAI responses.
+    Entries expire after `ttl_seconds` and the least recently used entries are evicted
+    once the stored responses exceed `max_bytes`.
+    """
+
+    def __init__(self, db_file=CACHE_DB_FILE, ttl_seconds=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES):
+        self.db_file = db_file
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    hit_count INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses (last_accessed)")
+            self._initialized = True
+        return conn
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, cache_key):
+        """Returns the cached list of responses for `cache_key`, or None on a miss."""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value, created_at FROM responses WHERE cache_key = ?", (cache_key,)).fetchone()
+                if row is None:
+                    self._count(hit=False)
+                    return None
+                value, created_at = row
+                if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                    conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+                    self._count(hit=False)
+                    return None
+                conn.execute("UPDATE responses SET last_accessed = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                             (now, cache_key))
+            self._count(hit=True)
+            return json.loads(value)
+        except sqlite3.Error as e:
+            logging.error(f"LLM cache lookup failed: {e}")
+            self._count(hit=False)
+            return None
+
+    def set(self, cache_key, model, responses):
+        """Stores `responses` under `cache_key` and evicts old entries if the cache is over budget."""
+        value = json.dumps(responses, ensure_ascii=False)
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO responses (cache_key, model, value, size, created_at, last_accessed, hit_count)
+                    VALUES (?, ?, ?, ?, ?, ?, 0)
+                ''', (cache_key, model, value, len(value.encode("utf-8")), now, now))
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logging.error(f"LLM cache write failed: {e}")
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        excess = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for cache_key, size in conn.execute("SELECT cache_key, size FROM responses ORDER BY last_accessed ASC"):
+            stale_keys.append((cache_key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM responses WHERE cache_key = ?", stale_keys)
+        logging.info(f"LLM cache evicted {len(stale_keys)} entries ({freed} bytes).")
+
+    def stats(self):
+        """Returns hit/miss counters for this process plus the size of the persistent cache."""
+        entries, total_bytes = 0, 0
+        try:
+            with self._connect() as conn:
+                entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"LLM cache stats failed: {e}")
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+    def clear(self):
+        """Removes every cached response."""
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses")
+        except sqlite3.Error as e:
+            logging.error(f"LLM cache clear failed: {e}")
@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from src.llm_cache import make_cache_key
+from src.token_budget import count_tokens
+
+logging.basicConfig(level=logging.INFO)
+
+# --- CONFIGURATION ---
+# IDA_MOCK_LLM selects the stand-in used by src/openai_client.py instead of the live API:
+#   "synth"  - synthesize deterministic responses
+#   "replay" - answer from recorded responses (synthesizing on a miss unless IDA_MOCK_LLM_STRICT=1)
+#   "record" - call the live API and record every response for later replay
+MOCK_MODE = os.getenv("IDA_MOCK_LLM", "").lower()
+RECORDINGS_FILE = os.getenv("IDA_MOCK_LLM_RECORDINGS", "llm_recordings.jsonl")
+STRICT_REPLAY = os.getenv("IDA_MOCK_LLM_STRICT", "0") == "1"
+LATENCY_SECONDS = float(os.getenv("IDA_MOCK_LLM_LATENCY", "0.3"))  # Time to first token
+TOKENS_PER_SECOND = float(os.getenv("IDA_MOCK_LLM_TOKENS_PER_SECOND", "150"))  # 0 means instant
+SYNTH_COMPLETION_TOKENS = int(os.getenv("IDA_MOCK_LLM_SYNTH_TOKENS", "400"))
+
+WORDS = (
+    "learner module course objective practice scenario feedback assessment review concept skill "
+    "example summary activity outcome knowledge check interaction content principle process task"
+).split()
+
+
+def completion_limit(body):
+    # max_completion_tokens, or max_tokens in requests recorded before the switch to it
+    return body.get("max_completion_tokens", body.get("max_tokens"))
+
+
+def request_key(body):
+    """Keys a chat completion request the same way the response cache does."""
+    messages = body.get("messages", [])
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    prompt = "\n".join(m["content"] for m in messages if m.get("role") != "system")
+    return make_cache_key(body.get("model"), system, prompt, completion_limit(body), body.get("n", 1),
+                          body.get("response_format"))
+
+
+def synthesize_json(schema, budget, rng):
+    """Filler matching a JSON schema; arrays of objects grow until about `budget` words are written."""
+    used = 0
+
+    def value(node, fill=False):
+        nonlocal used
+        if node.get("type") == "object":
+            return {name: value(prop, fill) for name, prop in node.get("properties", {}).items()}
+        if node.get("type") == "array":
+            items = node.get("items", {})
+            if fill and items.get("type") == "object":
+                rows = [value(items)]
+                while used < budget:
+                    rows.append(value(items))
+                return rows
+            return [value(items) for _ in range(rng.randint(3, 4))]
+        if node.get("type") in ("integer", "number"):
+            return rng.randint(1, 30)
+        words = rng.randint(3, 12)
+        used += words
+        return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+    return json.dumps(value(schema, fill=True))
+
+
+def synthesize_text(prompt, max_tokens, seed, response_format=None):
+    """
+    Deterministic filler text; JSON-schema response formats get matching JSON and prompts that
+    ask for a pipe table get a table with the requested columns.
+    """
+    rng = random.Random(seed)
+    budget = min(max_tokens or SYNTH_COMPLETION_TOKENS, SYNTH_COMPLETION_TOKENS)
+    if response_format and response_format.get("type") == "json_schema":
+        return synthesize_json(response_format["json_schema"]["schema"], budget, rng)
+    match = re.search(r"columns?:\s*([^\n]+?\|[^\n]+?)(?:\.|\n|$)", prompt)
+    if not match:
+        return " ".join(rng.choice(WORDS) for _ in range(budget)).capitalize() + "."
+    headers = [h.strip(" *") for h in match.group(1).split("|") if h.strip(" *")]
+    lines = [" | ".join(headers), " | ".join("---" for _ in headers)]
+    used = 0
+    while used < budget:
+        cells = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))).capitalize() for _ in headers]
+        lines.append(" | ".join(cells))
+        used += sum(len(c.split()) for c in cells)
+    return "\n".join(lines)
+
+
+class Recordings:
+    """Recorded responses keyed by request hash, persisted as JSONL."""
+
+    def __init__(self, path=RECORDINGS_FILE):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry["responses"]
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def add(self, key, model, responses):
+        with self._lock:
+            self._entries[key] = responses
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "model": model, "responses": responses}) + "\n")
+
+
+class MockLLMTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    httpx transport that stands in for the OpenAI chat completions endpoint.
+    Inject it through openai.OpenAI(http_client=httpx.Client(transport=...)); both the sync and
+    async clients are supported, with and without stream=True.
+    """
+
+    def __init__(self, mode="synth", recordings=None, latency_s=LATENCY_SECONDS,
+                 tokens_per_second=TOKENS_PER_SECOND, strict=STRICT_REPLAY):
+        self.mode = mode
+        self.recordings = recordings if recordings is not None else Recordings()
+        self.latency_s = latency_s
+        self.tokens_per_second = tokens_per_second
+        self.strict = strict
+        self._upstream = httpx.HTTPTransport() if mode == "record" else None
+        self._async_upstream = httpx.AsyncHTTPTransport() if mode == "record" else None
+
+    # --- Building responses ---
+    def _responses_for(self, body):
+        key = request_key(body)
+        responses = self.recordings.get(key) if self.mode == "replay" else None
+        if responses is None:
+            if self.mode == "replay" and self.strict:
+                return None
+            prompt = body["messages"][-1]["content"]
+            responses = [synthesize_text(prompt, completion_limit(body), f"{key}:{i}", body.get("response_format"))
+                         for i in range(body.get("n", 1))]
+        return responses
+
+    def _usage(self, body, responses):
+        prompt_tokens = sum(count_tokens(m["content"]) for m in body.get("messages", []))
+        completion_tokens = sum(count_tokens(r) for r in responses)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _completion(self, body, responses):
+        return {
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": i, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}
+                        for i, text in enumerate(responses)],
+            "usage": self._usage(body, responses),
+        }
+
+    def _sse_events(self, body, text):
+        # Yields (seconds_to_wait, sse_bytes); words are streamed a few at a time
+        words = re.findall(r"\S+\s*", text)
+        base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model")}
+        first = True
+        for i in range(0, len(words), 4):
+            piece = "".join(words[i:i + 4])
+            delay = self.latency_s if first else self._generation_time(piece)
+            first = False
+            chunk = dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            yield delay, f"data: {json.dumps(chunk)}\n\n".encode()
+        yield 0, f"data: {json.dumps(dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))}\n\n".encode()
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield 0, f"data: {json.dumps(dict(base, choices=[], usage=self._usage(body, [text])))}\n\n".encode()
+        yield 0, b"data: [DONE]\n\n"
+
+    def _generation_time(self, text):
+        return count_tokens(text) / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _error(self, status, message):
+        return httpx.Response(status, json={"error": {"message": message, "type": "mock_error", "code": None}})
+
+    # --- Recording ---
+    def _record(self, body, response):
+        if response.status_code != 200:
+            return
+        if body.get("stream"):
+            parts = []
+            for line in response.text.splitlines():
+                if line.startswith("data: ") and line != "data: [DONE]":
+                    for choice in json.loads(line[6:]).get("choices", []):
+                        parts.append(choice.get("delta", {}).get("content") or "")
+            responses = ["".join(parts).strip()]
+        else:
+            responses = [c["message"]["content"].strip() for c in response.json()["choices"]]
+        self.recordings.add(request_key(body), body.get("model"), responses)
+
+    def _passthrough(self, response):
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+        return httpx.Response(response.status_code, headers=headers, content=response.content)
+
+    # --- httpx transport API ---
+    def handle_request(self, request):
+        if not request.url.path.endswith("/chat/completions"):
+            return self._error(404, f"The mock LLM does not implement {request.url.path}.")
+        body = json.loads(request.read())
+        if self.mode == "record":
+            response = self._upstream.handle_request(request)
+            response.read()
+            self._record(body, response)
+            return self._passthrough(response)
+        responses = self._responses_for(body)
+        if responses is None:
+            return self._error(404, "No recorded response for this request.")
+        if body.get("stream"):
+            def events():
+                for delay, event in self._sse_events(body, responses[0]):
+                    time.sleep(delay)
+                    yield event
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=events())
+        time.sleep(self.latency_s + sum(self._generation_time(r) for r in responses))
+        return httpx.Response(200, json=self._completion(body, responses))
+
+    async def handle_async_request(self, request):
+        if not request.url.path.endswith("/chat/completions"):
+            return self._error(404, f"The mock LLM does not implement {request.url.path}.")
+        body = json.loads(await request.aread())
+        if self.mode == "record":
+            response = await self._async_upstream.handle_async_request(request)
+            await response.aread()
+            self._record(body, response)
+            return self._passthrough(response)
+        responses = self._responses_for(body)
+        if responses is None:
+            return self._error(404, "No recorded response for this request.")
+        if body.get("stream"):
+            async def events():
+                for delay, event in self._sse_events(body, responses[0]):
+                    await asyncio.sleep(delay)
+                    yield event
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=events())
+        await asyncio.sleep(self.latency_s + sum(self._generation_time(r) for r in responses))
+        return httpx.Response(200, json=self._completion(body, responses))
+
+
+def get_mock_transport():
+    """Returns the transport selected by IDA_MOCK_LLM, or None to use the live API."""
+    if MOCK_MODE not in ("synth", "replay", "record"):
+        return None
+    logging.info(f"Using the mock LLM transport in '{MOCK_MODE}' mode.")
+    return MockLLMTransport(mode=MOCK_MODE)
+
+
+def mock_client_options(transport, async_client=False):
+    """Keyword arguments for openai.OpenAI/AsyncOpenAI that route requests through `transport`."""
+    if transport is None:
+        return {}
+    client_class = httpx.AsyncClient if async_client else httpx.Client
+    return {
+        "api_key": os.getenv("OPENAI_API_KEY") or "mock-key",
+        "http_client": client_class(transport=transport, timeout=600),
+    }
+
+
+# --- STANDALONE SERVER ---
+def serve(host="127.0.0.1", port=8900, mode="synth"):
+    """Runs an OpenAI-compatible HTTP server; point any client at it with OPENAI_BASE_URL=http://host:port/v1."""
+    transport = MockLLMTransport(mode=mode)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("content-length", 0)))
+            request = httpx.Request("POST", f"https://api.openai.com{self.path}", headers=dict(self.headers), content=body)
+            response = transport.handle_request(request)
+            streaming = response.headers.get("content-type", "").startswith("text/event-stream")
+            self.send_response(response.status_code)
+            self.send_header("content-type", response.headers.get("content-type", "application/json"))
+            if streaming:
+                self.send_header("transfer-encoding", "chunked")
+                self.end_headers()
+                for event in response.iter_bytes():
+                    self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            else:
+                payload = response.read()
+                self.send_header("content-length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logging.info(f"Mock LLM serving on http://{host}:{port}/v1 in '{mode}' mode.")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the IDA mock LLM as an OpenAI-compatible HTTP server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--mode", choices=["synth", "replay"], default="synth")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.mode)
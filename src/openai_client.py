@@ -1,6 +1,15 @@
+import asyncio
 import os
+import threading
+import time
 import openai
-from src.util import get_selected_model 
+from src.util import get_selected_model, get_step_name, is_auto_route_enabled
+from src.llm_cache import ResponseCache, make_cache_key
+from src.prompts import SYSTEM_MESSAGE, combine_content
+from src.token_budget import is_reasoning_model, plan_prompt, source_token_limit
+from src.rate_limiter import call_with_retry, call_with_retry_async, estimate_tokens, rate_limiter
+from src.telemetry import telemetry
+from src.mock_llm import get_mock_transport, mock_client_options
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 """
@@ -50,25 +59,361 @@ model_dict = {
     "5-n" : "gpt-5-nano"
 }
 
-def get_openai_response(prompt, max_completion_tokens=3500):
-    return get_openai_multi_response(prompt, max_completion_tokens, n=1)[0]
+def _chat_messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
 
-# Create a single OpenAI client instance to be reused
-openai_client = openai.OpenAI()
+# Persistent response cache shared by every session in this process
+response_cache = ResponseCache()
 
-def get_openai_multi_response(prompt, max_completion_tokens=3500, n=3):
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    # Coalesces concurrent identical requests: the first caller for a key (the leader) makes
+    # the upstream call and every caller that arrives while it is in flight receives its result.
+    # This covers the window before a response lands in the response cache.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}  # Only touched from the managed event loop
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+
+    def begin(self, key):
+        # Returns (call, is_leader); the leader must call finish() when it is done
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced_calls += 1
+                return call, False
+            call = _InFlightCall()
+            self._calls[key] = call
+            self.upstream_calls += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    def wait(self, call):
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight_async(self, key):
+        return key in self._async_calls
+
+    async def do_async(self, key, fn):
+        task = self._async_calls.get(key)
+        with self._lock:
+            if task is not None:
+                self.coalesced_calls += 1
+            else:
+                self.upstream_calls += 1
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._async_calls[key] = task
+            task.add_done_callback(lambda _: self._async_calls.pop(key, None))
+        # Shield the shared call so one waiter being cancelled doesn't cancel it for the others
+        return await asyncio.shield(task)
+
+    def stats(self):
+        with self._lock:
+            return {"upstream_calls": self.upstream_calls, "coalesced_calls": self.coalesced_calls}
+
+single_flight = SingleFlight()
+
+def get_openai_response(prompt, max_completion_tokens=3500, use_cache=True, model=None, step=None, response_format=None):
+    return get_openai_multi_response(prompt, max_completion_tokens, n=1, use_cache=use_cache, model=model, step=step,
+                                     response_format=response_format)[0]
+
+def budget_prompt(build_prompt, source, max_completion_tokens=3500, generated_content=""):
+    # Fit a prompt built around a (possibly huge) source section to the selected model.
+    # With auto-routing enabled the cheapest model that fits is chosen, otherwise the source is trimmed.
+    # `source` is text or an extraction Corpus; a Corpus is only read as far as the largest context
+    # window the prompt could go to, and `generated_content` is appended after it.
+    # Returns a PromptPlan; pass plan.model / plan.max_completion_tokens on to the client.
+    model = get_selected_model(model_dict)
+    candidates = [m for m in model_dict.values() if not is_reasoning_model(m)] if is_auto_route_enabled() else None
+    omitted_tokens = 0
+    if not isinstance(source, str):
+        source, omitted_tokens = source.read(max_tokens=source_token_limit([model] + (candidates or []), max_completion_tokens))
+    if generated_content:
+        source = combine_content(source, generated_content)
+    plan = plan_prompt(build_prompt, source, max_completion_tokens, model, candidates)
+    plan.trimmed_tokens += omitted_tokens
+    return plan
+
+# Set IDA_MOCK_LLM (see src/mock_llm.py) to run against a local stand-in instead of the live API
+mock_transport = get_mock_transport()
+
+# Create a single OpenAI client instance to be reused.
+# Retries are handled by src.rate_limiter, so the SDK's own retry loop is disabled.
+openai_client = openai.OpenAI(max_retries=0, **mock_client_options(mock_transport))
+
+def _format_options(response_format):
+    # e.g. a src.schemas TableSchema.response_format() to get schema-constrained JSON back
+    return {"response_format": response_format} if response_format is not None else {}
+
+def _reserved_tokens(prompt, max_completion_tokens, n=1):
+    # OpenAI counts the prompt plus the requested completion budget against the TPM limit
+    return estimate_tokens(SYSTEM_MESSAGE + prompt) + max_completion_tokens * n
+
+def _record_usage(model, reserved, response):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        rate_limiter.record_usage(model, reserved, usage.total_tokens)
+
+def _usage_fields(response):
+    # Token counts for telemetry, including prompt tokens served from OpenAI's prompt cache
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+    }
+
+def _fetch_multi_response(cache_key, model, prompt, max_completion_tokens, n, step, response_format=None):
+    reserved = _reserved_tokens(prompt, max_completion_tokens, n)
+    started = time.perf_counter()
+    try:
+        response = call_with_retry(
+            lambda: openai_client.chat.completions.create(
+                model=model,
+                messages=_chat_messages(prompt),
+                max_completion_tokens=max_completion_tokens,
+                n=n,
+                **_format_options(response_format)
+            ),
+            model, reserved
+        )
+        _record_usage(model, reserved, response)
+        responses = [choice.message.content.strip() for choice in response.choices]
+    except Exception as e:
+        telemetry.record(step, model, "api", latency_s=time.perf_counter() - started, error=str(e))
+        raise RuntimeError(f"An error occurred while communicating with OpenAI: {e}")
+    telemetry.record(step, model, "api", latency_s=time.perf_counter() - started, **_usage_fields(response))
+    response_cache.set(cache_key, model, responses)
+    return responses
+
+def get_openai_multi_response(prompt, max_completion_tokens=3500, n=3, use_cache=True, model=None, step=None,
+                              response_format=None):
+    # Pass use_cache=False to force a fresh completion (the new result still refreshes the cache)
+    # `step` labels the call in telemetry; it defaults to the current workflow step.
+    model = model or get_selected_model(model_dict)  # Dynamically fetch the selected model
+    step = step or get_step_name()
+    cache_key = make_cache_key(model, SYSTEM_MESSAGE, prompt, max_completion_tokens, n, response_format)
+    started = time.perf_counter()
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            telemetry.record(step, model, "cache", latency_s=time.perf_counter() - started)
+            return cached
+    call, is_leader = single_flight.begin(cache_key)
+    if not is_leader:
+        responses = single_flight.wait(call)
+        telemetry.record(step, model, "coalesced", latency_s=time.perf_counter() - started)
+        return responses
+    try:
+        responses = _fetch_multi_response(cache_key, model, prompt, max_completion_tokens, n, step, response_format)
+    except BaseException as e:
+        single_flight.finish(cache_key, call, error=e)
+        raise
+    single_flight.finish(cache_key, call, result=responses)
+    return responses
+
+def stream_openai_response(prompt, max_completion_tokens=3500, use_cache=True, model=None, step=None, response_format=None):
+    # Generator variant of get_openai_response: yields text deltas as they arrive.
+    # A cached response is yielded in one piece; the streamed result is cached once complete.
+    model = model or get_selected_model(model_dict)
+    step = step or get_step_name()
+    cache_key = make_cache_key(model, SYSTEM_MESSAGE, prompt, max_completion_tokens, 1, response_format)
+    started = time.perf_counter()
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            telemetry.record(step, model, "cache", latency_s=time.perf_counter() - started, streamed=True)
+            yield cached[0]
+            return
+    call, is_leader = single_flight.begin(cache_key)
+    if not is_leader:
+        # An identical request is already in flight; hand over its result once it lands
+        responses = single_flight.wait(call)
+        telemetry.record(step, model, "coalesced", latency_s=time.perf_counter() - started, streamed=True)
+        yield responses[0]
+        return
+    parts = []
+    reserved = _reserved_tokens(prompt, max_completion_tokens)
+    responses = None
+    usage = {}
+    first_token_at = None
     try:
-        model = get_selected_model(model_dict)  # Dynamically fetch the selected model
-        response = openai_client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a professional instructional design assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=max_completion_tokens,
-            n=n,
-            stop=None
+        # Only opening the stream is retried; a failure mid-stream surfaces to the caller
+        stream = call_with_retry(
+            lambda: openai_client.chat.completions.create(
+                model=model,
+                messages=_chat_messages(prompt),
+                max_completion_tokens=max_completion_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                **_format_options(response_format)
+            ),
+            model, reserved
         )
-        return [choice.message.content.strip() for choice in response.choices]
+        for chunk in stream:
+            if chunk.usage is not None:
+                _record_usage(model, reserved, chunk)
+                usage = _usage_fields(chunk)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(delta)
+                yield delta
+        responses = ["".join(parts).strip()]
     except Exception as e:
-        raise RuntimeError(f"An error occurred while communicating with OpenAI: {e}")
\ No newline at end of file
+        telemetry.record(step, model, "api", latency_s=time.perf_counter() - started, streamed=True, error=str(e))
+        raise RuntimeError(f"An error occurred while communicating with OpenAI: {e}")
+    finally:
+        if responses is None:
+            single_flight.finish(cache_key, call, error=RuntimeError("The shared OpenAI stream did not complete."))
+    finished = time.perf_counter()
+    telemetry.record(step, model, "api", latency_s=finished - started,
+                     ttft_s=(first_token_at or finished) - started, streamed=True, **usage)
+    response_cache.set(cache_key, model, responses)
+    single_flight.finish(cache_key, call, result=responses)
+
+# --- ASYNC CLIENT ---
+# Async companion API for steps that need several independent completions at once.
+# Coroutines run on a single long-lived event loop in a daemon thread so that Streamlit's
+# script threads (which have no loop of their own) can fan out requests and wait for them.
+async_openai_client = openai.AsyncOpenAI(max_retries=0, **mock_client_options(mock_transport, async_client=True))
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+def _get_event_loop():
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="openai-event-loop", daemon=True).start()
+            _event_loop = loop
+    return _event_loop
+
+def run_async(coro, timeout=None):
+    # Run a coroutine on the managed event loop and block until it finishes.
+    # If the wait times out or is interrupted, the coroutine is cancelled.
+    future = asyncio.run_coroutine_threadsafe(coro, _get_event_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+async def _async_fetch_multi_response(cache_key, model, prompt, max_completion_tokens, n, timeout, step, response_format=None):
+    reserved = _reserved_tokens(prompt, max_completion_tokens, n)
+    started = time.perf_counter()
+    try:
+        response = await call_with_retry_async(
+            lambda: asyncio.wait_for(
+                async_openai_client.chat.completions.create(
+                    model=model,
+                    messages=_chat_messages(prompt),
+                    max_completion_tokens=max_completion_tokens,
+                    n=n,
+                    **_format_options(response_format)
+                ),
+                timeout
+            ),
+            model, reserved
+        )
+        _record_usage(model, reserved, response)
+        responses = [choice.message.content.strip() for choice in response.choices]
+    except asyncio.TimeoutError:
+        telemetry.record(step, model, "api", latency_s=time.perf_counter() - started, error="timeout")
+        raise RuntimeError(f"OpenAI request timed out after {timeout} seconds.")
+    except Exception as e:
+        telemetry.record(step, model, "api", latency_s=time.perf_counter() - started, error=str(e))
+        raise RuntimeError(f"An error occurred while communicating with OpenAI: {e}")
+    telemetry.record(step, model, "api", latency_s=time.perf_counter() - started, **_usage_fields(response))
+    await asyncio.to_thread(response_cache.set, cache_key, model, responses)
+    return responses
+
+async def async_get_openai_multi_response(prompt, max_completion_tokens=3500, n=1, model=None, use_cache=True,
+                                          timeout=None, step=None, response_format=None):
+    # Must run on the managed event loop; resolve `model` and `step` in the calling thread beforehand
+    model = model or get_selected_model(model_dict)
+    cache_key = make_cache_key(model, SYSTEM_MESSAGE, prompt, max_completion_tokens, n, response_format)
+    started = time.perf_counter()
+    if use_cache:
+        cached = await asyncio.to_thread(response_cache.get, cache_key)
+        if cached is not None:
+            telemetry.record(step, model, "cache", latency_s=time.perf_counter() - started)
+            return cached
+    coalesced = single_flight.in_flight_async(cache_key)
+    responses = await single_flight.do_async(
+        cache_key,
+        lambda: _async_fetch_multi_response(cache_key, model, prompt, max_completion_tokens, n, timeout, step, response_format)
+    )
+    if coalesced:
+        telemetry.record(step, model, "coalesced", latency_s=time.perf_counter() - started)
+    return responses
+
+async def async_gather_openai_responses(prompts, max_completion_tokens=3500, model=None, concurrency=4,
+                                        timeout=180, use_cache=True, return_exceptions=False, step=None,
+                                        response_format=None, on_result=None):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(index, prompt):
+        async with semaphore:
+            try:
+                responses = await async_get_openai_multi_response(
+                    prompt, max_completion_tokens, n=1, model=model, use_cache=use_cache, timeout=timeout, step=step,
+                    response_format=response_format
+                )
+            except Exception as e:
+                if on_result:
+                    on_result(index, e)
+                raise
+            if on_result:
+                on_result(index, responses[0])
+            return responses[0]
+
+    tasks = [asyncio.create_task(run_one(i, prompt)) for i, prompt in enumerate(prompts)]
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    finally:
+        # On failure or cancellation, don't leave sibling requests running
+        for task in tasks:
+            task.cancel()
+
+def gather_openai_responses(prompts, max_completion_tokens=3500, concurrency=4, timeout=180,
+                            use_cache=True, return_exceptions=False, model=None, step=None, response_format=None,
+                            on_result=None):
+    # Fan out independent prompts concurrently (at most `concurrency` in flight) and
+    # return one response per prompt, in prompt order. `timeout` applies per request.
+    # With return_exceptions=True failed prompts yield their RuntimeError instead of raising.
+    # `on_result(index, response_or_error)` is called (on the event loop thread) as each prompt finishes.
+    model = model or get_selected_model(model_dict)  # Resolve in the calling (Streamlit) thread
+    step = step or get_step_name()
+    return run_async(async_gather_openai_responses(
+        list(prompts), max_completion_tokens, model=model, concurrency=concurrency,
+        timeout=timeout, use_cache=use_cache, return_exceptions=return_exceptions, step=step,
+        response_format=response_format, on_result=on_result
+    ))
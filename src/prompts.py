@@ -0,0 +1,174 @@
+import re
+
+# Prompt builders shared by the interactive workflow steps and the offline batch pipeline.
+# Builders that take `source` are passed to budget_prompt() so the source section can be trimmed.
+
+SYSTEM_MESSAGE = "You are a professional instructional design assistant."
+
+
+def combine_content(uploaded_content, generated_content):
+    combined_content = (uploaded_content or "").strip()
+    if generated_content:
+        combined_content += f"\n\n{generated_content.strip()}"
+    return combined_content
+
+
+def build_gap_analysis_prompt(context_summary, source):
+    return (
+        f"Analyze the following instructional design context and raw content to identify content gaps.\n\n"
+        f"Here is the instructional design context:\n{context_summary}\n\n"
+        f"Here is the raw content:\n{source}\n\n"
+        f"Identify any content gaps in the raw content based on the provided context. Don't make it very elaborate and focus on the duration indicated by the user in {context_summary}. "
+        f"List the missing topics or areas that need to be covered in the course."
+    )
+
+
+def build_gap_map_prompt(context_summary, source, part, parts):
+    return (
+        f"You are reviewing part {part} of {parts} of the raw content for an e-learning course.\n\n"
+        f"Here is the instructional design context:\n{context_summary}\n\n"
+        f"Here is part {part} of the raw content:\n{source}\n\n"
+        f"In short bullet points, list:\n"
+        f"1. Covered: the topics from the context that this part of the content covers.\n"
+        f"2. Missing: the topics the context calls for that this part does not cover.\n"
+        f"Do not add any other explanation."
+    )
+
+
+def build_gap_reduce_prompt(context_summary, findings):
+    return (
+        f"The raw content for an e-learning course was reviewed in parts. Each part's review lists the topics it covers and the topics it is missing.\n\n"
+        f"Here is the instructional design context:\n{context_summary}\n\n"
+        f"Here are the reviews of each part:\n{findings}\n\n"
+        f"A topic is only a content gap if no part covers it. Merge the reviews into a single deduplicated list of content gaps. "
+        f"Don't make it very elaborate and focus on the duration indicated by the user in the context. "
+        f"List the missing topics or areas that need to be covered in the course."
+    )
+
+
+def build_content_fill_prompt(analysis):
+    return (
+        f"Based on the identified content gaps below, generate the necessary content to fill these gaps.\n\n"
+        f"**Content Gaps:**\n{analysis}\n\n"
+        f"Provide the additional content required to cover these areas effectively."
+    )
+
+
+def build_outline_prompt(context_summary, source):
+    return (
+        f"Based on the following instructional design context and source content, generate a structured content outline. Make sure that the duration indicated by the user in context_summary_persisted is adhered to when the duration in the outline is generated "
+        f"for the e-learning course.\n\n"
+        f"### Instructional Design Context:\n{context_summary}\n\n"
+        f"### Source Content:\n{source}\n\n"
+        f"Return the content outline as JSON: an object with a \"rows\" array in which each row has \"section\" (the outline item) and \"duration_minutes\" (its duration in minutes).\n"
+        f"Do not add bullets or explanations before or after the JSON."
+    )
+
+
+def build_storyboard_prompt(context_summary, content_outline, source):
+    return (
+        f"Create a storyboard that follows instructional design theories, for the e-learning course based on the following instructional design context, content outline, and source content.\n\n"
+        f"### Instructional Design Context:\n{context_summary}\n\n"
+        f"### Content Outline:\n{content_outline}\n\n"
+        f"### Source Content:\n{source}\n\n"
+        f"Return the storyboard as JSON: an object with a \"rows\" array in which each row (one screen) has \"onscreen_text\", \"voice_over_script\" and \"visualization_guidelines\".\n"
+        f"Make sure that the Onscreen text column contains the entire text we want to include in the slide, not just slide titles. In the Voice over script column, include the entire narrative voice over script, not just an introduction.\n"
+        f"Let knowledge checks not be too many. Also when knowledge checks are used include all the details - the question, the answer options, the correct answer and also correct and wrong answer feedback. \n"
+        f"Do not add any explanation before or after the JSON. Write each field as plain text without bullets or other formatting."
+    )
+
+
+def build_section_storyboard_prompt(context_summary, content_outline, section, course_so_far, knowledge_checks, source):
+    # One outline section of a storyboard that is generated section by section, concurrently
+    if knowledge_checks:
+        checks = (f"Include exactly {knowledge_checks} knowledge check{'s' if knowledge_checks > 1 else ''} in this section, with all the details - "
+                  f"the question, the answer options, the correct answer and also correct and wrong answer feedback.\n")
+    else:
+        checks = "Do not include knowledge checks in this section; they are placed in other sections.\n"
+    return (
+        f"Create the storyboard for one section of an e-learning course, following instructional design theories. "
+        f"The other sections are written separately and joined to this one in outline order.\n\n"
+        f"### Instructional Design Context:\n{context_summary}\n\n"
+        f"### Content Outline:\n{content_outline}\n\n"
+        f"### Section to Storyboard:\n{section}\n\n"
+        f"### Course So Far:\n{course_so_far}\n\n"
+        f"### Source Content:\n{source}\n\n"
+        f"Return the storyboard for this section only as JSON: an object with a \"rows\" array in which each row (one screen) has \"onscreen_text\", \"voice_over_script\" and \"visualization_guidelines\".\n"
+        f"Make sure that the Onscreen text column contains the entire text we want to include in the slide, not just slide titles. In the Voice over script column, include the entire narrative voice over script, not just an introduction.\n"
+        f"{checks}"
+        f"Do not repeat content covered by earlier sections, and only add a course introduction or a course closing when the Course So Far says this is the first or last section.\n"
+        f"Do not add any explanation before or after the JSON. Write each field as plain text without bullets or other formatting."
+    )
+
+
+def build_row_revision_prompt(context_summary, section, rows_before, rows, rows_after, instruction):
+    # Regenerates a few selected storyboard rows; the neighbouring rows are context only
+    section_line = f"### Section:\n{section}\n\n" if section else ""
+    return (
+        f"Revise part of the storyboard of an e-learning course, following the reviewer's instruction.\n\n"
+        f"### Instructional Design Context:\n{context_summary}\n\n"
+        f"{section_line}"
+        f"### Rows Before (context only, do not return):\n{rows_before or 'None - the rows to revise start the storyboard.'}\n\n"
+        f"### Rows to Revise:\n{rows}\n\n"
+        f"### Rows After (context only, do not return):\n{rows_after or 'None - the rows to revise end the storyboard.'}\n\n"
+        f"### Reviewer's Instruction:\n{instruction}\n\n"
+        f"Return only the revised rows as JSON: an object with a \"rows\" array in which each row (one screen) has \"onscreen_text\", \"voice_over_script\" and \"visualization_guidelines\".\n"
+        f"Return as many rows as there are rows to revise unless the instruction asks to add, split, merge or remove screens. "
+        f"Keep the revised rows consistent with the rows before and after them.\n"
+        f"Do not add any explanation before or after the JSON. Write each field as plain text without bullets or other formatting."
+    )
+
+
+ASSESSMENT_JSON_FORMAT = (
+    "Return the questions as JSON: an object with a \"rows\" array in which each row has \"question\", "
+    "\"options\" (the answer options, without letters), \"correct_option\" (the text of the correct option), "
+    "\"feedback\" (one or two sentences explaining the correct answer) and \"difficulty\" (easy, medium or hard).\n"
+)
+
+
+def build_assessment_prompt(context_summary, content_outline, num_questions):
+    return (
+        f"Based on the following instructional design context and content outline, generate a final assessment for this e-learning course.\n\n"
+        f"### Instructional Design Context:\n{context_summary}\n\n"
+        f"### Content Outline:\n{content_outline}\n\n"
+        f"Create {num_questions} multiple-choice questions.\n"
+        f"Each MCQ must have appropriate number of answer options, and should clearly indicate the correct option.\n"
+        f"Ensure questions align with the course objectives and learning content.\n"
+        f"{ASSESSMENT_JSON_FORMAT}"
+        f"Do not add any explanation text or headings before or after the JSON."
+    )
+
+
+def build_section_assessment_prompt(context_summary, content_outline, section, num_questions, source, avoid_questions):
+    # Questions for one outline section of an assessment that is generated section by section
+    avoid = "\n".join(f"- {question}" for question in avoid_questions)
+    avoid_block = f"### Questions Already in the Assessment (do not repeat or rephrase):\n{avoid}\n\n" if avoid else ""
+    return (
+        f"Based on the following instructional design context, content outline and source content, write final assessment questions "
+        f"for one section of this e-learning course.\n\n"
+        f"### Instructional Design Context:\n{context_summary}\n\n"
+        f"### Content Outline:\n{content_outline}\n\n"
+        f"### Section:\n{section}\n\n"
+        f"### Source Content:\n{source}\n\n"
+        f"{avoid_block}"
+        f"Create exactly {num_questions} multiple-choice question{'s' if num_questions > 1 else ''} about this section only.\n"
+        f"Each MCQ must have appropriate number of answer options, and should clearly indicate the correct option.\n"
+        f"Ensure questions align with the course objectives and learning content.\n"
+        f"{ASSESSMENT_JSON_FORMAT}"
+        f"Do not add any explanation text or headings before or after the JSON."
+    )
+
+
+def extract_num_questions(summary):
+    match = re.search(r"(\d+)\s*(questions|mcqs|multiple choice)", summary.lower())
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def estimate_questions_from_duration(summary):
+    match = re.search(r"duration\s*[:\-]\s*(\d+)\s*(minutes|min|hours|hrs)", summary.lower())
+    if match:
+        duration = int(match.group(1))
+        return max(1, duration // 10)  # Estimate 1 question per 10 minutes
+    return None
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import openai
+
+from src.token_budget import count_tokens
+
+logging.basicConfig(level=logging.INFO)
+
+# --- CONFIGURATION ---
+# Requests-per-minute and tokens-per-minute budgets per model. The defaults follow OpenAI's
+# usage tier 1; set IDA_RATE_LIMIT_MULTIPLIER to scale them for higher tiers.
+RATE_LIMIT_MULTIPLIER = float(os.getenv("IDA_RATE_LIMIT_MULTIPLIER", "1"))
+MODEL_RATE_LIMITS = {
+    "o3": {"rpm": 500, "tpm": 30_000},
+    "o3-mini": {"rpm": 1_000, "tpm": 100_000},
+    "o4-mini": {"rpm": 1_000, "tpm": 100_000},
+    "gpt-4o": {"rpm": 500, "tpm": 30_000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200_000},
+    "gpt-4.1": {"rpm": 500, "tpm": 30_000},
+    "gpt-4.1-mini": {"rpm": 500, "tpm": 200_000},
+    "gpt-4.1-nano": {"rpm": 500, "tpm": 200_000},
+    "gpt-5": {"rpm": 500, "tpm": 30_000},
+    "gpt-5-mini": {"rpm": 500, "tpm": 200_000},
+    "gpt-5-nano": {"rpm": 500, "tpm": 200_000},
+}
+DEFAULT_RATE_LIMIT = {"rpm": 500, "tpm": 30_000}
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Errors worth retrying: throttling, timeouts, dropped connections and 5xx responses
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def estimate_tokens(text):
+    """Token count used for TPM accounting."""
+    return max(1, count_tokens(text))
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of refusing callers.
+    A reservation may drive the balance negative; the caller then waits until the
+    bucket has refilled past its reservation, which serves callers in arrival order.
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def reserve(self, amount, now):
+        """Takes `amount` tokens and returns how many seconds the caller must wait before using them."""
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_per_second
+
+    def adjust(self, amount, now):
+        """Returns (positive) or charges (negative) tokens after the real cost of a request is known."""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Process-wide RPM/TPM limiter shared by every Streamlit session."""
+
+    def __init__(self, limits=MODEL_RATE_LIMITS, default=DEFAULT_RATE_LIMIT, multiplier=RATE_LIMIT_MULTIPLIER):
+        self.limits = limits
+        self.default = default
+        self.multiplier = multiplier
+        self._buckets = {}
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    def _get_buckets(self, model):
+        if model not in self._buckets:
+            limit = self.limits.get(model, self.default)
+            rpm = limit["rpm"] * self.multiplier
+            tpm = limit["tpm"] * self.multiplier
+            self._buckets[model] = (TokenBucket(rpm, rpm / 60.0), TokenBucket(tpm, tpm / 60.0))
+        return self._buckets[model]
+
+    def reserve(self, model, tokens):
+        """Reserves one request and `tokens` tokens for `model`; returns the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            request_bucket, token_bucket = self._get_buckets(model)
+            wait = max(request_bucket.reserve(1, now), token_bucket.reserve(tokens, now))
+            blocked_for = self._blocked_until.get(model, 0.0) - now
+            return max(wait, blocked_for)
+
+    def acquire(self, model, tokens):
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, model, tokens):
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record_usage(self, model, reserved_tokens, used_tokens):
+        """Corrects the token bucket once the API reports the actual usage of a request."""
+        with self._lock:
+            _, token_bucket = self._get_buckets(model)
+            token_bucket.adjust(reserved_tokens - used_tokens, time.monotonic())
+
+    def pause(self, model, seconds):
+        """Holds back every new request for `model` (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until[model] = max(self._blocked_until.get(model, 0.0), now + seconds)
+
+
+# Shared limiter for the whole process
+rate_limiter = RateLimiter()
+
+
+def _retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def _is_retryable(error):
+    if not isinstance(error, RETRYABLE_ERRORS):
+        return False
+    # An exhausted quota will not recover by waiting
+    return getattr(error, "code", None) != "insufficient_quota"
+
+
+def backoff_delay(attempt, error=None):
+    """Seconds to wait before retry number `attempt` (0-based): Retry-After if given, else full-jitter exponential backoff."""
+    retry_after = _retry_after_seconds(error) if error is not None else None
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX_SECONDS)
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _after_failure(model, attempt, error, max_attempts):
+    if not _is_retryable(error) or attempt == max_attempts - 1:
+        raise error
+    delay = backoff_delay(attempt, error)
+    if isinstance(error, openai.RateLimitError):
+        rate_limiter.pause(model, delay)
+    logging.warning(f"OpenAI request for {model} failed ({type(error).__name__}); retrying in {delay:.1f}s "
+                    f"(attempt {attempt + 2} of {max_attempts}).")
+    return delay
+
+
+def call_with_retry(fn, model, tokens, max_attempts=MAX_ATTEMPTS):
+    """Calls `fn()` once the limiter admits it, retrying throttled and transient failures."""
+    for attempt in range(max_attempts):
+        rate_limiter.acquire(model, tokens)
+        try:
+            return fn()
+        except Exception as e:
+            time.sleep(_after_failure(model, attempt, e, max_attempts))
+
+
+async def call_with_retry_async(fn, model, tokens, max_attempts=MAX_ATTEMPTS):
+    """Async variant of call_with_retry; `fn()` must return an awaitable."""
+    for attempt in range(max_attempts):
+        await rate_limiter.acquire_async(model, tokens)
+        try:
+            return await fn()
+        except Exception as e:
+            await asyncio.sleep(_after_failure(model, attempt, e, max_attempts))
@@ -0,0 +1,222 @@
+import os
+import re
+import weakref
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.token_budget import count_tokens
+from src.util import is_separator_row, split_table_row
+
+# --- CONFIGURATION ---
+# Outline and storyboard prompts are grounded on the passages most relevant to them rather than
+# the whole upload once the corpus is bigger than these budgets.
+PASSAGE_CHARS = int(os.getenv("IDA_RETRIEVAL_PASSAGE_CHARS", 1200))
+OUTLINE_SOURCE_TOKENS = int(os.getenv("IDA_RETRIEVAL_OUTLINE_TOKENS", 12000))
+STORYBOARD_SOURCE_TOKENS = int(os.getenv("IDA_RETRIEVAL_STORYBOARD_TOKENS", 24000))
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from has have how in into is it its not of on or our "
+    "should that the their then there these they this to was were what when which will with you your".split()
+)
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [w for w in WORD_PATTERN.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS]
+
+
+@dataclass
+class Passage:
+    source: str
+    locator: str
+    text: str
+    score: float = 0.0
+
+
+def _split_ranges(text, limit):
+    # Character ranges of at most `limit`, cut at a line break or space where possible
+    ranges, start = [], 0
+    while len(text) - start > limit:
+        cut = text.rfind("\n", start + 1, start + limit)
+        if cut == -1:
+            cut = text.rfind(" ", start + 1, start + limit)
+        if cut == -1:
+            cut = start + limit
+        ranges.append((start, cut))
+        start = cut
+    ranges.append((start, len(text)))
+    return ranges
+
+
+class BM25Index:
+    """
+    BM25 index over passages of a Corpus. Passages are ~PASSAGE_CHARS spans of the corpus
+    (small chunks of the same file are merged, big ones split) and are stored as references
+    into the corpus, not copies. Postings are kept as flat arrays and compiled into NumPy
+    term-sorted arrays on the first search after new chunks are indexed.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}
+        self.indexed_chunks = 0
+        self._spans = []  # (first_chunk, start, last_chunk, end)
+        self._lengths = array("f")
+        self._post_docs = array("i")
+        self._post_terms = array("i")
+        self._post_tfs = array("f")
+        self._compiled = None
+
+    def __len__(self):
+        return len(self._spans)
+
+    def update(self, corpus):
+        """Indexes the corpus chunks added since the last update."""
+        pending = None  # [first_chunk, start, last_chunk, end, source, text]
+        for i in range(self.indexed_chunks, len(corpus)):
+            chunk = corpus.chunk(i)
+            for start, end in _split_ranges(chunk.text, PASSAGE_CHARS):
+                piece = chunk.text[start:end]
+                if pending and pending[4] == chunk.source and len(pending[5]) + len(piece) <= PASSAGE_CHARS:
+                    pending[2], pending[3], pending[5] = i, end, pending[5] + piece
+                    continue
+                if pending:
+                    self._add(tuple(pending[:4]), pending[5])
+                pending = [i, start, i, end, chunk.source, piece]
+        if pending:
+            self._add(tuple(pending[:4]), pending[5])
+        self.indexed_chunks = len(corpus)
+
+    def _add(self, span, text):
+        counts = Counter(tokenize(text))
+        if not counts:
+            return
+        doc = len(self._spans)
+        self._spans.append(span)
+        self._lengths.append(sum(counts.values()))
+        for word, tf in counts.items():
+            self._post_docs.append(doc)
+            self._post_terms.append(self.vocab.setdefault(word, len(self.vocab)))
+            self._post_tfs.append(tf)
+        self._compiled = None
+
+    def _compile(self):
+        if self._compiled is None:
+            terms = np.frombuffer(self._post_terms, dtype=np.int32)
+            order = np.argsort(terms, kind="stable")
+            offsets = np.searchsorted(terms[order], np.arange(len(self.vocab) + 1))
+            docs = np.frombuffer(self._post_docs, dtype=np.int32)[order]
+            tfs = np.frombuffer(self._post_tfs, dtype=np.float32)[order]
+            lengths = np.frombuffer(self._lengths, dtype=np.float32)
+            df = np.diff(offsets)
+            n = len(self._spans)
+            idf = np.log1p((n - df + 0.5) / (df + 0.5))
+            norms = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+            self._compiled = (offsets, docs, tfs, idf, norms)
+        return self._compiled
+
+    def search(self, query, k=10):
+        """Returns up to `k` (passage_id, score) pairs, best first."""
+        if not self._spans:
+            return []
+        offsets, docs, tfs, idf, norms = self._compile()
+        scores = np.zeros(len(self._spans), dtype=np.float32)
+        for term in {self.vocab[w] for w in tokenize(query) if w in self.vocab}:
+            d = docs[offsets[term]:offsets[term + 1]]
+            tf = tfs[offsets[term]:offsets[term + 1]]
+            scores[d] += idf[term] * tf * (self.k1 + 1) / (tf + norms[d])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def passage(self, corpus, passage_id, score=0.0):
+        first, start, last, end = self._spans[passage_id]
+        chunks = [corpus.chunk(i) for i in range(first, last + 1)]
+        text = "".join(c.text for c in chunks)
+        text = text[start:len(text) - (len(chunks[-1].text) - end)]
+        locator = chunks[0].locator if first == last else f"{chunks[0].locator}-{chunks[-1].locator}"
+        return Passage(chunks[0].source, locator, text, score)
+
+
+# One index per corpus; it is dropped with the corpus and extended when files are appended to it
+_indexes = weakref.WeakKeyDictionary()
+
+
+def get_index(corpus):
+    index = _indexes.get(corpus)
+    if index is None:
+        index = _indexes[corpus] = BM25Index()
+    if index.indexed_chunks < len(corpus):
+        index.update(corpus)
+    return index
+
+
+def format_passages(passages):
+    return "\n\n".join(f"[{p.source}, {p.locator}]\n{p.text.strip()}" for p in passages)
+
+
+def retrieve(corpus, query, max_tokens, exclude=None):
+    """The best passages for `query` that fit in `max_tokens`, in document order."""
+    index = get_index(corpus)
+    exclude = exclude if exclude is not None else set()
+    chosen, used = [], 0
+    for passage_id, score in index.search(query, k=max(10, max_tokens // 100)):
+        if passage_id in exclude:
+            continue
+        passage = index.passage(corpus, passage_id, score)
+        tokens = count_tokens(passage.text)
+        if used + tokens > max_tokens:
+            continue
+        chosen.append((passage_id, passage))
+        exclude.add(passage_id)
+        used += tokens
+    return [passage for _, passage in sorted(chosen, key=lambda item: item[0])]
+
+
+def ground_source(corpus, query, max_tokens=OUTLINE_SOURCE_TOKENS):
+    """
+    Returns (source_text, info): the whole corpus when it fits in `max_tokens`, otherwise the
+    passages most relevant to `query`. `info` describes the selection for the UI, or is None.
+    """
+    if not corpus or corpus.tokens <= max_tokens:
+        return (corpus.text() if corpus else ""), None
+    passages = retrieve(corpus, query, max_tokens)
+    return format_passages(passages), f"Using {len(passages)} of the most relevant passages from {corpus.tokens:,} tokens of source content."
+
+
+def outline_sections(content_outline):
+    """Section titles from the outline table (first column of each data row)."""
+    sections, header_seen = [], False
+    for line in content_outline.splitlines():
+        cells = split_table_row(line)
+        if not cells or is_separator_row(cells) or not cells[0]:
+            continue
+        if not header_seen:
+            header_seen = True
+            continue
+        sections.append(cells[0])
+    return sections
+
+
+def ground_sections(corpus, sections, context="", max_tokens=STORYBOARD_SOURCE_TOKENS):
+    """
+    Like ground_source, but splits the budget across outline sections so every section gets
+    its own supporting passages; a passage is only included once, under the first section
+    that retrieves it.
+    """
+    if not corpus or corpus.tokens <= max_tokens or not sections:
+        return ground_source(corpus, f"{context} {' '.join(sections)}", max_tokens)
+    per_section = max_tokens // len(sections)
+    used_ids, parts, total = set(), [], 0
+    for section in sections:
+        passages = retrieve(corpus, f"{section} {context}", per_section, exclude=used_ids)
+        if passages:
+            parts.append(f"#### {section}\n{format_passages(passages)}")
+            total += len(passages)
+    info = f"Using {total} passages retrieved per outline section from {corpus.tokens:,} tokens of source content."
+    return "\n\n".join(parts), info
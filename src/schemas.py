@@ -0,0 +1,211 @@
+import json
+import re
+import typing
+from dataclasses import dataclass, fields
+
+from src.util import is_separator_row, split_table_row
+
+# Outlines, storyboards and assessments are requested as JSON constrained by these schemas
+# (OpenAI structured outputs) and parsed once into typed rows. The viewer, the prompts that
+# quote an earlier step and every exporter work from the rows; pipe tables are only produced
+# for display in prompts, and parsed as a fallback for older or unstructured responses.
+
+
+@dataclass
+class OutlineRow:
+    section: str
+    duration_minutes: str
+
+
+@dataclass
+class StoryboardRow:
+    onscreen_text: str
+    voice_over_script: str
+    visualization_guidelines: str
+
+
+@dataclass
+class AssessmentQuestion:
+    question: str
+    options: typing.List[str]
+    correct_option: str
+    feedback: str
+    difficulty: str
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    name: str
+    row_type: type
+    columns: tuple  # Display titles, in field order
+
+    @property
+    def fields(self):
+        return tuple(f.name for f in fields(self.row_type))
+
+    def response_format(self):
+        """The `response_format` argument that constrains a completion to {"rows": [...]}."""
+        types = typing.get_type_hints(self.row_type)
+        properties = {
+            name: {"type": "array", "items": {"type": "string"}} if types[name] != str else {"type": "string"}
+            for name in self.fields
+        }
+        row = {"type": "object", "properties": properties, "required": list(self.fields), "additionalProperties": False}
+        schema = {
+            "type": "object",
+            "properties": {"rows": {"type": "array", "items": row}},
+            "required": ["rows"],
+            "additionalProperties": False,
+        }
+        return {"type": "json_schema", "json_schema": {"name": self.name, "strict": True, "schema": schema}}
+
+    def row(self, values):
+        """Builds a row from a JSON object or a list of cells, tolerating missing or extra values."""
+        if isinstance(values, dict):
+            values = [values.get(name, "") for name in self.fields]
+        values = list(values) + [""] * (len(self.fields) - len(values))
+        if len(values) > len(self.fields):
+            # Stray pipes inside the last cell; keep the text rather than dropping the row
+            values[len(self.fields) - 1:] = [" | ".join(str(v) for v in values[len(self.fields) - 1:])]
+        types = typing.get_type_hints(self.row_type)
+        return self.row_type(*[
+            [str(o) for o in v] if types[name] != str and isinstance(v, list) else ("" if v is None else str(v)).strip()
+            for name, v in zip(self.fields, values)
+        ])
+
+
+OUTLINE = TableSchema("content_outline", OutlineRow, ("Outline", "Duration (in mins)"))
+STORYBOARD = TableSchema("storyboard", StoryboardRow, ("Onscreen Text", "Voice Over Script", "Visualization Guidelines"))
+ASSESSMENT = TableSchema("final_assessment", AssessmentQuestion, ("Question", "Options", "Correct Option", "Feedback", "Difficulty"))
+SCHEMAS = {schema.name: schema for schema in (OUTLINE, STORYBOARD, ASSESSMENT)}
+
+
+# --- PARSING ---
+class RowStreamParser:
+    """
+    Incremental parser for a {"rows": [...]} (or bare [...]) JSON response. Feed it text as it
+    streams in; every row object is returned as soon as its closing brace arrives, so a partial
+    or truncated response still yields all of its complete rows. The text is scanned once.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.rows = []
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._rows_depth = None  # Depth of the rows array once its "[" has been seen
+        self._row_start = None
+
+    def feed(self, text):
+        self._buffer += text
+        new_rows = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._rows_depth is None:
+                    self._rows_depth = self._depth
+                elif char == "{" and self._rows_depth is not None and self._depth == self._rows_depth + 1:
+                    self._row_start = i
+            elif char in "}]":
+                if char == "}" and self._row_start is not None and self._depth == self._rows_depth + 1:
+                    try:
+                        new_rows.append(self.schema.row(json.loads(buffer[self._row_start:i + 1])))
+                    except ValueError:
+                        pass
+                    self._row_start = None
+                self._depth -= 1
+        # Only the text of a row still being written needs to be kept
+        keep = self._row_start if self._row_start is not None else len(buffer)
+        self._buffer = buffer[keep:]
+        self._pos = len(buffer) - keep
+        if self._row_start is not None:
+            self._row_start = 0
+        self.rows.extend(new_rows)
+        return new_rows
+
+
+CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def parse_table(text, schema):
+    """Rows of a pipe table; the first complete row is the header and is skipped."""
+    rows, header_seen = [], False
+    for line in text.splitlines():
+        cells = split_table_row(line)
+        if not cells or is_separator_row(cells) or not any(cells):
+            continue
+        if not header_seen:
+            header_seen = True
+            continue
+        rows.append(schema.row(cells))
+    return rows
+
+
+def parse_rows(text, schema):
+    """
+    Parses a (possibly partial) response into rows of `schema`: structured JSON, or a pipe table
+    from older responses and models that ignored the response format.
+    """
+    text = CODE_FENCE.sub("", (text or "").strip())
+    if text.startswith(("{", "[")):
+        parser = RowStreamParser(schema)
+        parser.feed(text)
+        return parser.rows
+    return parse_table(text, schema)
+
+
+# --- RENDERING ---
+def _cell(value):
+    # Pipe tables are one line per row
+    text = "; ".join(value) if isinstance(value, list) else value
+    return " ".join(text.replace("|", "/").split())
+
+
+def to_table_text(rows, schema):
+    """Compact pipe-table text of the rows, e.g. for quoting the outline in later prompts."""
+    lines = [" | ".join(schema.columns), " | ".join("---" for _ in schema.columns)]
+    lines.extend(" | ".join(_cell(getattr(row, name)) for name in schema.fields) for row in rows)
+    return "\n".join(lines)
+
+
+def to_frame(rows, schema):
+    import pandas as pd
+    return pd.DataFrame(
+        [[_cell(v) if isinstance(v, list) else v for v in (getattr(row, name) for name in schema.fields)] for row in rows],
+        columns=list(schema.columns),
+    )
+
+
+def format_questions(questions):
+    """Assessment questions as numbered plain text with lettered options."""
+    blocks = []
+    for number, question in enumerate(questions, start=1):
+        lines = [f"{number}. {question.question}"]
+        lines.extend(f"   {chr(ord('A') + i)}. {option}" for i, option in enumerate(question.options))
+        lines.append(f"   Correct answer: {question.correct_option}")
+        if question.feedback:
+            lines.append(f"   Feedback: {question.feedback}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def render_text(schema, text):
+    """Human-readable text of a response: a pipe table, or numbered questions for assessments."""
+    rows = parse_rows(text, schema)
+    if not rows:
+        return text
+    return format_questions(rows) if schema is ASSESSMENT else to_table_text(rows, schema)
@@ -0,0 +1,96 @@
+import logging
+import os
+
+from src.openai_client import gather_openai_responses
+from src.prompts import build_row_revision_prompt
+from src.schemas import STORYBOARD, parse_rows, to_table_text
+
+logging.basicConfig(level=logging.INFO)
+
+# --- CONFIGURATION ---
+# Review fixes regenerate only the selected rows, with a few rows either side as context, instead
+# of the whole storyboard. Every change is kept in a version history so it can be undone.
+NEIGHBOUR_ROWS = int(os.getenv("IDA_REVISION_NEIGHBOUR_ROWS", 2))
+COMPLETION_TOKENS_PER_ROW = 700
+MAX_HISTORY = int(os.getenv("IDA_STORYBOARD_HISTORY", 20))
+
+
+def section_bounds(sections):
+    """(title, start, end) row ranges from the (title, row_count) list of a section-mode storyboard."""
+    bounds, start = [], 0
+    for title, count in sections or []:
+        bounds.append((title, start, start + count))
+        start += count
+    return bounds
+
+
+def selection_runs(indexes, sections=None):
+    """
+    Groups selected row indexes into (start, end) runs of adjacent rows, split at section
+    boundaries so each run is revised with its own section's context.
+    """
+    starts = {start for _, start, _ in section_bounds(sections)}
+    runs = []
+    for i in sorted(set(indexes)):
+        if runs and runs[-1][1] == i and i not in starts:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return [tuple(run) for run in runs]
+
+
+def section_of(sections, row_index):
+    for title, start, end in section_bounds(sections):
+        if start <= row_index < end:
+            return title
+    return None
+
+
+def revise_rows(context_summary, rows, indexes, instruction, sections=None):
+    """
+    Regenerates the selected rows following `instruction` and splices the results in. Returns
+    (rows, sections, warnings): new lists, leaving the given ones untouched. Separate runs of
+    selected rows are revised concurrently; a run that fails keeps its original rows.
+    """
+    runs = selection_runs(indexes, sections)
+    if not runs:
+        return list(rows), sections, []
+    prompts = []
+    for start, end in runs:
+        before = rows[max(0, start - NEIGHBOUR_ROWS):start]
+        after = rows[end:end + NEIGHBOUR_ROWS]
+        prompts.append(build_row_revision_prompt(
+            context_summary, section_of(sections, start),
+            to_table_text(before, STORYBOARD) if before else "",
+            to_table_text(rows[start:end], STORYBOARD),
+            to_table_text(after, STORYBOARD) if after else "",
+            instruction
+        ))
+    longest = max(end - start for start, end in runs)
+    responses = gather_openai_responses(
+        prompts, max_completion_tokens=COMPLETION_TOKENS_PER_ROW * (longest + 1), use_cache=False,
+        return_exceptions=True, step="storyboard_revision", response_format=STORYBOARD.response_format()
+    )
+
+    rows, counts, warnings = list(rows), [count for _, count in sections or []], []
+    bounds = section_bounds(sections)
+    # Splice from the end so earlier row indexes stay valid
+    for (start, end), response in reversed(list(zip(runs, responses))):
+        revised = parse_rows(response, STORYBOARD) if isinstance(response, str) else []
+        if not revised:
+            logging.error(f"Revision of rows {start + 1}-{end} failed: {response}")
+            warnings.append(f"Rows {start + 1}-{end} could not be regenerated and were left unchanged.")
+            continue
+        rows[start:end] = revised
+        for s, (_, section_start, section_end) in enumerate(bounds):
+            if section_start <= start < section_end:
+                counts[s] += len(revised) - (end - start)
+    new_sections = [(title, count) for (title, _), count in zip(sections, counts)] if sections else sections
+    return rows, new_sections, warnings
+
+
+def push_version(history, label, rows, sections):
+    """Records a storyboard version; the oldest ones are dropped past MAX_HISTORY."""
+    history.append({"label": label, "rows": list(rows), "sections": list(sections) if sections else sections})
+    del history[:-MAX_HISTORY]
+    return history
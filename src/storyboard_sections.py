@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import re
+from dataclasses import asdict
+
+from src.openai_client import budget_prompt, gather_openai_responses
+from src.prompts import build_section_storyboard_prompt
+from src.retrieval import ground_source
+from src.schemas import STORYBOARD, parse_rows
+
+logging.basicConfig(level=logging.INFO)
+
+# --- CONFIGURATION ---
+# In section mode every outline section gets its own storyboard request, all running concurrently,
+# so wall-clock time follows the longest section instead of the whole course and no section is cut
+# off by a single response's output limit.
+SECTION_PARALLEL_DEFAULT = os.getenv("IDA_STORYBOARD_SECTION_MODE", "1") == "1"
+SECTION_CONCURRENCY = int(os.getenv("IDA_STORYBOARD_SECTION_CONCURRENCY", 6))
+SECTION_SOURCE_TOKENS = int(os.getenv("IDA_STORYBOARD_SECTION_SOURCE_TOKENS", 6000))
+SECTION_COMPLETION_TOKENS = int(os.getenv("IDA_STORYBOARD_SECTION_COMPLETION_TOKENS", 4096))
+MINUTES_PER_KNOWLEDGE_CHECK = float(os.getenv("IDA_MINUTES_PER_KNOWLEDGE_CHECK", 10))
+
+MINUTES = re.compile(r"\d+(?:\.\d+)?")
+
+
+def parse_minutes(text):
+    """Minutes from a duration cell such as "10", "5-7" (the upper bound) or "1.5"; None if absent."""
+    values = [float(v) for v in MINUTES.findall(text or "")]
+    return max(values) if values else None
+
+
+def duration_weights(durations):
+    """Section durations with the missing ones counted as the average section."""
+    known = [d for d in durations if d]
+    average = sum(known) / len(known) if known else 1.0
+    return [d if d else average for d in durations]
+
+
+def split_by_weight(total, weights):
+    """Splits `total` items over sections in proportion to `weights` (largest remainder)."""
+    shares = [total * w / sum(weights) for w in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def allocate_knowledge_checks(durations, minutes_per_check=MINUTES_PER_KNOWLEDGE_CHECK):
+    """
+    Spreads about one knowledge check per `minutes_per_check` minutes of the course over its
+    sections in proportion to their durations, so the stitched storyboard has the same density
+    a single request would have.
+    """
+    weights = duration_weights(durations)
+    known = any(durations)
+    total = max(1, round(sum(weights) / minutes_per_check)) if known else max(1, len(durations) // 3)
+    return split_by_weight(total, weights)
+
+
+def course_so_far(titles, index, checks):
+    """The short running summary each section is given for continuity with its neighbours."""
+    lines = [f"This is section {index + 1} of {len(titles)}."]
+    if index == 0:
+        lines.append("It is the first section: open the course with a short introduction.")
+    else:
+        earlier = "; ".join(f"{title} ({checks[i]} knowledge checks)" for i, title in enumerate(titles[:index]))
+        lines.append(f"Earlier sections: {earlier}.")
+    if index == len(titles) - 1:
+        lines.append("It is the last section: close the course with a short summary.")
+    else:
+        lines.append(f"Next section: {titles[index + 1]}. End with a one-line transition to it.")
+    return "\n".join(lines)
+
+
+def plan_sections(context_summary, content_outline, outline_rows, corpus, generated_content=""):
+    """Returns (plans, knowledge_checks, trimmed_tokens), one budgeted prompt plan per outline section."""
+    titles = [row.section for row in outline_rows]
+    checks = allocate_knowledge_checks([parse_minutes(row.duration_minutes) for row in outline_rows])
+    plans = []
+    trimmed_tokens = 0
+    for i, title in enumerate(titles):
+        # Each section is grounded on the passages most relevant to it
+        source, _ = ground_source(corpus, f"{title} {context_summary}", SECTION_SOURCE_TOKENS)
+        summary = course_so_far(titles, i, checks)
+        build_prompt = lambda s, title=title, summary=summary, n=checks[i]: build_section_storyboard_prompt(
+            context_summary, content_outline, title, summary, n, s
+        )
+        plan = budget_prompt(build_prompt, source, SECTION_COMPLETION_TOKENS, generated_content=generated_content)
+        trimmed_tokens += plan.trimmed_tokens
+        plans.append(plan)
+    return plans, checks, trimmed_tokens
+
+
+def generate_by_section(context_summary, content_outline, outline_rows, corpus, generated_content="",
+                        use_cache=True, on_progress=None):
+    """
+    Generates the storyboard one outline section at a time, concurrently, and stitches the rows
+    in outline order. Returns (rows, sections, warnings) where `sections` lists (title, row_count)
+    for the stitched rows. `on_progress(done, total, rows_so_far)` is called as sections finish.
+    """
+    plans, _, trimmed_tokens = plan_sections(context_summary, content_outline, outline_rows, corpus, generated_content)
+    # Auto-routing picks the cheapest model that fits each prompt; the one chosen for the largest
+    # prompt fits them all, so every section goes to the same model
+    largest = max(plans, key=lambda plan: plan.prompt_tokens)
+    results = [None] * len(plans)
+
+    def on_result(index, response):
+        results[index] = parse_rows(response, STORYBOARD) if isinstance(response, str) else []
+        if on_progress:
+            done = sum(result is not None for result in results)
+            on_progress(done, len(plans), [row for result in results if result for row in result])
+
+    responses = gather_openai_responses(
+        [plan.prompt for plan in plans], max_completion_tokens=largest.max_completion_tokens,
+        concurrency=SECTION_CONCURRENCY, use_cache=use_cache, return_exceptions=True, model=largest.model,
+        step="storyboard_section", response_format=STORYBOARD.response_format(), on_result=on_result
+    )
+    rows, sections, warnings = [], [], []
+    for row, response, section_rows in zip(outline_rows, responses, results):
+        # A response with no parsable rows (malformed JSON, a refusal) counts as a failure too
+        if isinstance(response, Exception) or not section_rows:
+            logging.error(f"Storyboard section '{row.section}' failed: {response}")
+            warnings.append(f"The section '{row.section}' could not be generated and is missing from the storyboard.")
+            continue
+        rows.extend(section_rows)
+        sections.append((row.section, len(section_rows)))
+    if trimmed_tokens:
+        warnings.append(f"The source content was too long for {largest.model}; about {trimmed_tokens:,} tokens were left out of the section prompts.")
+    return rows, sections, warnings
+
+
+def rows_json(rows):
+    """Rows as the {"rows": [...]} JSON the storyboard schema describes."""
+    return json.dumps({"rows": [asdict(row) for row in rows]})
@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque, defaultdict
+from dataclasses import dataclass, asdict
+
+from src.token_budget import estimate_cost
+
+logging.basicConfig(level=logging.INFO)
+
+# --- CONFIGURATION ---
+TELEMETRY_FILE = os.getenv("IDA_TELEMETRY_FILE", "llm_telemetry.jsonl")  # Append-only sink; empty disables it
+PROMETHEUS_TEXTFILE = os.getenv("IDA_PROMETHEUS_TEXTFILE", "")  # e.g. /var/lib/node_exporter/ida.prom
+RING_BUFFER_SIZE = int(os.getenv("IDA_TELEMETRY_BUFFER_SIZE", 1000))
+
+
+@dataclass
+class CallRecord:
+    timestamp: float
+    step: str
+    model: str
+    source: str  # "api", "cache" or "coalesced"
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    latency_s: float = 0.0
+    ttft_s: float = 0.0
+    cost_usd: float = 0.0
+    streamed: bool = False
+    error: str = ""
+
+
+class Telemetry:
+    """Keeps recent LLM call records in memory and appends every record to a JSONL file."""
+
+    def __init__(self, path=TELEMETRY_FILE, buffer_size=RING_BUFFER_SIZE, prometheus_path=PROMETHEUS_TEXTFILE):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self._records = deque(maxlen=buffer_size)
+        self._totals = defaultdict(lambda: defaultdict(float))  # (step, model, source) -> counters
+        self._lock = threading.Lock()
+
+    def record(self, step, model, source, prompt_tokens=0, completion_tokens=0, cached_tokens=0,
+               latency_s=0.0, ttft_s=None, streamed=False, error=""):
+        cost = estimate_cost(model, prompt_tokens, completion_tokens) if source == "api" else 0.0
+        entry = CallRecord(
+            timestamp=time.time(), step=step or "unknown", model=model, source=source,
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens,
+            latency_s=round(latency_s, 4), ttft_s=round(latency_s if ttft_s is None else ttft_s, 4),
+            cost_usd=round(cost, 6), streamed=streamed, error=error,
+        )
+        with self._lock:
+            self._records.append(entry)
+            totals = self._totals[(entry.step, entry.model, entry.source)]
+            totals["calls"] += 1
+            totals["errors"] += 1 if error else 0
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cached_tokens"] += cached_tokens
+            totals["cost_usd"] += cost
+            totals["latency_s"] += latency_s
+            self._append_to_sink(entry)
+        if self.prometheus_path:
+            self.write_prometheus_textfile(self.prometheus_path)
+        return entry
+
+    def _append_to_sink(self, entry):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(entry)) + "\n")
+        except OSError as e:
+            logging.error(f"Failed to write LLM telemetry to '{self.path}': {e}")
+
+    def recent(self, limit=50):
+        """Returns the most recent call records (newest first) as dictionaries."""
+        with self._lock:
+            records = list(self._records)[-limit:]
+        return [asdict(r) for r in reversed(records)]
+
+    def summary_by_step(self):
+        """Aggregates the in-memory records per workflow step."""
+        steps = {}
+        with self._lock:
+            records = list(self._records)
+        for r in records:
+            row = steps.setdefault(r.step, {
+                "step": r.step, "calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cost_usd": 0.0, "total_latency_s": 0.0, "max_latency_s": 0.0,
+            })
+            row["calls"] += 1
+            row["cache_hits"] += r.source != "api"
+            row["prompt_tokens"] += r.prompt_tokens
+            row["completion_tokens"] += r.completion_tokens
+            row["cost_usd"] += r.cost_usd
+            row["total_latency_s"] += r.latency_s
+            row["max_latency_s"] = max(row["max_latency_s"], r.latency_s)
+        return sorted(steps.values(), key=lambda row: row["total_latency_s"], reverse=True)
+
+    def write_prometheus_textfile(self, path):
+        """Writes counters since process start in the Prometheus textfile-collector format."""
+        metrics = [
+            ("ida_llm_calls_total", "calls", "LLM calls."),
+            ("ida_llm_errors_total", "errors", "Failed LLM calls."),
+            ("ida_llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens sent."),
+            ("ida_llm_completion_tokens_total", "completion_tokens", "Completion tokens received."),
+            ("ida_llm_cached_tokens_total", "cached_tokens", "Prompt tokens served from OpenAI's prompt cache."),
+            ("ida_llm_cost_usd_total", "cost_usd", "Estimated spend in US dollars."),
+            ("ida_llm_latency_seconds_total", "latency_s", "Wall-clock time spent waiting on LLM calls."),
+        ]
+        with self._lock:
+            totals = {key: dict(values) for key, values in self._totals.items()}
+        lines = []
+        for name, field, help_text in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (step, model, source), values in sorted(totals.items()):
+                lines.append(f'{name}{{step="{step}",model="{model}",source="{source}"}} {values.get(field, 0)}')
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, path)  # Atomic swap so the collector never reads a partial file
+        except OSError as e:
+            logging.error(f"Failed to write Prometheus textfile '{path}': {e}")
+
+
+# Shared telemetry for the whole process
+telemetry = Telemetry()
@@ -0,0 +1,102 @@
+import os
+import re
+from collections import Counter
+
+from src.token_budget import count_tokens
+
+# --- CONFIGURATION ---
+NORMALIZE_ENABLED = os.getenv("IDA_NORMALIZE_TEXT", "1") == "1"
+REPEAT_FRACTION = float(os.getenv("IDA_BOILERPLATE_REPEAT_FRACTION", 0.5))  # Share of pages/slides a line must appear on
+MIN_REPEAT_PAGES = 3  # Documents with fewer pages/slides are too short to tell boilerplate apart
+EDGE_LINES = 2  # Lines at the top and bottom of a page, where running headers and footers sit
+
+PAGE_NUMBER_LINE = re.compile(r"^\s*(page\s*)?\d{1,4}(\s*(of|/)\s*\d{1,4})?\s*$", re.IGNORECASE)
+HYPHENATED_BREAK = re.compile(r"(\w)-\n(\w)")
+HORIZONTAL_SPACE = re.compile(r"[ \t\u00a0]+")
+TRAILING_SPACE = re.compile(r" +\n")
+EXTRA_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def line_key(line, at_edge=False):
+    # At the top and bottom of a page, lines that differ only in numbers ("Page 3 of 40",
+    # "Chapter 2 | Safety") count as the same line; elsewhere only exact repeats do
+    key = " ".join(line.lower().split())
+    return ("edge", re.sub(r"\d+", "#", key)) if at_edge else ("any", key)
+
+
+def edge_lines(lines):
+    """Indexes of the first and last EDGE_LINES non-blank lines."""
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    return set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+
+
+def clean_whitespace(text):
+    text = HYPHENATED_BREAK.sub(r"\1\2", text)
+    text = HORIZONTAL_SPACE.sub(" ", text)
+    text = TRAILING_SPACE.sub("\n", text)
+    return EXTRA_BLANK_LINES.sub("\n\n", text)
+
+
+class TextNormalizer:
+    """
+    Cleans the extracted pieces of one file at a time. Drops page numbers and running headers
+    and footers at the top or bottom of its pages and slides, and any line (copyright notices,
+    master-slide placeholders) repeated on at least REPEAT_FRACTION of them. Joins words
+    hyphenated across line breaks and collapses whitespace. Keeps a running count of what
+    it removed.
+    """
+
+    def __init__(self, repeat_fraction=REPEAT_FRACTION):
+        self.repeat_fraction = repeat_fraction
+        self.removed_lines = 0
+        self.saved_tokens = 0
+        self.boilerplate = Counter()  # Example line -> number of files it was removed from
+
+    def __call__(self, pieces):
+        paged = [text for locator, text in pieces if locator.startswith(("page", "slide"))]
+        repeated = self._repeated_lines(paged)
+        normalized = []
+        for locator, text in pieces:
+            if locator.startswith("sheet"):
+                normalized.append((locator, text))  # Already compact; see format_sheet
+                continue
+            lines = text.split("\n")
+            edges = edge_lines(lines) if locator.startswith(("page", "slide")) else set()
+            kept = []
+            for i, line in enumerate(lines):
+                at_edge = i in edges
+                if line.strip() and ((at_edge and PAGE_NUMBER_LINE.match(line)) or line_key(line) in repeated
+                                     or (at_edge and line_key(line, at_edge=True) in repeated)):
+                    self.removed_lines += 1
+                    continue
+                kept.append(line)
+            cleaned = clean_whitespace("\n".join(kept))
+            self.saved_tokens += count_tokens(text) - count_tokens(cleaned)
+            normalized.append((locator, cleaned))
+        for key, example in repeated.items():
+            self.boilerplate[example] += 1
+        return normalized
+
+    def _repeated_lines(self, pages):
+        if len(pages) < MIN_REPEAT_PAGES:
+            return {}
+        counts, examples = Counter(), {}
+        for text in pages:
+            lines = text.split("\n")
+            edges = edge_lines(lines)
+            keys = set()
+            for i, line in enumerate(lines):
+                if line.strip():
+                    for key in {line_key(line), line_key(line, at_edge=i in edges)}:
+                        keys.add(key)
+                        examples.setdefault(key, line.strip())
+            counts.update(keys)
+        threshold = max(MIN_REPEAT_PAGES, self.repeat_fraction * len(pages))
+        return {key: examples[key] for key, count in counts.items() if count >= threshold}
+
+    def report(self):
+        return {
+            "removed_lines": self.removed_lines,
+            "saved_tokens": self.saved_tokens,
+            "boilerplate": [line for line, _ in self.boilerplate.most_common(20)],
+        }
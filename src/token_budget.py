@@ -0,0 +1,132 @@
+import logging
+from dataclasses import dataclass
+
+logging.basicConfig(level=logging.INFO)
+
+# Context window, max output and pricing ($ per 1M tokens) for every model in model_dict.
+# Figures come from the OpenAI Model Quick Reference Table in src/openai_client.py.
+# Reasoning models spend part of max_completion_tokens on hidden reasoning, so the completion
+# budgets sized for visible output do not carry over to them; they are never auto-routed to.
+MODEL_SPECS = {
+    "o3": {"context_window": 200_000, "max_output": 64_000, "input_price": 5.00, "output_price": 20.00, "reasoning": True},
+    "o3-mini": {"context_window": 128_000, "max_output": 32_000, "input_price": 1.10, "output_price": 4.40, "reasoning": True},
+    "o4-mini": {"context_window": 200_000, "max_output": 100_000, "input_price": 1.10, "output_price": 4.40, "reasoning": True},  # Max output not listed in the table
+    "gpt-4o": {"context_window": 128_000, "max_output": 16_384, "input_price": 2.50, "output_price": 10.00},
+    "gpt-4o-mini": {"context_window": 128_000, "max_output": 16_384, "input_price": 0.15, "output_price": 0.60},
+    "gpt-4.1": {"context_window": 1_000_000, "max_output": 16_384, "input_price": 2.00, "output_price": 8.00},
+    "gpt-4.1-mini": {"context_window": 1_047_576, "max_output": 16_384, "input_price": 0.40, "output_price": 1.60},
+    "gpt-4.1-nano": {"context_window": 1_047_576, "max_output": 16_384, "input_price": 0.10, "output_price": 0.40},
+    "gpt-5": {"context_window": 400_000, "max_output": 128_000, "input_price": 1.25, "output_price": 10.00, "reasoning": True},
+    "gpt-5-mini": {"context_window": 400_000, "max_output": 128_000, "input_price": 0.25, "output_price": 2.00, "reasoning": True},
+    "gpt-5-nano": {"context_window": 400_000, "max_output": 128_000, "input_price": 0.05, "output_price": 0.40, "reasoning": True},
+}
+DEFAULT_MODEL_SPEC = MODEL_SPECS["gpt-4o-mini"]
+
+# Headroom for chat formatting overhead and tokenizer estimation error
+SAFETY_MARGIN_TOKENS = 1024
+TRUNCATION_NOTICE = "\n\n[... source content truncated to fit the model's context window ...]"
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # Tokenizer shared by the GPT-4o/4.1/5 and o-series models
+except Exception:  # tiktoken is optional; fall back to a character-based estimate
+    _encoding = None
+
+
+def get_model_spec(model):
+    return MODEL_SPECS.get(model, DEFAULT_MODEL_SPEC)
+
+
+def is_reasoning_model(model):
+    return get_model_spec(model).get("reasoning", False)
+
+
+def count_tokens(text):
+    """Counts tokens locally with tiktoken, or estimates them at four characters per token."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def trim_to_tokens(text, max_tokens):
+    """Returns the leading part of `text` that fits in `max_tokens`."""
+    if max_tokens <= 0:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return _encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def split_to_tokens(text, max_tokens):
+    """Splits `text` into consecutive pieces of at most `max_tokens` tokens."""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return [_encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+    return [text[i:i + max_tokens * 4] for i in range(0, len(text), max_tokens * 4)]
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Dollar cost of a request from the per-1M-token prices in MODEL_SPECS."""
+    spec = get_model_spec(model)
+    return (prompt_tokens * spec["input_price"] + completion_tokens * spec["output_price"]) / 1_000_000
+
+
+@dataclass
+class PromptPlan:
+    model: str
+    prompt: str
+    prompt_tokens: int
+    max_completion_tokens: int
+    trimmed_tokens: int = 0
+    routed: bool = False
+
+
+def source_token_limit(models, max_completion_tokens):
+    """The most prompt tokens any of `models` could take alongside the completion budget."""
+    return max(
+        get_model_spec(m)["context_window"] - min(max_completion_tokens, get_model_spec(m)["max_output"])
+        for m in models
+    )
+
+
+def _fits(model, prompt_tokens, max_completion_tokens):
+    spec = get_model_spec(model)
+    return (prompt_tokens + max_completion_tokens + SAFETY_MARGIN_TOKENS <= spec["context_window"]
+            and max_completion_tokens <= spec["max_output"])
+
+
+def plan_prompt(build_prompt, source_text, max_completion_tokens, model, candidates=None):
+    """
+    Fits a prompt whose bulk is `source_text` into a model's context window.
+    `build_prompt(source)` renders the full prompt around a given source section.
+    If `candidates` is given, the request is routed to the cheapest candidate model that fits
+    the untrimmed prompt; otherwise (or if none fits) the source section is trimmed for `model`.
+    """
+    prompt = build_prompt(source_text)
+    prompt_tokens = count_tokens(prompt)
+
+    if candidates:
+        fitting = [m for m in candidates if _fits(m, prompt_tokens, max_completion_tokens)]
+        if fitting:
+            cheapest = min(fitting, key=lambda m: estimate_cost(m, prompt_tokens, max_completion_tokens))
+            return PromptPlan(cheapest, prompt, prompt_tokens, max_completion_tokens, routed=cheapest != model)
+
+    spec = get_model_spec(model)
+    max_completion_tokens = min(max_completion_tokens, spec["max_output"])
+    if _fits(model, prompt_tokens, max_completion_tokens):
+        return PromptPlan(model, prompt, prompt_tokens, max_completion_tokens)
+
+    # Trim the source section to whatever room the rest of the prompt leaves
+    fixed_tokens = count_tokens(build_prompt("")) + count_tokens(TRUNCATION_NOTICE)
+    room = spec["context_window"] - fixed_tokens - max_completion_tokens - SAFETY_MARGIN_TOKENS
+    source_tokens = count_tokens(source_text)
+    trimmed_source = trim_to_tokens(source_text, room) + TRUNCATION_NOTICE
+    prompt = build_prompt(trimmed_source)
+    logging.warning(f"Trimmed {source_tokens - max(room, 0)} source tokens to fit {model}'s context window.")
+    return PromptPlan(model, prompt, count_tokens(prompt), max_completion_tokens,
+                      trimmed_tokens=source_tokens - max(room, 0))
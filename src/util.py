@@ -1,11 +1,79 @@
+import threading
+from contextlib import contextmanager
+
 import streamlit as st  # Import Streamlit to access session state
 
+# Names used to label LLM calls in telemetry, keyed by workflow step number
+WORKFLOW_STEPS = {1: "context", 2: "content_analysis", 3: "outline", 4: "storyboard", 5: "assessment"}
+
+# Session settings the helpers below read; background jobs (src/job_runner.py) run outside the
+# Streamlit script thread and use a snapshot taken when the job was submitted instead
+SESSION_SETTINGS = ("selected_model", "auto_route_models", "step")
+_thread_settings = threading.local()
+
+def snapshot_session_settings():
+    return {name: st.session_state.get(name) for name in SESSION_SETTINGS if name in st.session_state}
+
+@contextmanager
+def use_session_settings(settings):
+    _thread_settings.values = settings
+    try:
+        yield
+    finally:
+        _thread_settings.values = None
+
+def _session_get(name, default=None):
+    settings = getattr(_thread_settings, "values", None)
+    if settings is not None:
+        return settings.get(name, default)
+    return st.session_state.get(name, default)
+
+# Session keys holding a project's work after step 1: background jobs and the results derived from
+# them. A step only starts its job when the job key is missing, so all of them must be cleared
+# for a new project or the steps would show the previous project's results.
+# storyboard_version is kept: it keys the storyboard table, so it must keep counting up.
+PROJECT_STATE_KEYS = (
+    # Step 2: uploads, content analysis and gap filling
+    "extracted", "source_keys", "corpus", "additional_sources", "gap_job", "analysis_done", "analysis",
+    "analysis_warning", "fill_job", "filled_content", "generated_additional_content",
+    # Step 3: outline
+    "content_outline", "outline_rows",
+    # Step 4: storyboard, its revisions and the course exports
+    "storyboard_job", "storyboard", "storyboard_sections", "storyboard_warnings",
+    "storyboard_history", "storyboard_grounding", "storyboard_trimmed", "revision_warnings",
+    "course_exports_job", "course_exports_key",
+    # Step 5: final assessment
+    "assessment_job", "final_assessment", "assessment_questions", "assessment_sections", "assessment_downloaded",
+)
+
+def reset_project_state():
+    for key in PROJECT_STATE_KEYS:
+        st.session_state.pop(key, None)
+
 def get_selected_model(model_dict):
     # Fetch the selected model from Streamlit session state
-    selected_key = st.session_state.get("selected_model", "4o-m")
+    selected_key = _session_get("selected_model", "4o-m")
     model = model_dict.get(selected_key)
     if model is None:
         # Optionally, log a warning here using st.warning or print
         st.warning(f"Selected model '{selected_key}' not found. Falling back to 'gpt-4o-mini'.")
         return "gpt-4o-mini"
-    return model
\ No newline at end of file
+    return model
+
+def is_auto_route_enabled():
+    # Whether oversized/small prompts may be routed to the cheapest model that fits
+    return _session_get("auto_route_models", False)
+
+def get_step_name():
+    # Name of the workflow step the current session is on
+    return WORKFLOW_STEPS.get(_session_get("step"), "unknown")
+
+def split_table_row(line):
+    # Split a single pipe-table line into stripped cells, ignoring the outer pipes
+    line = line.strip()
+    if "|" not in line:
+        return []
+    return [cell.strip() for cell in line.strip("|").split("|")]
+
+def is_separator_row(cells):
+    return all(set(cell) <= set("-: ") for cell in cells)
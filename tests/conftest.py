@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Modules that import src.openai_client need an API key unless the local stand-in is used
+os.environ.setdefault("IDA_MOCK_LLM", "synth")
+os.environ.setdefault("IDA_TELEMETRY_FILE", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,26 @@
+import pytest
+
+from src.assessment_sections import allocate_questions, key_similarity, section_key
+from src.schemas import OutlineRow
+
+OUTLINE = [OutlineRow("Introduction", "5"), OutlineRow("Fire safety", "10"), OutlineRow("Summary", "")]
+
+
+def test_questions_follow_section_durations():
+    # "Summary" has no duration and counts as the average section (7.5 minutes)
+    assert allocate_questions(OUTLINE, 9) == [2, 4, 3]
+
+
+@pytest.mark.parametrize("num_questions", [None, 0, -2])
+def test_one_question_per_section_without_a_count(num_questions):
+    assert allocate_questions(OUTLINE, num_questions) == [1, 1, 1]
+
+
+def test_empty_outline():
+    assert allocate_questions([], None) == []
+    assert allocate_questions([], 5) == []
+
+
+def test_section_keys_ignore_word_order():
+    assert section_key("Safety basics") == section_key("Basics of safety")
+    assert key_similarity(section_key("Fire safety basics"), section_key("Safety basics")) == pytest.approx(2 / 3)
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from src import db_manager
+from src.db_manager import fts_query, index_project_content, save_bank_questions, search_content, search_question_bank
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_manager, "DB_FILE", str(tmp_path / "ida_app.db"))
+    db_manager.init_all()
+    index_project_content(1, "alice", "Fire Safety Induction", [
+        ("storyboard", 0, "Extinguishers", 'Use the "PASS" technique: pull, aim, squeeze AND sweep.'),
+        ("outline", 1, "Evacuation", "Evacuation routes (NOT the lifts) - 10 mins"),
+    ])
+    index_project_content(2, "bob", "Fire Safety Induction", [("storyboard", 0, "Extinguishers", "Bob's copy")])
+    return db_manager.DB_FILE
+
+
+@pytest.mark.parametrize("text, query", [
+    ("fire safety", '"fire" "safety"*'),
+    ('say "hi"', '"say" """hi"""*'),
+    ("AND OR NOT", '"AND" "OR" "NOT"*'),
+    ("col:value -x (a*)", '"col:value" "-x" "(a*)"*'),
+    ("  ", None),
+    ("", None),
+])
+def test_fts_query(text, query):
+    assert fts_query(text) == query
+
+
+@pytest.mark.parametrize("text", ['"', '"PASS', "AND", "NOT lifts", "lifts)", "squeeze AND", "*", "NEAR(a b)", "body:"])
+def test_operators_and_quotes_are_valid_queries(db, text):
+    # Every query either matches or finds nothing; none is an FTS5 syntax error
+    with sqlite3.connect(db) as conn:
+        conn.execute("SELECT * FROM content_index WHERE content_index MATCH ?", (fts_query(text),)).fetchall()
+
+
+def test_search_matches_words_literally_and_by_prefix(db):
+    assert [r["position"] for r in search_content("alice", "NOT lifts")] == [1]
+    assert [r["section"] for r in search_content("alice", '"PASS" squ')] == ["Extinguishers"]
+    assert "**" in search_content("alice", "sweep")[0]["snippet"]
+    assert search_content("alice", "sweep mop") == []
+
+
+def test_search_is_scoped_to_the_user(db):
+    assert [r["project_id"] for r in search_content("bob", "fire")] == [2]
+    assert search_content("carol", "fire") == []
+
+
+def test_search_question_bank(db):
+    question = {"stem": "Which extinguisher suits electrical fires?", "options": ["CO2", "Water"], "answer": "CO2",
+                "feedback": "Water conducts electricity.", "difficulty": "Easy"}
+    save_bank_questions("alice", "Extinguishers", "extinguishers", [question], "gpt-4o-mini")
+    assert [q["stem"] for q in search_question_bank("alice", "electric")] == [question["stem"]]
+    assert search_question_bank("alice", "(CO2 OR") == []
+    assert search_question_bank("bob", "electric") == []
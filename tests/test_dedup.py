@@ -0,0 +1,38 @@
+from src.dedup import NearDuplicateFilter, split_blocks
+
+PARAGRAPH = ("Fire extinguishers must be inspected every month by a trained member of staff, "
+             "and the date of each inspection is written on the tag attached to the handle.")
+OTHER = ("New starters complete the online induction during their first week and meet their "
+         "line manager to agree objectives for the probation period.")
+
+
+def test_split_blocks_joins_back_to_the_text():
+    text = f"Heading\n\n{PARAGRAPH}\n\n{OTHER} " * 3
+    assert "".join(split_blocks(text)) == text
+
+
+def test_near_duplicate_in_another_file_is_dropped():
+    dedup = NearDuplicateFilter()
+    first = dedup("a.pdf", "page 1", f"{PARAGRAPH}\n\n{OTHER}")
+    assert first == f"{PARAGRAPH}\n\n{OTHER}"
+    # The same paragraph with different punctuation and case still counts as a copy
+    second = dedup("b.docx", "paragraph 4", PARAGRAPH.upper().replace(",", ""))
+    assert second == ""
+    assert dedup.removed_blocks == 1
+    assert dedup.removed_tokens > 0
+    assert dedup.report()["matches"] == [("b.docx", "paragraph 4", "a.pdf", "page 1")]
+
+
+def test_repeats_within_one_file_and_short_blocks_are_kept():
+    dedup = NearDuplicateFilter()
+    dedup("a.pdf", "page 1", f"Summary\n\n{PARAGRAPH}")
+    assert dedup("a.pdf", "page 2", PARAGRAPH) == PARAGRAPH
+    assert dedup("b.pdf", "page 1", "Summary") == "Summary"
+    assert dedup.removed_blocks == 0
+
+
+def test_different_text_is_kept():
+    dedup = NearDuplicateFilter()
+    dedup("a.pdf", "page 1", PARAGRAPH)
+    assert dedup("b.pdf", "page 1", OTHER) == OTHER
+    assert dedup.report()["matches"] == []
@@ -0,0 +1,47 @@
+from src import llm_cache
+from src.llm_cache import ResponseCache, make_cache_key
+
+
+def test_cache_key_depends_on_every_field():
+    key = make_cache_key("gpt-4o", "system", "prompt", 100, 1)
+    assert key == make_cache_key("gpt-4o", "system", "prompt", 100, 1)
+    assert key != make_cache_key("gpt-4o", "system", "prompt", 200, 1)
+    assert key != make_cache_key("gpt-4o", "system", "prompt", 100, 1, {"type": "json_object"})
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = ResponseCache(db_file=str(tmp_path / "cache.db"))
+    assert cache.get("missing") is None
+    cache.set("key", "gpt-4o", ["one", "two"])
+    assert cache.get("key") == ["one", "two"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_expired_entries_are_misses(tmp_path, monkeypatch):
+    cache = ResponseCache(db_file=str(tmp_path / "cache.db"), ttl_seconds=60)
+    now = 1_000_000.0
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now)
+    cache.set("key", "gpt-4o", ["answer"])
+    now += 59
+    assert cache.get("key") == ["answer"]
+    now += 2
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    # Each entry is 12 bytes (["xxxxxxxx"]), so the budget holds two of them
+    cache = ResponseCache(db_file=str(tmp_path / "cache.db"), ttl_seconds=0, max_bytes=30)
+    now = 1_000_000.0
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now)
+    for key in ("a", "b"):
+        now += 1
+        cache.set(key, "gpt-4o", [key * 8])
+    now += 1
+    assert cache.get("a") == ["a" * 8]  # "b" is now the least recently used
+    now += 1
+    cache.set("c", "gpt-4o", ["c" * 8])
+    assert cache.get("b") is None
+    assert cache.get("a") == ["a" * 8]
+    assert cache.get("c") == ["c" * 8]
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from src.schemas import ASSESSMENT, OUTLINE, STORYBOARD, AssessmentQuestion, RowStreamParser, StoryboardRow, parse_rows
+
+ROWS = [
+    {"onscreen_text": 'Say "hello" {to} the [team]', "voice_over_script": "Back\\slash \\\" and }] inside",
+         "visualization_guidelines": "Line one\nLine two\ttab ✓"},
+    {"onscreen_text": "{\"rows\": [not a row]}", "voice_over_script": "", "visualization_guidelines": "\\"},
+    {"onscreen_text": "Plain", "voice_over_script": "Text", "visualization_guidelines": "Only"},
+]
+EXPECTED = [StoryboardRow(*(row[name].strip() for name in STORYBOARD.fields)) for row in ROWS]
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_chunked_rows_with_escapes_and_braces(size):
+    text = json.dumps({"rows": ROWS})
+    parser = RowStreamParser(STORYBOARD)
+    streamed = []
+    for chunk in chunks(text, size):
+        streamed.extend(parser.feed(chunk))
+    assert streamed == EXPECTED
+    assert parser.rows == EXPECTED
+
+
+def test_rows_arrive_as_soon_as_they_close():
+    text = json.dumps({"rows": ROWS})
+    first_end = text.index(json.dumps(ROWS[0])) + len(json.dumps(ROWS[0]))
+    parser = RowStreamParser(STORYBOARD)
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == EXPECTED[:1]
+
+
+def test_truncated_response_keeps_complete_rows():
+    text = json.dumps(ROWS)  # A bare array is accepted too
+    cut = text.index('"Plain"')
+    assert parse_rows(text[:cut], STORYBOARD) == EXPECTED[:2]
+
+
+def test_list_fields_and_missing_values():
+    text = '```json\n{"rows": [{"question": "Q?", "options": ["a", "b"], "correct_option": "a", "feedback": null}]}\n```'
+    assert parse_rows(text, ASSESSMENT) == [AssessmentQuestion("Q?", ["a", "b"], "a", "", "")]
+
+
+def test_pipe_table_fallback():
+    text = "| Outline | Duration (in mins) |\n|---|---|\n| Introduction | 5 |\n| Fire safety | 10 |"
+    assert [(row.section, row.duration_minutes) for row in parse_rows(text, OUTLINE)] == [
+        ("Introduction", "5"), ("Fire safety", "10")
+    ]
@@ -0,0 +1,38 @@
+import pytest
+
+from src.storyboard_sections import allocate_knowledge_checks, duration_weights, parse_minutes, split_by_weight
+
+
+@pytest.mark.parametrize("text, minutes", [("10", 10.0), ("5-7", 7.0), ("1.5 mins", 1.5), ("", None), (None, None)])
+def test_parse_minutes(text, minutes):
+    assert parse_minutes(text) == minutes
+
+
+def test_missing_durations_count_as_the_average():
+    assert duration_weights([10, None, 20]) == [10, 15, 20]
+    assert duration_weights([None, None]) == [1.0, 1.0]
+
+
+@pytest.mark.parametrize("total, weights, counts", [
+    (10, [1, 1], [5, 5]),
+    (10, [1, 2, 2], [2, 4, 4]),
+    (5, [1, 1, 1], [2, 2, 1]),
+    (7, [0.5, 3, 1], [1, 5, 1]),
+    (0, [3, 4], [0, 0]),
+    (4, [], []),
+])
+def test_split_by_weight(total, weights, counts):
+    assert split_by_weight(total, weights) == counts
+
+
+def test_split_by_weight_always_sums_to_the_total():
+    weights = [3, 7, 1, 9, 4, 2]
+    for total in range(30):
+        assert sum(split_by_weight(total, weights)) == total
+
+
+def test_knowledge_checks_follow_course_length():
+    assert allocate_knowledge_checks([10, 20, 30], minutes_per_check=10) == [1, 2, 3]
+    # Without durations, about one check per three sections
+    assert sum(allocate_knowledge_checks([None] * 6)) == 2
+    assert sum(allocate_knowledge_checks([None])) == 1
@@ -0,0 +1,35 @@
+from src.text_normalizer import TextNormalizer, clean_whitespace
+
+
+def page(number, body):
+    return f"page {number}", f"ACME Safety Manual\n{body}\nChapter {number} | Fire safety\n{number} of 4"
+
+
+def test_running_headers_footers_and_page_numbers_are_removed():
+    normalizer = TextNormalizer()
+    bodies = [f"Exits on the {floor} floor.\nAssembly point {floor}.\nWardens on the {floor} floor."
+              for floor in ("first", "second", "third", "fourth")]
+    normalized = normalizer([page(n, body) for n, body in enumerate(bodies, 1)])
+    assert normalized == [(f"page {n}", body) for n, body in enumerate(bodies, 1)]
+    assert normalizer.removed_lines == 12
+    assert normalizer.saved_tokens > 0
+    assert "ACME Safety Manual" in normalizer.report()["boilerplate"]
+
+
+def test_short_documents_keep_repeated_lines():
+    normalizer = TextNormalizer()
+    pieces = [page(n, "Body.") for n in range(1, 3)]
+    normalized = normalizer(pieces)
+    # Only the bare page numbers go; two pages are too few to call anything boilerplate
+    assert [text for _, text in normalized] == [f"ACME Safety Manual\nBody.\nChapter {n} | Fire safety" for n in (1, 2)]
+
+
+def test_sheets_are_left_alone():
+    normalizer = TextNormalizer()
+    sheet = ("sheet Budget", "Item | Cost\n1 | 2")
+    assert normalizer([sheet]) == [sheet]
+    assert normalizer.removed_lines == 0
+
+
+def test_clean_whitespace():
+    assert clean_whitespace("extin-\nguisher  is\t red   \n\n\n\nNext") == "extinguisher is red\n\nNext"